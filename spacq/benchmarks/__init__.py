@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for the acquisition hot paths, using mock devices.
+
+Run them with:
+	python -m spacq.benchmarks [--output results.json] [--baseline baseline.json] [name ...]
+"""
@@ -0,0 +1,53 @@
+from argparse import ArgumentParser
+import sys
+
+from . import hot_paths, runner
+
+"""
+Run the benchmarks from the command line.
+"""
+
+
+def main(args=None):
+	parser = ArgumentParser(description='Run the acquisition benchmarks.')
+	parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+	parser.add_argument('--scale', type=float, default=1.0, help='factor for the amount of work done')
+	parser.add_argument('--repeat', type=int, default=3, help='number of runs of each benchmark')
+	parser.add_argument('--output', help='file to which to write the results as JSON')
+	parser.add_argument('--baseline', help='file of earlier results to compare against')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='fraction by which a rate may drop')
+	args = parser.parse_args(args)
+
+	names = args.names or list(runner.benchmarks)
+	unknown = [name for name in names if name not in runner.benchmarks]
+	if unknown:
+		parser.error('Unknown benchmarks: {0}'.format(', '.join(unknown)))
+
+	results = []
+	for name in names:
+		result = runner.run(name, args.scale, args.repeat)
+		results.append(result)
+
+		print '{0:<24} {1:>14.1f} {2}/s'.format(name, runner.rate(result), result.unit)
+
+	if args.output is not None:
+		with open(args.output, 'w') as f:
+			runner.save(results, f)
+
+	if args.baseline is not None:
+		with open(args.baseline) as f:
+			baseline = runner.load(f)
+
+		regressed = False
+		for name, ratio, slower in runner.compare(results, baseline, args.tolerance):
+			print '{0:<24} {1:>7.2f}x{2}'.format(name, ratio, ' REGRESSED' if slower else '')
+			regressed = regressed or slower
+
+		if regressed:
+			return 1
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,232 @@
+from cStringIO import StringIO
+import csv
+from numpy import linspace, repeat, sin, tile
+import quantities as pq
+
+from spacq.devices.agilent.dm34410a import DM34410A
+from spacq.devices.agilent.mock.mock_dm34410a import MockDM34410A
+from spacq.devices.mock.fake_instrument import SocketInstrumentServer
+from spacq.devices.tektronix.mock.mock_awg5014b import MockAWG5014B
+from spacq.devices.tools import BlockData
+from spacq.interface.pulse.program import Program
+from spacq.interface.resources import Resource
+from spacq.interface.units import Quantity
+from spacq.interface.waveform import Generator
+from spacq.iteration.sweep import SweepController
+from spacq.iteration.variables import sort_output_variables, LinSpaceConfig, OutputVariable
+from spacq.tool.box import triples_to_mesh
+
+from .runner import benchmark
+
+"""
+Benchmarks for the paths taken for every point of an acquisition.
+"""
+
+
+@benchmark('quantities', 20000)
+def quantity_construction(count):
+	strings = ['{0} mV'.format(x) for x in xrange(count)]
+
+	def timed():
+		for string in strings:
+			Quantity(string)
+
+	return count, timed
+
+@benchmark('operations', 50000)
+def quantity_arithmetic(count):
+	a, b = Quantity(1.0, 'V'), Quantity(2.0, 'mV')
+
+	def timed():
+		for _ in xrange(count // 4):
+			c = (a + b) * 2.0 - a
+			c < a
+
+	return count // 4 * 4, timed
+
+@benchmark('operations', 5000)
+def pq_arithmetic(count):
+	"""
+	The same as quantity_arithmetic, with quantities from the quantities package, for comparison.
+	"""
+
+	a, b = pq.Quantity(1.0, 'V'), pq.Quantity(2.0, 'mV')
+
+	def timed():
+		for _ in xrange(count // 4):
+			c = (a + b) * 2.0 - a
+			c < a
+
+	return count // 4 * 4, timed
+
+@benchmark('quantities', 5000)
+def unit_parsing(count):
+	"""
+	Create quantities by parsing their units every time, for comparison with quantity_construction.
+	"""
+
+	strings = ['{0} mV'.format(x) for x in xrange(count)]
+
+	def timed():
+		for string in strings:
+			value, symbols = Quantity.from_string(string)
+			units, multiplier = Quantity.parse_units(symbols)
+			pq.Quantity(value * 10 ** multiplier, units).simplified
+
+	return count, timed
+
+@benchmark('assertions', 50000)
+def dimension_assertion(count):
+	qs = [Quantity(x, 'mV') for x in xrange(count)]
+
+	def timed():
+		for q in qs:
+			q.assert_dimensions('V')
+
+	return count, timed
+
+@benchmark('accesses', 2000)
+def resource_value(count):
+	"""
+	Alternately read and write resources of a mock multimeter.
+	"""
+
+	dev = MockDM34410A()
+	reading, integration_time = dev.resources['reading'], dev.resources['integration_time']
+	values = sorted(dev.allowed_nplc)
+
+	def timed():
+		for i in xrange(count // 2):
+			reading.value
+			integration_time.value = values[i % len(values)]
+
+	return count // 2 * 2, timed
+
+@benchmark('accesses', 1000)
+def socket_resource_value(count):
+	"""
+	Read a multimeter through the socket driver, from a local fake instrument.
+
+	Connecting and serving are included in the time.
+	"""
+
+	with SocketInstrumentServer(MockDM34410A()) as fake:
+		dev = DM34410A(socket_address=fake.address, socket_port=fake.port)
+		reading = dev.resources['reading']
+
+		for _ in xrange(count):
+			reading.value
+
+		dev.close()
+
+	return count
+
+@benchmark('points', 2000)
+def sweep_points(count, resources=4):
+	"""
+	Sweep several resources together, with nothing to wait for.
+	"""
+
+	buf = []
+	res = Resource(setter=buf.append)
+
+	variables = []
+	for i in xrange(resources):
+		var = OutputVariable(name='Var {0}'.format(i), order=1, wait='0 s', enabled=True)
+		var.config = LinSpaceConfig(0.0, 1.0, count)
+		variables.append(var)
+
+	vars, num_items = sort_output_variables(variables)
+	ctrl = SweepController([tuple(('Res {0}'.format(i), res) for i in xrange(resources))], vars, num_items, [], [])
+
+	return count, ctrl.run
+
+def pulse_train(count):
+	"""
+	Generate a waveform of square pulses of about count points.
+	"""
+
+	times = max(1, count // 200)
+
+	prog = Program.from_string("""
+		delay spacing = 100 ns
+		pulse bump = {{shape: 'square', amplitude: 0.5 V, length: 99 ns}}
+		output f1
+
+		times {0} {{
+			bump:f1
+			spacing
+		}}
+	""".format(times))
+	prog.frequency = Quantity(1, 'GHz')
+
+	def timed():
+		# Nothing may be reused from previous runs.
+		prog._env.segments = {}
+		prog.generate_waveforms()
+
+	return times * 200, timed
+
+@benchmark('points', 1000000)
+def waveform_generation(count):
+	return pulse_train(count)
+
+@benchmark('points', 10000000)
+def long_waveform(count):
+	"""
+	Generate a waveform of up to the maximum length, growing the buffer many times.
+	"""
+
+	return pulse_train(min(count, Generator.max_length))
+
+@benchmark('points', 1000000)
+def awg_packing(count):
+	awg = MockAWG5014B()
+	data = sin(linspace(0, 100, count))
+	markers = {1: tile([False, True], count // 2 + 1)[:count], 2: repeat([True], count)}
+
+	def timed():
+		awg.create_waveform('Benchmark', data, markers)
+
+	return count, timed
+
+@benchmark('bytes', 10000000)
+def block_data(count):
+	payload = ''.join(chr(x % 256) for x in xrange(256)) * (count // 256 + 1)
+	payload = payload[:count]
+
+	def timed():
+		assert BlockData.from_block_data(BlockData.to_block_data(payload)) == payload
+
+	return count, timed
+
+@benchmark('points', 2500)
+def mesh(count):
+	side = max(4, int(count ** 0.5))
+	x = repeat(linspace(0, 1, side), side)
+	y = tile(linspace(0, 1, side), side)
+	z = sin(x * 3) * y
+
+	def timed():
+		triples_to_mesh(x, y, z)
+
+	return side * side, timed
+
+@benchmark('rows', 20000)
+def csv_export(count):
+	"""
+	Write rows as a data capture would, extracting values from quantities.
+	"""
+
+	rows = [(i * 0.1, [Quantity(i, 'mV'), i], [Quantity(-i, 'A')]) for i in xrange(count)]
+
+	def timed():
+		export_csv = csv.writer(StringIO())
+
+		for cur_time, values, measurement_values in rows:
+			values = [x.original_value if hasattr(x, 'original_value') else x for x in values]
+			measurement_values = [x.original_value if hasattr(x, 'original_value') else x for x in measurement_values]
+
+			export_csv.writerow([cur_time] + values + measurement_values)
+
+	return count, timed
@@ -0,0 +1,112 @@
+from collections import namedtuple, OrderedDict
+from functools import wraps
+import json
+from time import time
+
+"""
+Running benchmarks, and comparing their results.
+"""
+
+
+# The outcome of a benchmark: how many operations were timed, and how long the fastest and average runs took.
+Result = namedtuple('Result', 'name, unit, count, best, mean')
+
+# Benchmarks by name, in the order they were defined.
+benchmarks = OrderedDict()
+
+
+def benchmark(unit, size):
+	"""
+	A decorator to register a benchmark function.
+
+	The function is given a scale factor, and performs and returns a number of operations of roughly size times the
+	scale. It may return a pair of the number of operations and a function to time instead, so that any setup is not
+	included in the timing.
+	"""
+
+	def wrap(f):
+		@wraps(f)
+		def wrapped(scale=1.0):
+			return f(max(1, int(size * scale)))
+
+		wrapped.unit = unit
+		benchmarks[f.__name__] = wrapped
+
+		return wrapped
+
+	return wrap
+
+
+def run(name, scale=1.0, repeat=3):
+	"""
+	Run a benchmark several times, and produce a Result.
+	"""
+
+	f = benchmarks[name]
+	times = []
+
+	for _ in xrange(repeat):
+		start_time = time()
+		prepared = f(scale)
+
+		if isinstance(prepared, tuple):
+			count, timed = prepared
+
+			start_time = time()
+			timed()
+		else:
+			count = prepared
+
+		times.append(time() - start_time)
+
+	return Result(name, f.unit, count, min(times), sum(times) / len(times))
+
+
+def rate(result):
+	"""
+	Operations per second in the best run.
+	"""
+
+	if result.best <= 0:
+		return float('inf')
+
+	return result.count / result.best
+
+
+def save(results, f):
+	"""
+	Write results to a file as JSON.
+	"""
+
+	json.dump(OrderedDict((result.name, OrderedDict(result._asdict())) for result in results), f, indent=1)
+
+
+def load(f):
+	"""
+	Read results written by save.
+	"""
+
+	return [Result(**values) for values in json.load(f, object_pairs_hook=OrderedDict).values()]
+
+
+def compare(results, baseline, tolerance=0.2):
+	"""
+	Compare results against baseline results for the same benchmarks.
+
+	Returns a list of names, ratios of rates (result to baseline), and whether the rate dropped by more than the
+	tolerance fraction. Benchmarks missing from the baseline are skipped.
+	"""
+
+	baseline = dict((result.name, result) for result in baseline)
+	comparison = []
+
+	for result in results:
+		try:
+			old = baseline[result.name]
+		except KeyError:
+			continue
+
+		ratio = rate(result) / rate(old)
+		comparison.append((result.name, ratio, ratio < 1 - tolerance))
+
+	return comparison
@@ -0,0 +1,45 @@
+from cStringIO import StringIO
+from nose.tools import eq_
+from unittest import main, TestCase
+
+from .. import hot_paths, runner
+
+
+class RunnerTest(TestCase):
+	def testRunAll(self):
+		"""
+		Every benchmark runs on a small scale.
+		"""
+
+		for name in runner.benchmarks:
+			result = runner.run(name, scale=0.01, repeat=1)
+
+			eq_(result.name, name)
+			assert result.count > 0
+			assert result.best >= 0
+
+	def testCompare(self):
+		"""
+		Save results, and compare them against a baseline.
+		"""
+
+		baseline = [
+			runner.Result('a', 'points', 100, 1.0, 1.5),
+			runner.Result('b', 'points', 100, 1.0, 1.5),
+		]
+
+		f = StringIO()
+		runner.save(baseline, f)
+		eq_(runner.load(StringIO(f.getvalue())), baseline)
+
+		results = [
+			runner.Result('a', 'points', 200, 1.0, 1.0),
+			runner.Result('b', 'points', 100, 2.0, 2.0),
+			runner.Result('c', 'points', 100, 1.0, 1.0),
+		]
+
+		eq_(runner.compare(results, baseline), [('a', 2.0, False), ('b', 0.5, True)])
+
+
+if __name__ == '__main__':
+	main()
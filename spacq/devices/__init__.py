@@ -1,2 +1,12 @@
-from . import agilent, iqc, oxford, rohde_schwarz, tektronix, keithley, cryomagnetics, lakeshore, stanford_research_systems, basel, pynq
-manufacturers = [agilent, iqc, oxford, rohde_schwarz, tektronix, keithley, cryomagnetics, lakeshore, stanford_research_systems, basel, pynq]
+from importlib import import_module
+
+# Manufacturer packages, which import all their models, so are only imported when needed.
+manufacturer_names = ['agilent', 'iqc', 'oxford', 'rohde_schwarz', 'tektronix', 'keithley', 'cryomagnetics',
+		'lakeshore', 'stanford_research_systems', 'basel', 'pynq']
+
+def load_manufacturers():
+	"""
+	Import all the manufacturer packages.
+	"""
+
+	return [import_module('.' + name, __name__) for name in manufacturer_names]
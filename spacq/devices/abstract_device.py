@@ -1,7 +1,12 @@
+from importlib import import_module
 from packaging import version
-from spacq.tool.box import Enum, Synchronized
+import socket
+from spacq.tool.box import Enum, LazyModule, Synchronized
 from time import time
 from threading import RLock
+
+from .tools import BlockData, BlockDataError, ResourceCache
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -11,48 +16,73 @@ Hardware device abstraction interface.
 """
 
 
-# PyVISA, Linux GPIB, PyVISA USB, telnet, HTTP requests.
-drivers = Enum(['pyvisa', 'lgpib', 'pyvisa_usb', 'telnet', 'requests'])
+# PyVISA, Linux GPIB, PyVISA USB, telnet, HTTP requests, raw SCPI socket.
+drivers = Enum(['pyvisa', 'lgpib', 'pyvisa_usb', 'telnet', 'requests', 'socket'])
 
 
-# Try to import all available drivers.
-available_drivers = []
+# Driver modules.
+Gpib = LazyModule('Gpib')
+gpib = LazyModule('gpib')
+pyvisa = LazyModule('pyvisa')
+requests = LazyModule('requests')
+telnetlib = LazyModule('telnetlib')
 
-try:
-    import Gpib
-    import gpib
-except ImportError:
-    pass
-else:
-    available_drivers.append(drivers.lgpib)
 
-try:
-    import telnetlib
-    import socket
-except ImportError:
-    pass
-else:
-    available_drivers.append(drivers.telnet)
+class AvailableDrivers(object):
+    """
+    The drivers which can be used, each probed the first time it is asked about.
+    """
 
-try:
-    import requests
-except ImportError:
-    pass
-else:
-    available_drivers.append(drivers.requests)
+    # The modules each driver requires.
+    requirements = {
+        drivers.lgpib: ['Gpib', 'gpib'],
+        drivers.telnet: ['telnetlib', 'socket'],
+        drivers.socket: ['socket'],
+        drivers.requests: ['requests'],
+        drivers.pyvisa: ['pyvisa'],
+        drivers.pyvisa_usb: ['pyvisa'],
+    }
+
+    def __init__(self):
+        self.lock = RLock()
+
+        # Drivers and whether they are available.
+        self.probed = {}
+
+    def __contains__(self, driver):
+        with self.lock:
+            try:
+                return self.probed[driver]
+            except KeyError:
+                pass
+
+            try:
+                for name in self.requirements[driver]:
+                    import_module(name)
+            except ImportError:
+                result = False
+            else:
+                result = True
+
+            self.probed[driver] = result
+
+            return result
+
+    def __iter__(self):
+        return (driver for driver in sorted(drivers) if driver in self)
+
+available_drivers = AvailableDrivers()
+
+
+def is_legacy_visa():
+    """
+    Whether the available PyVISA is older than 1.5.
+    """
 
-try:
-    import pyvisa
     try:
-        legacyVisa = version.parse(pyvisa.__version__) < version.parse('1.5')
+        return version.parse(pyvisa.__version__) < version.parse('1.5')
     except:
-        legacyVisa = 1  # Some of the mutilated/old visas don't have __version__, but they are all legacy
-
-except ImportError:
-    pass
-else:
-    available_drivers.append(drivers.pyvisa)
-    available_drivers.append(drivers.pyvisa_usb)
+        return True  # Some of the mutilated/old visas don't have __version__, but they are all legacy
 
 
 class DeviceNotFoundError(Exception):
@@ -140,6 +170,10 @@ class AbstractDevice(SuperDevice):
 
     max_timeout = 15  # s
 
+    # Raw SCPI sockets.
+    socket_timeout = 2  # s
+    socket_chunk_size = 65536  # bytes
+
     def _setup(self):
         self.multi_command = None
         self.responses_expected = 0
@@ -148,10 +182,18 @@ class AbstractDevice(SuperDevice):
 
         self.lock = RLock()
 
+        # Values of slow properties, shared with all subdevices.
+        self.cache = ResourceCache()
+
         self.status = []
 
+        # Bytes received over a raw socket but not yet consumed.
+        self._socket_pending = ''
+        # Whether a newline following block data has yet to be consumed.
+        self._socket_block_ended = False
+
     def __init__(self, ip_address=None, host_address=None, request_address=None, gpib_board=0, gpib_pad=None, gpib_sad=0,
-                 usb_resource=None, autoconnect=True):
+                 usb_resource=None, socket_address=None, socket_port=5025, autoconnect=True):
         """
         Ethernet (tcpip::<ip_address>::instr):
                 ip_address: Address on which the device is listening on port 111.
@@ -172,6 +214,10 @@ class AbstractDevice(SuperDevice):
         USB (usb_resource):
                 usb_resource: VISA resource of the form: USB[board]::<vendor>::<product>::<serial>[::<interface>]::RAW
 
+        Raw SCPI socket (<socket_address>:<socket_port>):
+                socket_address: IP address or host name of the device.
+                socket_port: TCP port on which the device accepts raw SCPI. Defaults to 5025.
+
         autoconnect: Connect to the device upon instantiation.
         """
         self._setup()
@@ -246,9 +292,20 @@ class AbstractDevice(SuperDevice):
             else:
                 raise NotImplementedError(
                     'PyVISA required, but not available.')
+        elif socket_address is not None:
+            if drivers.socket in available_drivers:
+                log.debug('Using raw socket with socket_address="{0}", socket_port="{1}".'.format(
+                    socket_address, socket_port))
+                self.driver = drivers.socket
+                self.connection_resource = {
+                    'address': (socket_address, int(socket_port)),
+                }
+            else:
+                raise NotImplementedError(
+                    'socket required, but not available.')
         else:
             raise ValueError(
-                'Either an IP, Host Address, Request Address, GPIB, or USB address must be specified.')
+                'Either an IP, Host Address, Request Address, GPIB, USB, or socket address must be specified.')
         if autoconnect:
             self.connect()
 
@@ -265,7 +322,7 @@ class AbstractDevice(SuperDevice):
 
         if self.driver == drivers.pyvisa:
             try:
-                if not (legacyVisa):
+                if not is_legacy_visa():
                     rm = pyvisa.ResourceManager()
                     self.device = rm.open_resource(**self.connection_resource)
                 else:
@@ -277,6 +334,18 @@ class AbstractDevice(SuperDevice):
         elif self.driver == drivers.telnet:
             self.device = telnetlib.Telnet(
                 timeout=2, **self.connection_resource)
+        elif self.driver == drivers.socket:
+            try:
+                self.device = socket.create_connection(
+                    timeout=self.socket_timeout, **self.connection_resource)
+            except socket.error as e:
+                raise DeviceNotFoundError(
+                    'Could not open device at "{0}".'.format(self.connection_resource), e)
+
+            # Commands are short and latency matters more than throughput for them.
+            self.device.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket_pending = ''
+            self._socket_block_ended = False
         elif self.driver == drivers.requests:
             r = requests.get(self.request_address)
             if r.status_code != 200:
@@ -291,7 +360,7 @@ class AbstractDevice(SuperDevice):
                     'Could not open device at "{0}".'.format(self.connection_resource), e)
         elif self.driver == drivers.pyvisa_usb:
             try:
-                if not (legacyVisa):
+                if not is_legacy_visa():
                     rm = pyvisa.ResourceManager()
                     self.device = rm.open_resource(**self.connection_resource)
                 else:
@@ -325,7 +394,7 @@ class AbstractDevice(SuperDevice):
         log.debug(
             'Starting multi-command message for device "{0}"'.format(self.name))
 
-        if self.driver not in [drivers.pyvisa, drivers.lgpib]:
+        if self.driver not in [drivers.pyvisa, drivers.lgpib, drivers.socket]:
             raise NotImplementedError(
                 'Unsupported driver: "{0}".'.format(self.driver))
 
@@ -403,6 +472,12 @@ class AbstractDevice(SuperDevice):
                 else:
                     raise
 
+        elif self.driver == drivers.socket:
+            try:
+                self.device.sendall(message + '\n')
+            except socket.timeout as e:
+                raise DeviceTimeout(e)
+
         elif self.driver == drivers.requests:
             r = requests.get(self.request_address + message)
             if r.status_code != 200:
@@ -419,7 +494,7 @@ class AbstractDevice(SuperDevice):
 
         elif self.driver == drivers.pyvisa_usb:
             # Send the message raw.
-            if not (legacyVisa):
+            if not is_legacy_visa():
                 self.device.write_raw(message)
             else:
                 pyvisa.vpp43.write(self.device.vi, message)
@@ -427,6 +502,29 @@ class AbstractDevice(SuperDevice):
         else:
             print("Passed without writing")
 
+    @Synchronized()
+    def write_block(self, message, data):
+        """
+        Write a message followed by data (a byte string or a buffer such as a NumPy array) as 488.2 block data.
+
+        Over a raw socket, the payload is sent straight from the buffer.
+        """
+
+        header, payload = BlockData.to_block_data_parts(data)
+
+        if self.driver == drivers.socket and self.multi_command is None:
+            log.debug('Writing {0} bytes of block data to device "{1}": {2!r}'.format(len(payload), self.name,
+                message))
+
+            try:
+                self.device.sendall(message + header)
+                self.device.sendall(payload)
+                self.device.sendall('\n')
+            except socket.timeout as e:
+                raise DeviceTimeout(e)
+        else:
+            self.write(message + header + payload.tobytes())
+
     @Synchronized()
     def read_raw(self, chunk_size=512):
         """
@@ -451,6 +549,20 @@ class AbstractDevice(SuperDevice):
                     raise DeviceTimeout(e)
                 else:
                     raise
+        elif self.driver == drivers.socket:
+            if self._socket_peek() == '#':
+                # Binary block data may contain newlines, so it must be read by length.
+                header, length = self._socket_read_block_header()
+
+                if length is None:
+                    buf = header + self._socket_read_line()
+                else:
+                    payload = bytearray(length)
+                    self._socket_recv_into(memoryview(payload))
+                    buf = header + str(payload)
+            else:
+                buf = self._socket_read_line()
+
         elif self.driver == drivers.requests:
             buf = requests.get(self.request_address)
 
@@ -478,6 +590,103 @@ class AbstractDevice(SuperDevice):
 
         return self.read_raw().rstrip()
 
+    @Synchronized()
+    def read_block_into(self, buf):
+        """
+        Read 488.2 block data from the device straight into a writable buffer (eg. a bytearray or NumPy array).
+
+        Returns the number of payload bytes written.
+        """
+
+        view = memoryview(buf)
+        if view.itemsize != 1 or view.ndim != 1:
+            # Address the buffer byte by byte.
+            view = memoryview(buf.view('uint8').reshape(-1))
+
+        if self.driver == drivers.socket:
+            header, length = self._socket_read_block_header()
+
+            if length is None:
+                # Indefinite format; the length is not known up front.
+                data = self._socket_read_line()[:-1]
+            else:
+                if length > len(view):
+                    raise BlockDataError('Buffer of {0} bytes too small for {1} bytes of data.'.format(
+                        len(view), length))
+
+                self._socket_recv_into(view[:length])
+
+                log.debug('Read {0} bytes of block data from device "{1}".'.format(length, self.name))
+
+                return length
+        else:
+            raw = self.read_raw()
+            data_start, data_end = BlockData.payload_bounds(raw)
+            # Avoid slicing the payload out of the response before copying it into place.
+            data = memoryview(raw)[data_start:data_end]
+
+        length = len(data)
+        if length > len(view):
+            raise BlockDataError('Buffer of {0} bytes too small for {1} bytes of data.'.format(
+                len(view), length))
+
+        view[:length] = data
+
+        return length
+
+    @Synchronized()
+    def read_blocks_into(self, bufs):
+        """
+        Like read_block_into, but for a response made up of several blocks separated by semicolons, each of
+        which is read into the corresponding buffer.
+
+        Returns the number of payload bytes written to each buffer.
+        """
+
+        if self.driver == drivers.socket:
+            return [self.read_block_into(buf) for buf in bufs]
+
+        raw = self.read_raw()
+        bounds = BlockData.payloads_bounds(raw)
+
+        if len(bounds) != len(bufs):
+            raise BlockDataError('Expected {0} blocks, but received {1}.'.format(len(bufs), len(bounds)))
+
+        result = []
+        for buf, (data_start, data_end) in zip(bufs, bounds):
+            view = memoryview(buf)
+            if view.itemsize != 1 or view.ndim != 1:
+                view = memoryview(buf.view('uint8').reshape(-1))
+
+            length = data_end - data_start
+            if length > len(view):
+                raise BlockDataError('Buffer of {0} bytes too small for {1} bytes of data.'.format(
+                    len(view), length))
+
+            view[:length] = memoryview(raw)[data_start:data_end]
+            result.append(length)
+
+        return result
+
+    @Synchronized()
+    def read_block(self):
+        """
+        Read 488.2 block data from the device, returning only the payload.
+        """
+
+        if self.driver == drivers.socket:
+            header, length = self._socket_read_block_header()
+
+            if length is None:
+                return self._socket_read_line()[:-1]
+
+            payload = bytearray(length)
+            self._socket_recv_into(memoryview(payload))
+
+            return str(payload)
+        else:
+            return BlockData.from_block_data(self.read_raw())
+
     @Synchronized()
     def ask_raw(self, message):
         """
@@ -512,6 +721,133 @@ class AbstractDevice(SuperDevice):
         """
         return self.device.query(message)
 
+    def _socket_recv(self, size):
+        """
+        Receive up to size bytes, starting with any pending ones.
+        """
+
+        if self._socket_pending:
+            result = self._socket_pending[:size]
+            self._socket_pending = self._socket_pending[size:]
+
+            return result
+
+        try:
+            result = self.device.recv(size)
+        except socket.timeout as e:
+            raise DeviceTimeout(e)
+
+        if not result:
+            raise DeviceNotFoundError('Connection closed by device at "{0}".'.format(self.connection_resource))
+
+        return result
+
+    def _socket_peek(self):
+        """
+        Look at the next byte of a response without consuming it.
+        """
+
+        if not self._socket_pending:
+            self._socket_pending = self._socket_recv(self.socket_chunk_size)
+
+        if self._socket_block_ended:
+            self._socket_block_ended = False
+
+            # Skip the newline which terminated the previous block, or the separator before the next one.
+            if self._socket_pending[0] in ['\n', ';']:
+                self._socket_pending = self._socket_pending[1:]
+
+                return self._socket_peek()
+
+        return self._socket_pending[0]
+
+    def _socket_read_exactly(self, size):
+        """
+        Receive exactly size bytes.
+        """
+
+        chunks = []
+        while size > 0:
+            chunk = self._socket_recv(size)
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return ''.join(chunks)
+
+    def _socket_recv_into(self, view):
+        """
+        Fill a memoryview with received bytes, without intermediate copies.
+        """
+
+        pending = self._socket_pending[:len(view)]
+        if pending:
+            view[:len(pending)] = pending
+            self._socket_pending = self._socket_pending[len(pending):]
+
+        pos, size = len(pending), len(view)
+        while pos < size:
+            try:
+                received = self.device.recv_into(view[pos:], min(size - pos, self.socket_chunk_size))
+            except socket.timeout as e:
+                raise DeviceTimeout(e)
+
+            if not received:
+                raise DeviceNotFoundError('Connection closed by device at "{0}".'.format(self.connection_resource))
+
+            pos += received
+
+    def _socket_read_line(self):
+        """
+        Receive everything up to and including the next newline.
+        """
+
+        chunks = []
+        while True:
+            chunk = self._socket_recv(self.socket_chunk_size)
+
+            end = chunk.find('\n')
+            if end >= 0:
+                chunks.append(chunk[:end + 1])
+                self._socket_pending = chunk[end + 1:] + self._socket_pending
+                break
+
+            chunks.append(chunk)
+
+        return ''.join(chunks)
+
+    def _socket_read_block_header(self):
+        """
+        Receive a 488.2 block header.
+
+        Returns the header itself and the length of the payload (None if indefinite).
+        """
+
+        self._socket_peek()
+        header = self._socket_read_exactly(2)
+
+        if header[0] != '#':
+            raise BlockDataError('Leading character is "{0}", not "#".'.format(header[0]))
+
+        try:
+            length_length = int(header[1])
+        except ValueError:
+            raise BlockDataError('Length length incorrectly specified: {0}'.format(header[1]))
+
+        if length_length == 0:
+            return header, None
+
+        length_digits = self._socket_read_exactly(length_length)
+
+        try:
+            length = int(length_digits)
+        except ValueError:
+            raise BlockDataError('Length incorrectly specified: {0}'.format(length_digits))
+
+        # The payload is usually followed by a newline, which is only dealt with once the next response is read.
+        self._socket_block_ended = True
+
+        return header + length_digits, length
+
     def close(self):
         """
         Close the connection, if possible.
@@ -519,7 +855,7 @@ class AbstractDevice(SuperDevice):
 
         log.debug('Closing device: {0}'.format(self.name))
 
-        if self.driver in [drivers.pyvisa, drivers.pyvisa_usb]:
+        if self.driver in [drivers.pyvisa, drivers.pyvisa_usb, drivers.socket]:
             self.device.close()
 
     def find_resource(self, path):
@@ -561,7 +897,7 @@ class AbstractDevice(SuperDevice):
         Ask the device for identification.
         """
 
-        if self.driver in [drivers.pyvisa, drivers.lgpib]:
+        if self.driver in [drivers.pyvisa, drivers.lgpib, drivers.socket]:
             return self.ask('*idn?')
 
     @property
@@ -573,7 +909,7 @@ class AbstractDevice(SuperDevice):
         end_time = time() + self.max_timeout
 
         while True:
-            if self.driver in [drivers.pyvisa, drivers.lgpib]:
+            if self.driver in [drivers.pyvisa, drivers.lgpib, drivers.socket]:
                 try:
                     self.ask('*opc?')
                 except DeviceTimeout:
@@ -593,6 +929,8 @@ class AbstractSubdevice(SuperDevice):
 
         # Synchronized methods should use the device lock.
         self.lock = self.device.lock if self.device else None
+        # Cached getters should use the device cache.
+        self.cache = self.device.cache if self.device else None
 
     def __init__(self, device):
         self.device = device
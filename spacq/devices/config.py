@@ -23,7 +23,7 @@ def device_tree():
 
 	tree = {}
 
-	for manufacturer in devices.manufacturers:
+	for manufacturer in devices.load_manufacturers():
 		subtree = {}
 
 		for model, mock_model in zip(manufacturer.models, manufacturer.mock_models):
@@ -73,6 +73,7 @@ class DeviceConfig(object):
 		'requests',
 		'gpib',
 		'usb',
+		'socket',
 	])
 
 	def __init__(self, name):
@@ -87,6 +88,8 @@ class DeviceConfig(object):
 		self.gpib_pad = 0
 		self.gpib_sad = 0
 		self.usb_resource = None
+		self.socket_address = None
+		self.socket_port = 5025
 
 		# Information about module that implements this device.
 		self.manufacturer = None
@@ -129,6 +132,10 @@ class DeviceConfig(object):
 		self._device = None
 		self.resources = {}
 
+		# Configurations saved before raw sockets were supported.
+		self.__dict__.setdefault('socket_address', None)
+		self.__dict__.setdefault('socket_port', 5025)
+
 	@property
 	def device(self):
 		"""
@@ -211,6 +218,12 @@ class DeviceConfig(object):
 					raise ConnectionError('No USB resource specified.')
 
 				address['usb_resource'] = self.usb_resource
+			elif self.address_mode == self.address_modes.socket:
+				if self.socket_address is None:
+					raise ConnectionError('No socket address specified.')
+
+				address['socket_address'] = self.socket_address
+				address['socket_port'] = self.socket_port
 
 		tree = device_tree()
 
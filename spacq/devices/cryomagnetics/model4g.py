@@ -8,7 +8,7 @@ from time import sleep
 from functools import wraps
 
 from ..abstract_device import AbstractDevice, AbstractSubdevice
-from ..tools import quantity_wrapped, quantity_unwrapped
+from ..tools import quantity_wrapped, quantity_unwrapped, cached, invalidates
 from ..tools import dynamic_quantity_wrapped, dynamic_converted_quantity_unwrapped
 
 
@@ -16,6 +16,9 @@ from ..tools import dynamic_quantity_wrapped, dynamic_converted_quantity_unwrapp
 Cryomagnetics model 4G Device
 """
 
+
+units_ttl = 5 # s
+
 class Channel(AbstractSubdevice):
     """
     Interface for a channel on the Model4G
@@ -357,6 +360,7 @@ class Channel(AbstractSubdevice):
         self.device.write('sweep {0}'.format(value))
         
     @property
+    @cached(units_ttl)
     @Synchronized()
     @_set_channel()
     def units(self):
@@ -374,10 +378,12 @@ class Channel(AbstractSubdevice):
         if self._units != read_dict[response]:
             self.units = self._units
             
-        return read_dict[response]
+        # The device now agrees with the local copy.
+        return self._units
             
     
     @units.setter
+    @invalidates('units')
     @Synchronized()
     @_set_channel()
     def units(self,value):
@@ -681,6 +687,7 @@ class Model4G(AbstractDevice):
 
         log.info('Resetting "{0}".'.format(self.name))
         self.write('*rst')
+        self.cache.clear()
 
         #TODO: test if the *rst actually DOES do something to the magnet controller.
         
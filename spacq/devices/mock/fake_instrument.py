@@ -0,0 +1,315 @@
+import logging
+log = logging.getLogger(__name__)
+
+import BaseHTTPServer
+import random
+import SocketServer
+from threading import Lock, Thread
+from time import sleep
+from urllib import unquote
+
+"""
+Local fake-instrument servers.
+
+Serve a mock device over real sockets, so that the actual drivers can be exercised end to end, with injected latency,
+jitter, throughput limits and errors.
+"""
+
+
+class Conditions(object):
+	"""
+	Network and instrument conditions to inject into a fake instrument.
+	"""
+
+	def __init__(self, latency=0.0, jitter=0.0, throughput=None, error_rate=0.0, seed=None):
+		"""
+		latency: Delay before every response, in seconds.
+		jitter: Maximum extra random delay before every response, in seconds.
+		throughput: Maximum rate at which responses are sent, in bytes per second; unlimited if None.
+		error_rate: Fraction of messages which are dropped without any response.
+		seed: Seed for the random number generator, for repeatable runs.
+		"""
+
+		self.latency = latency
+		self.jitter = jitter
+		self.throughput = throughput
+		self.error_rate = error_rate
+
+		self.random = random.Random(seed)
+
+	def delay(self):
+		"""
+		The delay before the next response.
+		"""
+
+		return self.latency + self.random.uniform(0, self.jitter)
+
+	def fails(self):
+		"""
+		Whether the next message is dropped.
+		"""
+
+		return self.random.random() < self.error_rate
+
+	def chunks(self, data):
+		"""
+		Split a response into chunks, each with the time it takes to send.
+		"""
+
+		if self.throughput is None:
+			yield data, 0.0
+			return
+
+		# Aim for around 100 chunks per second.
+		size = max(1, int(self.throughput * 0.01))
+
+		for i in xrange(0, len(data), size):
+			chunk = data[i:i + size]
+
+			yield chunk, len(chunk) / float(self.throughput)
+
+
+def skip_block(data, pos):
+	"""
+	The position just past the definite-length block data starting at pos, or None if it is not all there yet.
+
+	Positions which do not start a definite-length block are returned unchanged.
+	"""
+
+	if data[pos + 1:pos + 2] in ['', '0'] or not data[pos + 1].isdigit():
+		return pos
+
+	num_digits = int(data[pos + 1])
+	header_end = pos + 2 + num_digits
+
+	if len(data) < header_end:
+		return None
+
+	end = header_end + int(data[pos + 2:header_end])
+
+	if len(data) < end:
+		return None
+
+	return end
+
+
+def split_messages(data, separator):
+	"""
+	Split data on the separator, except within block data.
+
+	Returns the complete messages, and whatever remains after the last separator.
+	"""
+
+	messages = []
+	start = pos = 0
+
+	while pos < len(data):
+		if data[pos] == '#':
+			end = skip_block(data, pos)
+
+			if end is None:
+				break
+			elif end > pos:
+				pos = end
+
+				continue
+
+		if data[pos] == separator:
+			messages.append(data[start:pos])
+			start = pos + 1
+
+		pos += 1
+
+	return messages, data[start:]
+
+
+class FakeInstrumentServer(object):
+	"""
+	A mock device served locally.
+	"""
+
+	# How often the server checks whether it should stop.
+	poll_interval = 0.05 # s
+
+	def __init__(self, mock, conditions=None, address='127.0.0.1', port=0):
+		"""
+		mock: The mock device which handles every message.
+		conditions: The Conditions to inject; none if None.
+		address, port: Where to listen; any free port if 0.
+		"""
+
+		self.mock = mock
+		self.conditions = conditions if conditions is not None else Conditions()
+
+		self.lock = Lock()
+
+		self.server = self._create_server((address, port))
+		self.server.daemon_threads = True
+		self.server.fake_instrument = self
+
+		self.address, self.port = self.server.server_address
+
+		self.thread = None
+
+	def _create_server(self, address):
+		raise NotImplementedError()
+
+	def handle(self, message):
+		"""
+		Pass a message, possibly with several commands, to the mock device.
+
+		Returns the response, or None if there is nothing to say or the message was dropped.
+		"""
+
+		if self.conditions.fails():
+			log.debug('Dropping message: {0!r}'.format(message))
+
+			return None
+
+		commands, last = split_messages(message, ';')
+		commands.append(last)
+
+		responses = []
+
+		with self.lock:
+			for command in commands:
+				command = command.strip().lstrip(':')
+
+				if not command:
+					continue
+
+				try:
+					self.mock.write(command)
+				except NotImplementedError as e:
+					log.warning(str(e))
+
+					continue
+
+				if self.mock.output is not None:
+					responses.append(self.mock.output.rstrip('\n'))
+
+		sleep(self.conditions.delay())
+
+		if responses:
+			return ';'.join(responses) + '\n'
+
+	def start(self):
+		"""
+		Serve in the background.
+		"""
+
+		self.thread = Thread(target=self.server.serve_forever, args=(self.poll_interval,))
+		self.thread.daemon = True
+		self.thread.start()
+
+		log.debug('Serving mock device "{0}" on {1}:{2}.'.format(self.mock.name, self.address, self.port))
+
+	def stop(self):
+		"""
+		Stop serving.
+		"""
+
+		self.server.shutdown()
+		self.server.server_close()
+
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	def __enter__(self):
+		self.start()
+
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+
+class SocketRequestHandler(SocketServer.BaseRequestHandler):
+	"""
+	Newline-terminated messages over a raw socket.
+	"""
+
+	chunk_size = 65536 # bytes
+
+	def handle(self):
+		fake_instrument = self.server.fake_instrument
+		buf = ''
+
+		while True:
+			data = self.request.recv(self.chunk_size)
+			if not data:
+				break
+
+			messages, buf = split_messages(buf + data, '\n')
+
+			for message in messages:
+				response = fake_instrument.handle(message)
+
+				if response is not None:
+					for chunk, duration in fake_instrument.conditions.chunks(response):
+						self.request.sendall(chunk)
+						sleep(duration)
+
+
+class SocketInstrumentServer(FakeInstrumentServer):
+	"""
+	A mock device served as raw SCPI over TCP, as for the socket driver.
+	"""
+
+	def _create_server(self, address):
+		return SocketServer.ThreadingTCPServer(address, SocketRequestHandler)
+
+
+class HTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+	Messages as URL paths, as for the requests driver.
+
+	"GET /<message>" passes the (unquoted) message, including any query string, to the device, and "GET /" fetches
+	the last response.
+	"""
+
+	def do_GET(self):
+		fake_instrument = self.server.fake_instrument
+		message = unquote(self.path[1:])
+
+		if message:
+			response = fake_instrument.handle(message)
+			self.server.last_response = response
+		else:
+			response = self.server.last_response
+
+		if response is None:
+			response = ''
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain')
+		self.send_header('Content-Length', str(len(response)))
+		self.end_headers()
+
+		for chunk, duration in fake_instrument.conditions.chunks(response):
+			self.wfile.write(chunk)
+			sleep(duration)
+
+	def log_message(self, format, *args):
+		log.debug(format % args)
+
+
+class HTTPInstrumentServer(FakeInstrumentServer):
+	"""
+	A mock device served over HTTP.
+
+	As with the requests driver, the URL for each message is "http://" followed by the request address
+	("<address>:<port>") and the message ("/<path>"). Characters such as "?" which are part of a SCPI command rather
+	than a query string must be quoted.
+	"""
+
+	def _create_server(self, address):
+		server = BaseHTTPServer.HTTPServer(address, HTTPRequestHandler)
+		server.last_response = None
+
+		return server
+
+	@property
+	def request_address(self):
+		return '{0}:{1}'.format(self.address, self.port)
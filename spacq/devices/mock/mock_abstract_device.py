@@ -13,6 +13,8 @@ class MockAbstractDevice(AbstractDevice):
 	A class for controlling fake devices.
 	"""
 
+	# Not connected through any real driver.
+	driver = None
 	output = None
 
 	@staticmethod
@@ -0,0 +1,109 @@
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises, eq_
+from time import time
+from unittest import main, TestCase
+from urllib import quote
+import urllib2
+
+from ...abstract_device import AbstractDevice, available_drivers, drivers, DeviceTimeout
+from ...agilent.dm34410a import DM34410A
+from ...agilent.mock.mock_dm34410a import MockDM34410A
+from .. import fake_instrument
+
+
+class SplitMessagesTest(TestCase):
+	def testSplit(self):
+		"""
+		Separators within block data are not split on.
+		"""
+
+		eq_(fake_instrument.split_messages('a\nb;c\nd', '\n'), (['a', 'b;c'], 'd'))
+		eq_(fake_instrument.split_messages('data #15ab\ncd\n*opc?\n', '\n'), (['data #15ab\ncd', '*opc?'], ''))
+		eq_(fake_instrument.split_messages('data #15ab;c', ';'), ([], 'data #15ab;c'))
+		eq_(fake_instrument.split_messages('x #0y\nz', '\n'), (['x #0y'], 'z'))
+
+
+class SocketInstrumentServerTest(TestCase):
+	def testDriver(self):
+		"""
+		Drive a mock multimeter over a real socket.
+		"""
+
+		with fake_instrument.SocketInstrumentServer(MockDM34410A()) as fake:
+			dev = DM34410A(socket_address=fake.address, socket_port=fake.port)
+
+			eq_(dev.idn, 'MockDM34410A')
+
+			dev.integration_time = 10
+			eq_(dev.integration_time, 10)
+			assert -0.2 < dev.reading.value < 0
+
+			dev.multi_command_start()
+			dev.ask('*idn?')
+			dev.ask('sense:voltage:dc:nplc?')
+			eq_(dev.multi_command_stop(), ['MockDM34410A', '10'])
+
+			dev.close()
+
+	def testConditions(self):
+		"""
+		Responses are delayed, and dropped messages time out.
+		"""
+
+		conditions = fake_instrument.Conditions(latency=0.05, jitter=0.01, throughput=1000, seed=0)
+
+		with fake_instrument.SocketInstrumentServer(MockDM34410A(), conditions) as fake:
+			dev = DM34410A(socket_address=fake.address, socket_port=fake.port)
+
+			start = time()
+			for _ in xrange(4):
+				dev.ask('*idn?')
+			assert time() - start >= 0.2
+
+			conditions.error_rate = 1
+			dev.device.settimeout(0.1)
+			assert_raises(DeviceTimeout, dev.ask, '*idn?')
+
+			dev.close()
+
+
+class HTTPInstrumentServerTest(TestCase):
+	def testRequests(self):
+		"""
+		Converse over HTTP.
+		"""
+
+		with fake_instrument.HTTPInstrumentServer(MockDM34410A()) as fake:
+			def get(message):
+				return urllib2.urlopen('http://' + fake.request_address + '/' + quote(message)).read()
+
+			eq_(get('*idn?'), 'MockDM34410A\n')
+			eq_(get(''), 'MockDM34410A\n')
+			eq_(get('sense:voltage:dc:nplc 2'), '')
+			eq_(get(':sense:voltage:dc:nplc?;*opc?'), '2;1\n')
+
+	def testDriver(self):
+		"""
+		Converse through the requests driver.
+		"""
+
+		if drivers.requests not in available_drivers:
+			raise SkipTest('requests is not available.')
+
+		with fake_instrument.HTTPInstrumentServer(MockDM34410A()) as fake:
+			dev = AbstractDevice(request_address=fake.request_address)
+			eq_(dev.driver, drivers.requests)
+
+			def ask(message):
+				r = dev.ask_raw('/' + quote(message))
+				eq_(r.status_code, 200)
+
+				return r.text
+
+			eq_(ask('*idn?'), 'MockDM34410A\n')
+			eq_(ask('sense:voltage:dc:nplc 2'), '')
+			eq_(ask(':sense:voltage:dc:nplc?;*opc?'), '2;1\n')
+
+
+if __name__ == '__main__':
+	main()
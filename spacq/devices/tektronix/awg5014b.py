@@ -1,14 +1,19 @@
 import logging
 log = logging.getLogger(__name__)
 
-import struct
+from collections import namedtuple, OrderedDict
+from hashlib import sha1
+from numpy import asarray
+import re
+from time import time
 
 from spacq.interface.resources import Resource
 from spacq.interface.units import Quantity
+from spacq.interface.waveform import Marker as MarkerData
 from spacq.tool.box import Synchronized
 
 from ..abstract_device import AbstractDevice, AbstractSubdevice
-from ..tools import str_to_bool, quantity_wrapped, quantity_unwrapped, BlockData
+from ..tools import str_to_bool, quantity_wrapped, quantity_unwrapped, cached, invalidates, BlockData
 
 """
 Tektronix AWG5014B Arbitrary Waveform Generator
@@ -17,6 +22,14 @@ Control the AWG's settings and output waveforms.
 """
 
 
+# An entry in the sequence table: waveform names by channel number, the number of times to play them (0 for
+# forever), whether to wait for a trigger first, and the element (from 1) to go to afterwards, if not the next one.
+SequenceElement = namedtuple('SequenceElement', 'waveforms, repeat, wait, goto')
+
+# Names given to waveforms by load_waveform.
+loaded_waveform_name = re.compile(r' [0-9a-f]{16}$')
+
+
 class Marker(AbstractSubdevice):
 	"""
 	Marker channel of an output channel.
@@ -128,6 +141,9 @@ class Channel(AbstractSubdevice):
 	def waveform_name(self, v):
 		self.device.write('source{0}:waveform "{1}"'.format(self.channel, v))
 
+		# The waveform being played must stay on the AWG.
+		self.device.upload_cache.pin(self.channel, [v])
+
 	@waveform_name.deleter
 	def waveform_name(self):
 		self.waveform_name = ''
@@ -176,21 +192,134 @@ class Channel(AbstractSubdevice):
 		if name in self.device.waveform_names:
 			self.device.delete_waveform(name)
 
-		# Normalize waveform.
-		max_amp = max(abs(x) for x in waveform)
+		waveform = self._normalize(waveform)
+
+		# Create new.
+		self.device.create_waveform(name, waveform, markers)
+		self.waveform_name = name
+
+	def load_waveform(self, waveform, markers=None, name=None):
+		"""
+		Like set_waveform, but only upload the waveform if it is not already on the AWG.
+
+		The name is used as a prefix for the name of the stored waveform.
+		"""
+
+		if name is None:
+			name = 'Channel {0}'.format(self.channel)
+
+		waveform = self._normalize(waveform)
+
+		self.waveform_name = self.device.load_waveform(waveform, markers, name)
+
+	def _normalize(self, waveform):
+		"""
+		Scale a waveform in V onto [-1, 1], setting the amplitude to match.
+		"""
+
+		return self._normalize_all([waveform])[0]
+
+	def _normalize_all(self, waveforms):
+		"""
+		Like _normalize, but for several waveforms sharing the amplitude.
+		"""
+
+		waveforms = [asarray(waveform, dtype=float) for waveform in waveforms]
+		max_amp = max(abs(waveform).max() if len(waveform) else 0.0 for waveform in waveforms)
 		if max_amp > self.max_amplitude:
 			raise ValueError('Amplitude {0} V exceeds maximum of {1} V'.format(max_amp, self.max_amplitude))
 		elif max_amp > 0:
 			if max_amp < self.min_amplitude:
 				max_amp = self.min_amplitude
 
-			waveform = [x / max_amp for x in waveform]
+			waveforms = [waveform / max_amp for waveform in waveforms]
 
 			self.amplitude = Quantity(max_amp, 'V')
 
-		# Create new.
-		self.device.create_waveform(name, waveform, markers)
-		self.waveform_name = name
+		return waveforms
+
+
+class UploadCache(object):
+	"""
+	The waveforms uploaded to an AWG, least recently used first.
+	"""
+
+	def __init__(self, capacity):
+		# The total number of points to keep on the AWG.
+		self.capacity = capacity
+
+		# Names and their lengths.
+		self.entries = OrderedDict()
+		# Names which must not be evicted, by what they are in use for.
+		self.pinned = {}
+		# Whether the waveforms already on the AWG have been added.
+		self.loaded = False
+
+		self.hits = 0
+		self.misses = 0
+
+	@property
+	def used(self):
+		"""
+		The total number of points in use.
+		"""
+
+		return sum(self.entries.values())
+
+	@property
+	def in_use(self):
+		"""
+		The names of all the pinned waveforms.
+		"""
+
+		return set().union(*self.pinned.values())
+
+	def pin(self, user, names):
+		"""
+		Keep waveforms from being evicted while a user (such as a channel) needs them, replacing any pinned for it
+		before.
+		"""
+
+		names = set(name for name in names if name)
+
+		if names:
+			self.pinned[user] = names
+		else:
+			self.pinned.pop(user, None)
+
+	def add(self, name, length):
+		"""
+		Mark a waveform as the most recently used.
+
+		Returns the names of the waveforms which no longer fit. Pinned waveforms, and the one being added, are
+		never evicted, even if that leaves the cache over capacity.
+		"""
+
+		self.entries.pop(name, None)
+		self.entries[name] = length
+
+		evicted = []
+		used = self.used
+		if used > self.capacity:
+			in_use = self.in_use
+			in_use.add(name)
+
+			for old_name, old_length in self.entries.items():
+				if used <= self.capacity:
+					break
+				elif old_name in in_use:
+					continue
+
+				del self.entries[old_name]
+				evicted.append(old_name)
+				used -= old_length
+
+		return evicted
+
+	def clear(self):
+		self.entries.clear()
+		self.pinned.clear()
+		self.loaded = False
 
 
 class AWG5014B(AbstractDevice):
@@ -200,9 +329,23 @@ class AWG5014B(AbstractDevice):
 
 	allowed_run_modes = set(['continuous', 'triggered', 'gated', 'sequence'])
 
+	# Waveform memory without any options.
+	waveform_memory = 16200000 # points
+
+	waveform_names_ttl = 1 # s
+
+	# Sequencer limits.
+	max_sequence_length = 8000 # elements
+	max_repeat = 65536
+	min_sequence_waveform_length = 250 # points
+
 	def _setup(self):
 		AbstractDevice._setup(self)
 
+		# Bytes per second for the most recent waveform upload.
+		self.upload_rate = None
+		self.upload_cache = UploadCache(self.waveform_memory)
+
 		self.channels = [None] # There is no channel 0.
 		for chan in xrange(1, 5):
 			channel = Channel(self, chan)
@@ -226,6 +369,8 @@ class AWG5014B(AbstractDevice):
 
 		log.info('Resetting "{0}".'.format(self.name))
 		self.write('*rst')
+		self.cache.clear()
+		self.upload_cache.clear()
 
 	@property
 	def data_bits(self):
@@ -288,6 +433,7 @@ class AWG5014B(AbstractDevice):
 		self.write('awgcontrol:rmode {0}'.format(value))
 
 	@property
+	@cached(ttl=waveform_names_ttl)
 	@Synchronized()
 	def waveform_names(self):
 		"""
@@ -313,14 +459,13 @@ class AWG5014B(AbstractDevice):
 			log.debug('Getting waveform "{0}" from device "{1}".'.format(name, self.name))
 
 			block_data = self.ask_raw('wlist:waveform:data? "{0}"'.format(name))
-			packed_data = BlockData.from_block_data(block_data)
-			waveform_length = len(packed_data) / 2
-			data = struct.unpack('<{0}H'.format(waveform_length), packed_data)
-			data = [x & 2 ** 14 - 1 for x in data] # Filter out marker data.
+			# Always 16-bit, unsigned, little-endian.
+			data = BlockData.from_block_data_array(block_data, '<u2')
+			data = data & 2 ** 14 - 1 # Filter out marker data.
 
 			min_value, max_value = self.value_range
 			range_diff = max_value - min_value
-			data = [2.0 * (x - min_value) / range_diff - 1.0 for x in data]
+			data = 2.0 * (data - min_value) / range_diff - 1.0
 
 			log.debug('Got waveform "{0}" from device "{1}": {2!r}'.format(name, self.name, data))
 
@@ -328,6 +473,47 @@ class AWG5014B(AbstractDevice):
 		finally:
 			self.status.pop()
 
+	def pack_waveform(self, data, markers=None):
+		"""
+		Convert waveform data on [-1, 1] and its markers to the format stored by the AWG.
+		"""
+
+		data = asarray(data, dtype=float)
+
+		# Also catches NaN, which compares false with everything.
+		if not (abs(data) <= 1.0).all():
+			raise ValueError('Waveform data must be on [-1, 1]')
+
+		min_value, max_value = self.value_range
+		range_diff = max_value - min_value
+
+		# Always 16-bit, unsigned, little-endian.
+		packed_data = (range_diff * (data + 1.0) / 2.0).astype('<u2')
+		packed_data += min_value
+
+		if markers:
+			# The markers are in the top 2 bits.
+			for marker_num, marker_bit in zip([1, 2], [1 << 14, 1 << 15]):
+				try:
+					marker = markers[marker_num]
+				except KeyError:
+					continue
+
+				if not isinstance(marker, MarkerData):
+					marker = MarkerData.from_values(marker)
+
+				plane = marker.bit_plane(marker_bit)[:len(packed_data)]
+				packed_data[:len(plane)] |= plane
+
+				log.debug('Added marker {0} to waveform on device "{1}": {2!r}'.format(marker_num, self.name,
+						marker))
+
+			extra_markers = set(markers) - set([1, 2])
+			for extra in extra_markers:
+				log.warning('Marker {0} ignored: {1!r}'.format(extra, markers[extra]))
+
+		return packed_data
+
 	@Synchronized()
 	def create_waveform(self, name, data, markers=None):
 		"""
@@ -339,42 +525,94 @@ class AWG5014B(AbstractDevice):
 		self.status.append('Creating waveform "{0}"'.format(name))
 
 		try:
-			log.debug('Creating waveform "{0}" on device "{1}" with data: {2!r}'.format(name, self.name, data))
+			log.debug('Creating waveform "{0}" on device "{1}" with {2} points.'.format(name, self.name, len(data)))
 
-			min_value, max_value = self.value_range
-			range_diff = max_value - min_value
-			data = [min_value + int(range_diff * (x + 1.0) / 2.0) for x in data]
-
-			waveform_length = len(data)
-			self.write('wlist:waveform:new "{0}", {1}, integer'.format(name, waveform_length))
-
-			if markers:
-				# The markers are in the top 2 bits.
-				for marker_num, marker_bit in zip([1, 2], [1 << 14, 1 << 15]):
-					try:
-						for i, marker_datum in enumerate(markers[marker_num]):
-							if marker_datum:
-								data[i] += marker_bit
-						log.debug('Added marker {0} to waveform "{1}" device "{1}": {2!r}'.format(marker_num,
-								name, self.name, markers[marker_num]))
-					except KeyError:
-						pass
-
-				extra_markers = set(markers) - set([1, 2])
-				for extra in extra_markers:
-					log.warning('Marker {0} ignored: {1!r}'.format(extra, markers[extra]))
+			self.upload_waveform(name, self.pack_waveform(data, markers))
+		finally:
+			self.status.pop()
 
-			# Always 16-bit, unsigned, little-endian.
-			packed_data = struct.pack('<{0}H'.format(waveform_length), *data)
-			block_data = BlockData.to_block_data(packed_data)
+	@Synchronized()
+	def load_waveform(self, data, markers=None, name='Waveform'):
+		"""
+		Create a waveform on the AWG, unless it is already there.
 
-			log.debug('Sending packed block waveform data for "{0}" on device "{1!r}": {2}'.format(name,
-					self.name, block_data))
+		The name of the stored waveform is made up of the given name and a hash of its contents, so identical
+		waveforms are only ever uploaded once. The least recently loaded waveforms are deleted once they no
+		longer fit in the waveform memory.
 
-			self.write('wlist:waveform:data "{0}", {1}'.format(name, block_data))
-		finally:
-			self.status.pop()
+		Returns the name of the stored waveform.
+		"""
+
+		if not self.upload_cache.loaded:
+			self._load_stored_waveforms()
+
+		packed_data = self.pack_waveform(data, markers)
+		name = '{0} {1}'.format(name, sha1(packed_data).hexdigest()[:16])
+
+		self._add_to_upload_cache(name, len(packed_data))
+
+		if name in self.waveform_names:
+			log.debug('Waveform "{0}" already on device "{1}".'.format(name, self.name))
+			self.upload_cache.hits += 1
+		else:
+			self.upload_cache.misses += 1
+
+			self.status.append('Creating waveform "{0}"'.format(name))
+
+			try:
+				self.upload_waveform(name, packed_data)
+			finally:
+				self.status.pop()
+
+		return name
+
+	def _add_to_upload_cache(self, name, length):
+		"""
+		Add a waveform to the upload cache, deleting any which are evicted.
+		"""
+
+		for evicted in self.upload_cache.add(name, length):
+			if evicted in self.waveform_names:
+				log.debug('Evicting waveform "{0}" from device "{1}".'.format(evicted, self.name))
+				self.delete_waveform(evicted)
+
+	def _load_stored_waveforms(self):
+		"""
+		Add the waveforms left on the AWG by load_waveform in earlier sessions to the upload cache, so that they can
+		be reused or evicted.
+		"""
+
+		self.upload_cache.loaded = True
+
+		for channel in self.channels[1:]:
+			self.upload_cache.pin(channel.channel, [channel.waveform_name])
+
+		for name in self.waveform_names:
+			if loaded_waveform_name.search(name):
+				length = int(self.ask('wlist:waveform:length? "{0}"'.format(name)))
+				self._add_to_upload_cache(name, length)
+
+	@invalidates('waveform_names')
+	@Synchronized()
+	def upload_waveform(self, name, packed_data):
+		"""
+		Create a new waveform on the AWG from data as given by pack_waveform.
+		"""
 
+		self.write('wlist:waveform:new "{0}", {1}, integer'.format(name, len(packed_data)))
+
+		log.debug('Sending packed block waveform data for "{0}" on device "{1!r}": {2!r}'.format(name,
+				self.name, packed_data))
+
+		start_time = time()
+		self.write_block('wlist:waveform:data "{0}", '.format(name), packed_data)
+		duration = time() - start_time
+
+		self.upload_rate = packed_data.nbytes / duration if duration > 0 else float('inf')
+		log.info('Uploaded {0} bytes of waveform "{1}" to device "{2}" in {3:.3f} s ({4:.3g} B/s).'.format(
+				packed_data.nbytes, name, self.name, duration, self.upload_rate))
+
+	@invalidates('waveform_names')
 	def delete_waveform(self, name):
 		"""
 		Remove a waveform on the AWG.
@@ -385,6 +623,111 @@ class AWG5014B(AbstractDevice):
 
 		self.write('wlist:waveform:delete "{0}"'.format(name))
 
+	@property
+	@Synchronized()
+	def sequence(self):
+		"""
+		The sequence table, as a list of SequenceElements.
+		"""
+
+		length = int(self.ask('sequence:length?'))
+
+		result = []
+		for n in xrange(1, length + 1):
+			waveforms = {}
+			for chan in xrange(1, len(self.channels)):
+				# The name is in quotes.
+				name = self.ask('sequence:element{0}:waveform{1}?'.format(n, chan))[1:-1]
+
+				if name:
+					waveforms[chan] = name
+
+			if int(self.ask('sequence:element{0}:loop:infinite?'.format(n))):
+				repeat = 0
+			else:
+				repeat = int(self.ask('sequence:element{0}:loop:count?'.format(n)))
+
+			wait = bool(int(self.ask('sequence:element{0}:twait?'.format(n))))
+
+			if int(self.ask('sequence:element{0}:goto:state?'.format(n))):
+				goto = int(self.ask('sequence:element{0}:goto:index?'.format(n)))
+			else:
+				goto = None
+
+			result.append(SequenceElement(waveforms, repeat, wait, goto))
+
+		return result
+
+	@sequence.setter
+	@Synchronized()
+	def sequence(self, elements):
+		if len(elements) > self.max_sequence_length:
+			raise ValueError('Sequence of {0} elements exceeds maximum of {1}'.format(len(elements),
+					self.max_sequence_length))
+
+		for element in elements:
+			if not 0 <= element.repeat <= self.max_repeat:
+				raise ValueError('Invalid repeat count: {0}'.format(element.repeat))
+
+		# Start from an empty table.
+		self.write('sequence:length 0')
+		self.write('sequence:length {0}'.format(len(elements)))
+
+		for n, element in enumerate(elements, 1):
+			for chan, name in sorted(element.waveforms.items()):
+				self.write('sequence:element{0}:waveform{1} "{2}"'.format(n, chan, name))
+
+			if element.repeat == 0:
+				self.write('sequence:element{0}:loop:infinite 1'.format(n))
+			else:
+				self.write('sequence:element{0}:loop:infinite 0'.format(n))
+				self.write('sequence:element{0}:loop:count {1}'.format(n, element.repeat))
+
+			self.write('sequence:element{0}:twait {1}'.format(n, int(element.wait)))
+
+			if element.goto is None:
+				self.write('sequence:element{0}:goto:state 0'.format(n))
+			else:
+				self.write('sequence:element{0}:goto:state 1'.format(n))
+				self.write('sequence:element{0}:goto:index {1}'.format(n, element.goto))
+
+	def load_sequence(self, elements):
+		"""
+		Play a sequence of waveforms, given as (waveforms, repeat) pairs, where the waveforms map channel numbers to
+		(data, markers) with the data in V.
+
+		Each channel has a single amplitude for the whole sequence. The sequence waits for a trigger before
+		starting, and goes back to the start at the end. Waveforms shared between elements are only stored once.
+		"""
+
+		channels = sorted(set(chan for waveforms, _ in elements for chan in waveforms))
+		names = [{} for _ in elements]
+
+		# The previous sequence is being replaced.
+		self.upload_cache.pin('sequence', [])
+		loaded = set()
+
+		for chan in channels:
+			try:
+				waveforms = [element_waveforms[chan] for element_waveforms, _ in elements]
+			except KeyError:
+				raise ValueError('Channel {0} missing from some elements'.format(chan))
+
+			data = self.channels[chan]._normalize_all([waveform for waveform, _ in waveforms])
+
+			for element_names, element_data, (_, markers) in zip(names, data, waveforms):
+				element_names[chan] = self.load_waveform(element_data, markers, 'Sequence')
+
+				# Keep the earlier elements while loading the later ones.
+				loaded.add(element_names[chan])
+				self.upload_cache.pin('sequence', loaded)
+
+		last = len(elements) - 1
+		self.sequence = [SequenceElement(element_names, repeat, i == 0, 1 if i == last else None)
+				for i, (element_names, (_, repeat)) in enumerate(zip(names, elements))]
+
+		self.run_mode = 'sequence'
+
 	@property
 	def enabled(self):
 		"""
@@ -2,14 +2,14 @@ import logging
 log = logging.getLogger(__name__)
 
 from math import ceil
-from numpy import linspace
-import struct
+from numpy import asarray, dtype, empty, linspace
+from threading import Thread
 
 from spacq.interface.resources import Resource
 from spacq.tool.box import Synchronized
 
 from ..abstract_device import AbstractDevice, AbstractSubdevice
-from ..tools import str_to_bool, quantity_wrapped, quantity_unwrapped, BlockData
+from ..tools import str_to_bool, quantity_wrapped, quantity_unwrapped, cached, invalidates
 
 """
 Tektronix DPO7104 Digital Phosphor Oscilloscope
@@ -18,6 +18,17 @@ Control the DPO's settings and input waveforms.
 """
 
 
+settings_ttl = 5 # s
+
+
+def waveform_pairs(times, values):
+	"""
+	Intermix time and value arrays into the format [(time1, value1), (time2, value2), ...].
+	"""
+
+	return zip(times.tolist(), values.tolist())
+
+
 class Channel(AbstractSubdevice):
 	"""
 	Input channel of the DPO.
@@ -60,18 +71,26 @@ class Channel(AbstractSubdevice):
 
 	def transform_waveform(self, waveform):
 		"""
-		Transform some curve data onto the true amplitude interval in V, and intermix time values in s.
+		Transform some curve data onto the true amplitude interval in V.
+
+		The last axis of the curve data is time, so several frames may be transformed at once.
+
+		Returns arrays of the time values in s and the amplitudes in V.
 		"""
 
-		value_min, value_max = self.device.value_range
-		value_diff = value_max - value_min
+		waveform = asarray(waveform)
 
+		# The settings are cached, so this does not usually touch the bus.
+		value_min, value_max = self.device.value_range
 		real_min, real_max = self.acquisition_window
-		real_diff = real_max - real_min
 
-		times = linspace(0, self.device.time_scale.value, len(waveform))
+		gain = float(real_max - real_min) / (value_max - value_min)
+		# Keep the raw values from overflowing by never subtracting in their type.
+		values = gain * waveform + (real_min - gain * value_min)
+
+		times = linspace(0, self.device.time_scale.value, waveform.shape[-1])
 
-		return [(time, real_diff * float(x - value_min) / value_diff + real_min) for time, x in zip(times, waveform)]
+		return times, values
 
 	@property
 	def enabled(self):
@@ -87,7 +106,6 @@ class Channel(AbstractSubdevice):
 		self.device.write('select:ch{0} {1}'.format(self.channel, 'on' if value else 'off'))
 
 	@property
-	@Synchronized()
 	def waveform(self):
 		"""
 		A waveform acquired by the scope.
@@ -95,6 +113,15 @@ class Channel(AbstractSubdevice):
 		Values are returned in the format [(time1, value1), (time2, value2), ...].
 		"""
 
+		return waveform_pairs(*self.waveform_arrays)
+
+	@property
+	@Synchronized()
+	def waveform_arrays(self):
+		"""
+		A waveform acquired by the scope, as arrays of the time values in s and the amplitudes in V.
+		"""
+
 		self.device.status.append('Getting waveform for channel {0}'.format(self.channel))
 
 		try:
@@ -109,28 +136,28 @@ class Channel(AbstractSubdevice):
 			self.device.fastframe_start = frame
 			self.device.fastframe_stop = frame
 
-			# Receive in chunks.
+			# Receive in chunks, each straight into its place in the curve.
 			num_data_points = self.device.record_length
-			num_transmissions = int(ceil(num_data_points / self.device.max_receive_samples))
+			chunk_size = int(self.device.max_receive_samples)
+			num_transmissions = int(ceil(float(num_data_points) / chunk_size))
 
-			curve = []
-			for i in xrange(num_transmissions):
-				self.device.data_start = int(i * self.device.max_receive_samples) + 1
-				self.device.data_stop = int((i + 1) * self.device.max_receive_samples)
+			# Big-endian, as with the "!" format of struct.
+			format_code = self.device.byte_format_letters[self.device.waveform_bytes]
+			curve = empty(num_data_points, dtype=dtype('>' + format_code))
 
-				curve_raw = self.device.ask_raw('curve?')
-				curve.append(BlockData.from_block_data(curve_raw))
+			for i in xrange(num_transmissions):
+				self.device.data_start = i * chunk_size + 1
+				self.device.data_stop = (i + 1) * chunk_size
 
-			curve = ''.join(curve)
+				self.device.write('curve?')
+				self.device.read_block_into(curve[i * chunk_size:(i + 1) * chunk_size])
 
-			format_code = self.device.byte_format_letters[self.device.waveform_bytes]
-			curve_data = struct.unpack('!{0}{1}'.format(num_data_points, format_code), curve)
-
-			return self.transform_waveform(curve_data)
+			return self.transform_waveform(curve)
 		finally:
 			self.device.status.pop()
 
 	@property
+	@cached(settings_ttl)
 	@quantity_wrapped('V')
 	def scale(self):
 		"""
@@ -142,11 +169,13 @@ class Channel(AbstractSubdevice):
 		return float(self.device.ask('ch{0}:scale?'.format(self.channel)))
 
 	@scale.setter
+	@invalidates('scale')
 	@quantity_unwrapped('V')
 	def scale(self, value):
 		self.device.write('ch{0}:scale {1}'.format(self.channel, value))
 
 	@property
+	@cached(settings_ttl)
 	@quantity_wrapped('V')
 	def offset(self):
 		"""
@@ -156,11 +185,59 @@ class Channel(AbstractSubdevice):
 		return float(self.device.ask('ch{0}:offset?'.format(self.channel)))
 
 	@offset.setter
+	@invalidates('offset')
 	@quantity_unwrapped('V')
 	def offset(self, value):
 		self.device.write('ch{0}:offset {1}'.format(self.channel, value))
 
 
+class FramePrefetch(Thread):
+	"""
+	A thread which acquires frames from a DPO in the background.
+	"""
+
+	def __init__(self, device, channels=None, callback=None, *args, **kwargs):
+		"""
+		device: The DPO.
+		channels: Passed on to acquire_frames.
+		callback: Is called with the time values and the amplitudes once they have been transferred.
+		"""
+
+		Thread.__init__(self, *args, **kwargs)
+		self.daemon = True
+
+		self.device = device
+		self.channels = channels
+		self.callback = callback
+
+		self.result = None
+		self.error = None
+
+	def run(self):
+		try:
+			self.result = self.device.acquire_frames(self.channels)
+		except Exception as e:
+			# Reported by whoever calls get.
+			self.error = e
+
+			return
+
+		if self.callback is not None:
+			self.callback(*self.result)
+
+	def get(self):
+		"""
+		Wait for the transfer to finish, and return what acquire_frames would.
+		"""
+
+		self.join()
+
+		if self.error is not None:
+			raise self.error
+
+		return self.result
+
+
 class DPO7104(AbstractDevice):
 	"""
 	Interface for Tektronix DPO7104 DPO.
@@ -200,6 +277,7 @@ class DPO7104(AbstractDevice):
 
 		log.info('Resetting "{0}".'.format(self.name))
 		self.write('*rst')
+		self.cache.clear()
 
 	def autoset(self):
 		"""
@@ -207,6 +285,7 @@ class DPO7104(AbstractDevice):
 		"""
 
 		self.write('autoset execute')
+		self.cache.clear()
 
 	@property
 	def stopafter(self):
@@ -229,6 +308,7 @@ class DPO7104(AbstractDevice):
 		self.write('acquire:stopafter {0}'.format(value))
 
 	@property
+	@cached(settings_ttl)
 	def waveform_bytes(self):
 		"""
 		Number of bytes per data point in the acquired waveforms.
@@ -237,10 +317,12 @@ class DPO7104(AbstractDevice):
 		return int(self.ask('wfmoutpre:byt_nr?'))
 
 	@waveform_bytes.setter
+	@invalidates('waveform_bytes', 'value_range')
 	def waveform_bytes(self, value):
 		self.write('wfmoutpre:byt_nr {0}'.format(value))
 
 	@property
+	@cached(settings_ttl)
 	def value_range(self):
 		"""
 		Range of values possible for each data point.
@@ -266,6 +348,7 @@ class DPO7104(AbstractDevice):
 		self.write('acquire:state {0}'.format(str(int(value))))
 
 	@property
+	@cached(settings_ttl)
 	@quantity_wrapped('Hz')
 	def sample_rate(self):
 		"""
@@ -275,11 +358,13 @@ class DPO7104(AbstractDevice):
 		return float(self.ask('horizontal:mode:samplerate?'))
 
 	@sample_rate.setter
+	@invalidates('sample_rate', 'time_scale', 'record_length')
 	@quantity_unwrapped('Hz')
 	def sample_rate(self, value):
 		self.write('horizontal:mode:samplerate {0}'.format(value))
 
 	@property
+	@cached(settings_ttl)
 	@quantity_wrapped('s')
 	def time_scale(self):
 		"""
@@ -289,6 +374,7 @@ class DPO7104(AbstractDevice):
 		return float(self.ask('horizontal:divisions?')) * float(self.ask('horizontal:mode:scale?'))
 
 	@time_scale.setter
+	@invalidates('sample_rate', 'time_scale', 'record_length')
 	@quantity_unwrapped('s')
 	def time_scale(self, value):
 		self.write('horizontal:mode:scale {0}'.format(value / float(self.ask('horizontal:divisions?'))))
@@ -333,6 +419,7 @@ class DPO7104(AbstractDevice):
 		self.write('data:stop {0}'.format(value))
 
 	@property
+	@cached(settings_ttl)
 	def record_length(self):
 		"""
 		The number of data points in a waveform.
@@ -348,6 +435,69 @@ class DPO7104(AbstractDevice):
 
 		self.acquiring = True
 
+	@Synchronized()
+	def acquire_frames(self, channels=None):
+		"""
+		Transfer every acquired frame of several channels at once.
+
+		channels: Channel numbers; all the enabled channels by default.
+
+		Returns an array of the time values in s, and an array of the amplitudes in V, indexed by frame, channel
+		(in the order given) and sample.
+		"""
+
+		if channels is None:
+			channels = [chan for chan in xrange(1, 5) if self.channels[chan].enabled]
+
+		if not channels:
+			raise ValueError('No channels from which to acquire.')
+
+		self.status.append('Getting frames for channels {0}'.format(', '.join(str(chan) for chan in channels)))
+
+		try:
+			num_frames = self.fastframe_count if self.fastframe else 1
+			num_data_points = self.record_length
+
+			# Each channel is sent as a separate block, holding its frames one after the other.
+			format_code = self.byte_format_letters[self.waveform_bytes]
+			curves = empty((len(channels), num_frames, num_data_points), dtype=dtype('>' + format_code))
+
+			self.write('data:source {0}'.format(','.join('ch{0}'.format(chan) for chan in channels)))
+			self.data_start = 1
+			self.data_stop = num_data_points
+
+			# Receive as many whole frames at a time as allowed.
+			chunk_size = max(1, int(self.max_receive_samples) // (len(channels) * num_data_points))
+
+			for start in xrange(0, num_frames, chunk_size):
+				stop = min(start + chunk_size, num_frames)
+
+				self.fastframe_start = start + 1
+				self.fastframe_stop = stop
+
+				self.write('curve?')
+				self.read_blocks_into([curve[start:stop] for curve in curves])
+
+			values = empty((num_frames, len(channels), num_data_points))
+			for i, chan in enumerate(channels):
+				times, values[:, i] = self.channels[chan].transform_waveform(curves[i])
+
+			return times, values
+		finally:
+			self.status.pop()
+
+	def prefetch_frames(self, channels=None, callback=None):
+		"""
+		Like acquire_frames, but in the background.
+
+		Returns the started FramePrefetch.
+		"""
+
+		prefetch = FramePrefetch(self, channels, callback)
+		prefetch.start()
+
+		return prefetch
+
 	@property
 	def fastframe(self):
 		"""
@@ -59,6 +59,20 @@ class MockChannel(object):
 			self.markers.append(MockMarker())
 
 
+class MockSequenceElement(object):
+	"""
+	A mock entry in the sequence table.
+	"""
+
+	def __init__(self):
+		self.waveforms = {}
+		self.count = '1'
+		self.infinite = '0'
+		self.twait = '0'
+		self.goto_state = '0'
+		self.goto_index = '1'
+
+
 class MockAWG5014B(MockAbstractDevice, AWG5014B):
 	"""
 	Mock interface for Tektronix AWG5014B AWG.
@@ -82,6 +96,8 @@ class MockAWG5014B(MockAbstractDevice, AWG5014B):
 		self.mock_state['wlist'].append(Waveform('"predefined waveform"', 5))
 		self.mock_state['wlist'][0].data = list(xrange(5))
 
+		self.mock_state['sequence'] = []
+
 		self.mock_state['channels'] = [None] # There is no channel 0.
 		for _ in xrange(1, 5):
 			self.mock_state['channels'].append(MockChannel())
@@ -170,10 +186,48 @@ class MockAWG5014B(MockAbstractDevice, AWG5014B):
 						wave.marker1 = [1 if x & 2 ** 14 else 0 for x in data]
 						wave.marker2 = [1 if x & 2 ** 15 else 0 for x in data]
 
+					done = True
+				elif cmd[1] == 'waveform' and cmd[2] == 'length' and query:
+					result = str(self.find_wave(args).length)
 					done = True
 				elif cmd[1] == 'waveform' and cmd[2] == 'delete':
 					self.mock_state['wlist'].remove(self.find_wave(args))
 					done = True
+			elif cmd[0] == 'sequence':
+				sequence = self.mock_state['sequence']
+
+				if cmd[1] == 'length':
+					if query:
+						result = str(len(sequence))
+					else:
+						length = int(args)
+
+						del sequence[length:]
+						while len(sequence) < length:
+							sequence.append(MockSequenceElement())
+					done = True
+				elif cmd[1].startswith('element'):
+					element = sequence[int(cmd[1][7:]) - 1]
+
+					if cmd[2].startswith('waveform'):
+						chan = int(cmd[2][8:])
+
+						if query:
+							result = element.waveforms.get(chan, '""')
+						else:
+							element.waveforms[chan] = args
+						done = True
+					else:
+						attr = '_'.join(cmd[2:])
+						if attr.startswith('loop_'):
+							attr = attr[5:]
+
+						if hasattr(element, attr):
+							if query:
+								result = getattr(element, attr)
+							else:
+								setattr(element, attr, args)
+							done = True
 			elif cmd[0].startswith('source'):
 				source = int(cmd[0][6])
 				channel = self.mock_state['channels'][source]
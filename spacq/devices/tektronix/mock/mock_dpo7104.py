@@ -49,7 +49,7 @@ class MockDPO7104(MockAbstractDevice, DPO7104):
 
 		self.mock_state['data_start'] = 1
 		self.mock_state['data_stop'] = self._record_length
-		self.mock_state['data_source'] = 1
+		self.mock_state['data_source'] = [1]
 		self.mock_state['data_framestart'] = 1
 		self.mock_state['data_framestop'] = 1
 
@@ -118,6 +118,18 @@ class MockDPO7104(MockAbstractDevice, DPO7104):
 						else:
 							self.mock_state['fastframe'] = bool(int(args))
 						done = True
+					elif cmd[2] == 'count':
+						if query:
+							result = self.mock_state['fastframe_count']
+						else:
+							self.mock_state['fastframe_count'] = int(args)
+						done = True
+					elif cmd[2] == 'sumframe':
+						if query:
+							result = self.mock_state['fastframe_sum']
+						else:
+							self.mock_state['fastframe_sum'] = args
+						done = True
 			elif cmd[0] == 'data':
 				if cmd[1] == 'start':
 					if query:
@@ -133,9 +145,9 @@ class MockDPO7104(MockAbstractDevice, DPO7104):
 					done = True
 				elif cmd[1] == 'source':
 					if query:
-						result = 'ch{0}'.format(self.mock_state['data_source'])
+						result = ','.join('CH{0}'.format(ch) for ch in self.mock_state['data_source'])
 					else:
-						self.mock_state['data_source'] = int(args[2])
+						self.mock_state['data_source'] = [int(source.strip()[2]) for source in args.split(',')]
 					done = True
 				if cmd[1] == 'framestart':
 					if query:
@@ -151,9 +163,14 @@ class MockDPO7104(MockAbstractDevice, DPO7104):
 					done = True
 			elif cmd[0] == 'curve' and query:
 				num_points = self._record_length * self.mock_state['waveform_bytes']
-				ch = self.mock_state['data_source']
-				curve = [int(120 * sin(2 * ch * pi * x / num_points) + randint(-7, 7)) for x in xrange(num_points)]
-				result = BlockData.to_block_data(pack('!%db' % (num_points), *curve))
+				num_frames = self.mock_state['data_framestop'] - self.mock_state['data_framestart'] + 1
+
+				# One block per source, each containing all the frames.
+				blocks = []
+				for ch in self.mock_state['data_source']:
+					curve = [int(120 * sin(2 * ch * pi * x / num_points) + randint(-7, 7)) for x in xrange(num_points)]
+					blocks.append(BlockData.to_block_data(pack('!%db' % (num_points), *curve) * num_frames))
+				result = ';'.join(blocks)
 				done = True
 			elif cmd[0] == 'wfmoutpre':
 				if cmd[1] == 'byt_nr':
@@ -1,9 +1,10 @@
 import logging
 log = logging.getLogger(__name__)
 
-from nose.tools import eq_
-from numpy import linspace
+from nose.tools import assert_raises, eq_
+from numpy import linspace, nan
 from numpy.testing import assert_array_almost_equal
+from time import sleep
 from unittest import main
 
 from spacq.interface.units import Quantity
@@ -45,6 +46,18 @@ class AWG5014BTest(DeviceServerTestCase):
 		eq_(awg.channels[2].markers[1].low.value, -0.1)
 		eq_(awg.channels[2].markers[2].low.value, 0)
 
+	def testPackWaveform(self):
+		"""
+		Only values on [-1, 1] can be packed.
+		"""
+
+		awg = self.obtain_device()
+
+		eq_(len(awg.pack_waveform([-1.0, 0.0, 1.0])), 3)
+
+		for data in [[-1.5], [0.0, 2.0], [nan], [float('inf')]]:
+			assert_raises(ValueError, awg.pack_waveform, data)
+
 	def testScenario(self):
 		"""
 		Run through a simple scenario.
@@ -95,6 +108,7 @@ class AWG5014BTest(DeviceServerTestCase):
 
 		# Verify
 		eq_(awg.sampling_rate.value, 2e8)
+		assert awg.upload_rate > 0
 
 		eq_(awg.waveform_names, existing_waveforms + ['Channel 1', 'Test 2'])
 
@@ -128,5 +142,113 @@ class AWG5014BTest(DeviceServerTestCase):
 		assert awg.enabled
 
 
+	def testWaveformNames(self):
+		"""
+		Waveforms created by other clients show up once the cached names expire.
+		"""
+
+		awg = self.obtain_device()
+		awg.reset()
+
+		existing_waveforms = awg.waveform_names
+
+		# Behind the driver's back.
+		awg.write('wlist:waveform:new "External", 20, integer')
+		eq_(awg.waveform_names, existing_waveforms)
+
+		sleep(awg.waveform_names_ttl)
+		eq_(awg.waveform_names, existing_waveforms + ['External'])
+
+		awg.delete_waveform('External')
+		eq_(awg.waveform_names, existing_waveforms)
+
+	def testLoadWaveform(self):
+		"""
+		Only upload waveforms which are not already there.
+		"""
+
+		awg = self.obtain_device()
+		awg.reset()
+
+		data1 = linspace(-1.0, 1.0, 20)
+		data2 = linspace(1.0, -1.0, 20)
+		markers = {1: [True] * 10 + [False] * 10}
+
+		existing_waveforms = awg.waveform_names
+		awg.upload_cache.capacity = 50
+
+		awg.channels[1].load_waveform(data1, markers, name='Test')
+		name1 = awg.channels[1].waveform_name
+		assert name1.startswith('Test ')
+		eq_((awg.upload_cache.hits, awg.upload_cache.misses), (0, 1))
+
+		# Again.
+		awg.channels[2].load_waveform(data1, markers, name='Test')
+		eq_(awg.channels[2].waveform_name, name1)
+		eq_((awg.upload_cache.hits, awg.upload_cache.misses), (1, 1))
+
+		# Different markers.
+		awg.channels[2].load_waveform(data1, name='Test')
+		name2 = awg.channels[2].waveform_name
+		assert name2 != name1
+		eq_((awg.upload_cache.hits, awg.upload_cache.misses), (1, 2))
+
+		# No more room for the first one, but channel 1 is still playing it.
+		awg.channels[3].load_waveform(data2, name='Test')
+		name3 = awg.channels[3].waveform_name
+		assert name1 in awg.waveform_names
+		assert_array_almost_equal(awg.get_waveform(name3), data2, 4)
+
+		# Not any more.
+		del awg.channels[1].waveform_name
+		awg.channels[3].load_waveform(data2, name='Test')
+		eq_((awg.upload_cache.hits, awg.upload_cache.misses), (2, 3))
+		eq_(set(awg.waveform_names) - set(existing_waveforms), set([name2, name3]))
+
+		# Waveforms from an earlier session are reused.
+		awg.upload_cache.clear()
+		awg.channels[1].load_waveform(data1, name='Test')
+		eq_(awg.channels[1].waveform_name, name2)
+		eq_(awg.upload_cache.hits, 3)
+		eq_(set(awg.upload_cache.entries), set([name2, name3]))
+
+	def testSequence(self):
+		"""
+		Play waveforms from the sequencer.
+		"""
+
+		awg = self.obtain_device()
+		awg.reset()
+
+		idle = [0.0] * 250
+		bump = list(linspace(0.0, 0.5, 250))
+		markers = {1: [True] * 250}
+
+		awg.load_sequence([
+			({1: (bump, markers), 2: (idle, None)}, 1),
+			({1: (idle, None), 2: (idle, None)}, 1000),
+			({1: (bump, markers), 2: (bump, None)}, 1),
+		])
+
+		sequence = awg.sequence
+		eq_(len(sequence), 3)
+		eq_([element.repeat for element in sequence], [1, 1000, 1])
+		eq_([element.wait for element in sequence], [True, False, False])
+		eq_([element.goto for element in sequence], [None, None, 1])
+
+		# Shared waveforms are only stored once.
+		eq_(sequence[0].waveforms[1], sequence[2].waveforms[1])
+		eq_(sequence[1].waveforms[1], sequence[1].waveforms[2])
+		eq_(sequence[0].waveforms[2], sequence[1].waveforms[2])
+		eq_(len(set(name for element in sequence for name in element.waveforms.values())), 3)
+
+		assert_array_almost_equal(awg.get_waveform(sequence[0].waveforms[1]), linspace(0.0, 1.0, 250), 4)
+		eq_(awg.channels[1].amplitude.value, 0.5)
+		eq_(awg.run_mode, 'sequence')
+
+		awg.sequence = []
+		eq_(awg.sequence, [])
+
+
 if __name__ == '__main__':
 	main()
@@ -68,6 +68,13 @@ class DPO7104Test(DeviceServerTestCase):
 		eq_(len(ws[2]), 1e3)
 		eq_(len(ws[3]), 1e3)
 
+		# As separate arrays.
+		times, values = dpo.channels[1].waveform_arrays
+		eq_(len(times), 1e3)
+		eq_(len(values), 1e3)
+		eq_((times[0], times[-1]), (0, 1e1))
+		assert ((values >= -1.5) & (values <= 3.5)).all()
+
 		# Check the channels.
 		assert     dpo.channels[1].enabled
 		assert not dpo.channels[2].enabled
@@ -77,5 +84,39 @@ class DPO7104Test(DeviceServerTestCase):
 		assert all(x >= -1.5 and x <= 3.5 for w in ws for _, x in w)
 
 
+	def testFrames(self):
+		"""
+		Obtain all the frames of several channels at once.
+		"""
+
+		dpo = self.obtain_device()
+		dpo.reset()
+
+		dpo.autoset()
+
+		dpo.channels[4].enabled = True
+
+		dpo.time_scale = Quantity(100, 'ns')
+		dpo.sample_rate = Quantity(40, 'GHz')
+
+		dpo.fastframe = True
+		dpo.fastframe_count = 3
+		dpo.stopafter = 'sequence'
+
+		dpo.acquire()
+		times, values = dpo.acquire_frames([4, 1])
+
+		eq_(len(times), 4e3)
+		eq_(values.shape, (3, 2, 4e3))
+
+		# In the background, from the enabled channels.
+		prefetch = dpo.prefetch_frames()
+		times, values = prefetch.get()
+
+		eq_(len(times), 4e3)
+		eq_(values.shape, (3, 2, 4e3))
+		assert ((values >= -5) & (values <= 5)).all()
+
+
 if __name__ == '__main__':
 	main()
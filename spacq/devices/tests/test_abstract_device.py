@@ -1,9 +1,31 @@
-from nose.tools import eq_
+from nose.tools import assert_raises, eq_
+from numpy import arange, zeros
+import socket
 from unittest import main, TestCase
 
 from spacq.interface.resources import Resource
 
 from .. import abstract_device
+from ..mock.fake_instrument import Conditions, SocketInstrumentServer
+from ..mock.mock_abstract_device import MockAbstractDevice
+from ..tools import BlockData, BlockDataError
+
+
+class CannedDevice(MockAbstractDevice):
+	"""
+	A mock device which answers from a dictionary of canned responses, and remembers every message.
+	"""
+
+	def __init__(self, responses):
+		self.responses = responses
+		self.received = []
+
+		MockAbstractDevice.__init__(self)
+
+	def write(self, message, result=None, done=False):
+		self.received.append(message)
+
+		MockAbstractDevice.write(self, message, self.responses.get(message), True)
 
 
 class AbstractDeviceTest(TestCase):
@@ -83,6 +105,91 @@ class AbstractDeviceTest(TestCase):
 		else:
 			assert False, 'Expected DeviceNotFoundError.'
 
+	def testSocket(self):
+		"""
+		Converse with a fake instrument over a raw socket.
+		"""
+
+		payload = ''.join(chr(x % 256) for x in xrange(10000))
+		block = BlockData.to_block_data(payload)
+
+		mock = CannedDevice({
+			'*idn?': 'Fake,Instrument,0,0',
+			'*opc?': '1',
+			'curve?': block,
+			'short?': '#15ab\ncd',
+			'indefinite?': '#0xyz',
+			'pair?': '#12ab;#13cde',
+		})
+
+		# Dribble out large responses to exercise partial reads.
+		server = SocketInstrumentServer(mock, Conditions(throughput=1e5))
+		server.start()
+
+		dev = abstract_device.AbstractDevice(socket_address=server.address, socket_port=server.port)
+		eq_(dev.driver, abstract_device.drivers.socket)
+
+		eq_(dev.idn, 'Fake,Instrument,0,0')
+
+		# Whole response, including the header.
+		eq_(dev.ask_raw('curve?'), block)
+		eq_(dev.ask('*idn?'), 'Fake,Instrument,0,0')
+
+		# Payload only.
+		dev.write('curve?')
+		eq_(dev.read_block(), payload)
+
+		# Straight into a buffer.
+		buf = bytearray(len(payload) + 10)
+		dev.write('curve?')
+		eq_(dev.read_block_into(buf), len(payload))
+		eq_(str(buf[:len(payload)]), payload)
+
+		# Into a NumPy array of a wider type.
+		arr = zeros(len(payload) // 2, dtype='<u2')
+		dev.write('curve?')
+		eq_(dev.read_block_into(arr), len(payload))
+		eq_(list(arr[:5]), [0x0100, 0x0302, 0x0504, 0x0706, 0x0908])
+
+		# Newlines inside the payload.
+		dev.write('short?')
+		eq_(dev.read_block(), 'ab\ncd')
+		dev.write('indefinite?')
+		eq_(dev.read_block(), 'xyz')
+
+		# Several blocks at once.
+		bufs = [bytearray(2), bytearray(4)]
+		dev.write('pair?')
+		eq_(dev.read_blocks_into(bufs), [2, 3])
+		eq_([str(buf) for buf in bufs], ['ab', 'cde\x00'])
+
+		# Straight out of a buffer.
+		dev.write_block('data ', arange(3, 6, dtype='<u2'))
+		eq_(dev.ask('*opc?'), '1')
+
+		# Too small.
+		dev.write('short?')
+		assert_raises(BlockDataError, dev.read_block_into, bytearray(2))
+
+		dev.close()
+		server.stop()
+
+		eq_(mock.received, ['*idn?', 'curve?', '*idn?', 'curve?', 'curve?', 'curve?', 'short?', 'indefinite?',
+				'pair?', 'data #16\x03\x00\x04\x00\x05\x00', '*opc?', 'short?'])
+
+	def testSocketNotFound(self):
+		"""
+		Nothing is listening.
+		"""
+
+		server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		server.bind(('127.0.0.1', 0))
+		port = server.getsockname()[1]
+		server.close()
+
+		assert_raises(abstract_device.DeviceNotFoundError, abstract_device.AbstractDevice,
+				socket_address='127.0.0.1', socket_port=port)
+
 	def testFindResource(self):
 		"""
 		Attempt to find a resource.
@@ -1,6 +1,8 @@
-from nose.tools import eq_
+from nose.tools import assert_raises, eq_
+import numpy
 from unittest import main, TestCase
 
+from spacq.interface.units import IncompatibleDimensions, Quantity
 from spacq.tests.tool.box import AssertHandler
 
 from .. import tools
@@ -22,6 +24,144 @@ class StrToBoolTest(TestCase):
 		eq_(tools.str_to_bool('else!'), True)
 
 
+class QuantityWrappersTest(TestCase):
+	class Thing(object):
+		def __init__(self):
+			self.settings = self
+			self.units = 'mA'
+			self.written = []
+
+		@tools.converted_quantity_unwrapped('mA', 2.0)
+		def set_fixed(self, value):
+			self.written.append(value)
+
+		@tools.dynamic_converted_quantity_unwrapped('settings.units')
+		def set_dynamic(self, value):
+			self.written.append(value)
+
+		@tools.dynamic_quantity_wrapped('settings.units', 10.0)
+		def get_dynamic(self):
+			return 1.5
+
+	def testConversionFactor(self):
+		"""
+		Factors between units are found once.
+		"""
+
+		eq_(tools.conversion_factor('kA', 'mA'), 1e6)
+		eq_(tools.conversion_factor('kg.m.s-2', 'N'), 1.0)
+		assert ('kA', 'mA') in tools._conversion_factors
+
+		assert_raises(IncompatibleDimensions, tools.conversion_factor, 'A', 's')
+
+	def testConverted(self):
+		"""
+		Setters are given values in the requested units, which may change.
+		"""
+
+		thing = self.Thing()
+
+		thing.set_fixed(Quantity(1.5, 'A'))
+		thing.set_fixed(Quantity(0, 'uA'))
+		thing.set_dynamic(Quantity(-2, 'uA'))
+		thing.units = 'A'
+		thing.set_dynamic(Quantity(25, 'mA'))
+
+		eq_(thing.written, [3000.0, 0.0, -0.002, 0.025])
+		eq_(thing.get_dynamic(), Quantity(15, 'A'))
+
+		assert_raises(IncompatibleDimensions, thing.set_fixed, Quantity(1, 'V'))
+		assert_raises(IncompatibleDimensions, thing.set_dynamic, Quantity(1, 'V'))
+
+
+class CachedTest(TestCase):
+	class Thing(object):
+		def __init__(self):
+			self.cache = tools.ResourceCache()
+			self.reads = 0
+			self._value = 5
+
+		@property
+		@tools.cached()
+		def value(self):
+			self.reads += 1
+
+			return self._value
+
+		@value.setter
+		@tools.invalidates('value')
+		def value(self, v):
+			self._value = v
+
+		@property
+		@tools.cached(ttl=0)
+		def expired(self):
+			self.reads += 1
+
+			return self._value
+
+	def testCached(self):
+		"""
+		Repeated reads only reach the device once.
+		"""
+
+		thing = self.Thing()
+
+		eq_(thing.value, 5)
+		eq_(thing.value, 5)
+		eq_(thing.value, 5)
+
+		eq_(thing.reads, 1)
+		eq_(thing.cache.misses, 1)
+		eq_(thing.cache.hits, 2)
+
+		thing.cache.reset_counters()
+		eq_((thing.cache.hits, thing.cache.misses), (0, 0))
+
+	def testInvalidate(self):
+		"""
+		Writing and clearing forget the old value.
+		"""
+
+		thing = self.Thing()
+
+		eq_(thing.value, 5)
+		thing.value = 6
+		eq_(thing.value, 6)
+		eq_(thing.reads, 2)
+
+		thing._value = 7
+		eq_(thing.value, 6)
+		thing.cache.clear()
+		eq_(thing.value, 7)
+		eq_(thing.reads, 3)
+
+	def testTTL(self):
+		"""
+		Expired values are read again.
+		"""
+
+		thing = self.Thing()
+
+		eq_(thing.expired, 5)
+		eq_(thing.expired, 5)
+		eq_(thing.reads, 2)
+		eq_(thing.cache.hits, 0)
+
+	def testNoCache(self):
+		"""
+		Without a cache, always read.
+		"""
+
+		thing = self.Thing()
+		thing.cache = None
+
+		eq_(thing.value, 5)
+		thing.value = 6
+		eq_(thing.value, 6)
+		eq_(thing.reads, 2)
+
+
 class BlockDataTest(TestCase):
 	def testToAndFromBlockData(self):
 		"""
@@ -90,6 +230,40 @@ class BlockDataTest(TestCase):
 			else:
 				assert False, 'Expected BlockDataError.'
 
+	def testArrays(self):
+		"""
+		Conversions to and from NumPy arrays.
+		"""
+
+		values = numpy.array([0, 1, 2 ** 14, 2 ** 16 - 1], dtype='<u2')
+
+		header, payload = tools.BlockData.to_block_data_parts(values)
+		eq_(header, '#18')
+		eq_(payload.tobytes(), '\x00\x00\x01\x00\x00\x40\xff\xff')
+
+		block_data = header + payload.tobytes()
+		eq_(block_data, tools.BlockData.to_block_data(values.tostring()))
+		eq_(tools.BlockData.payload_bounds(block_data), (3, 11))
+
+		result = tools.BlockData.from_block_data_array(block_data, '<u2')
+		eq_(result.dtype, numpy.dtype('<u2'))
+		eq_(list(result), list(values))
+
+		eq_(list(tools.BlockData.from_block_data_array('#0\x01\x02\n', '>i2')), [258])
+
+		assert_raises(tools.BlockDataError, tools.BlockData.from_block_data_array, '#13abc', '<u2')
+
+	def testPayloadsBounds(self):
+		"""
+		Several blocks in one response.
+		"""
+
+		eq_(tools.BlockData.payloads_bounds('#12ab\n'), [(3, 5)])
+		eq_(tools.BlockData.payloads_bounds('#12ab;#13cde;#0fg\n'), [(3, 5), (9, 12), (15, 17)])
+
+		assert_raises(tools.BlockDataError, tools.BlockData.payloads_bounds, '#12ab;')
+		assert_raises(tools.BlockDataError, tools.BlockData.payloads_bounds, '#12ab;#15cde')
+
 
 class BinaryBinaryEncoderTest(TestCase):
 	def testEncodeDecode(self):
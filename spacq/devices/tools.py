@@ -2,7 +2,11 @@ import logging
 log = logging.getLogger(__name__)
 
 from functools import wraps
+import numpy
+from operator import attrgetter
 import string
+from threading import Lock
+from time import time
 
 from spacq.interface.units import Quantity
 
@@ -50,6 +54,30 @@ def quantity_unwrapped(units, multiplier=1.0):
 
 	return wrap
 
+# (from units, to units) -> conversion factor
+_conversion_factors = {}
+
+def conversion_factor(from_units, to_units):
+	"""
+	The factor by which to multiply a value in some units to obtain the value in other units.
+
+	The units must have the same dimensions.
+	"""
+
+	key = (from_units, to_units)
+
+	try:
+		return _conversion_factors[key]
+	except KeyError:
+		pass
+
+	from_q, to_q = Quantity(1.0, from_units), Quantity(1.0, to_units)
+	from_q.assert_dimensions(to_q)
+
+	result = _conversion_factors[key] = from_q.value / to_q.value
+
+	return result
+
 def converted_quantity_unwrapped(units, multiplier=1.0):
 	"""
 	A variation of quantity_unwrapped that extracts the value in the units provided, and then applies the multiplier
@@ -59,15 +87,9 @@ def converted_quantity_unwrapped(units, multiplier=1.0):
 	def wrap(f):
 		@wraps(f)
 		def wrapped(self, value):
-			value.assert_dimensions(units)
-			
-			# Perform conversion. Note that this is a bit of a trick. We must use a value of 1.0 because
-			# normalization messes up for Quantities with 0 magnitude.
-			new_value = Quantity(1.0, units)
-			new_value += value
-			new_value -= Quantity(1.0, units)
-			
-			return f(self, new_value.original_value * multiplier)
+			factor = conversion_factor(value.original_units, units)
+
+			return f(self, value.original_value * factor * multiplier)
 
 		return wrapped
 
@@ -82,14 +104,12 @@ def dynamic_quantity_wrapped(units_attr_string, multiplier=1.0):
 	Note: Will work on a chain of dotted attributes.
 	"""
 
+	get_units = attrgetter(units_attr_string)
+
 	def wrap(f):
 		@wraps(f)
 		def wrapped(self):
-			
-			units = reduce(getattr, units_attr_string.split('.'), self)
-#			units = getattr(self, units_attr_string)
-			
-			return Quantity(f(self) * multiplier, units)
+			return Quantity(f(self) * multiplier, get_units(self))
 
 		return wrapped
 
@@ -100,22 +120,137 @@ def dynamic_converted_quantity_unwrapped(units_attr_string, multiplier=1.0):
 	A variation of dynamic_quantity_unwrapped that will extract the units from an attribute of the device.
 	"""
 
+	get_units = attrgetter(units_attr_string)
+
 	def wrap(f):
 		@wraps(f)
 		def wrapped(self, value):
-			
-#			units = getattr(self, units_attr_string)
-			units = reduce(getattr, units_attr_string.split('.'), self)
-			
-			value.assert_dimensions(units)
-			
-			# Perform conversion. Note that this is a bit of a trick. We must use a value of 1.0 because
-			# normalization messes up for Quantities with 0 magnitude.
-			new_value = Quantity(1.0, units)
-			new_value += value
-			new_value -= Quantity(1.0, units)
-			
-			return f(self, new_value.original_value * multiplier)
+			factor = conversion_factor(value.original_units, get_units(self))
+
+			return f(self, value.original_value * factor * multiplier)
+
+		return wrapped
+
+	return wrap
+
+
+class ResourceCache(object):
+	"""
+	Remembered values of slow device properties.
+
+	Entries are keyed by the owning (sub)device and the property name, and expire after their TTL.
+	"""
+
+	def __init__(self):
+		self.lock = Lock()
+
+		# (owner, name) -> (value, expiry time or None)
+		self._entries = {}
+
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, owner, name):
+		"""
+		Return a tuple of whether a fresh value was found, and the value itself.
+		"""
+
+		with self.lock:
+			try:
+				value, expiry = self._entries[owner, name]
+			except KeyError:
+				self.misses += 1
+				return False, None
+
+			if expiry is not None and time() >= expiry:
+				del self._entries[owner, name]
+				self.misses += 1
+				return False, None
+
+			self.hits += 1
+			return True, value
+
+	def put(self, owner, name, value, ttl=None):
+		"""
+		Remember a value for ttl seconds, or until invalidated if ttl is None.
+		"""
+
+		expiry = time() + ttl if ttl is not None else None
+
+		with self.lock:
+			self._entries[owner, name] = (value, expiry)
+
+	def invalidate(self, owner, *names):
+		"""
+		Forget the values of the given properties of a (sub)device.
+		"""
+
+		with self.lock:
+			for name in names:
+				self._entries.pop((owner, name), None)
+
+	def clear(self):
+		"""
+		Forget everything, such as after a device reset.
+		"""
+
+		log.debug('Clearing resource cache.')
+
+		with self.lock:
+			self._entries.clear()
+
+	def reset_counters(self):
+		with self.lock:
+			self.hits = 0
+			self.misses = 0
+
+
+def cached(ttl=None):
+	"""
+	A decorator for getters whose device value rarely changes.
+
+	The value is kept in the device's ResourceCache for ttl seconds (forever if None), or until a setter decorated
+	with invalidates() writes to it. Values which can also be changed from the front panel or by other clients
+	should be given a finite ttl, since the driver never sees those changes.
+	"""
+
+	def wrap(f):
+		name = f.__name__
+
+		@wraps(f)
+		def wrapped(self):
+			cache = self.cache
+
+			if cache is None:
+				return f(self)
+
+			found, value = cache.get(self, name)
+
+			if not found:
+				value = f(self)
+				cache.put(self, name, value, ttl)
+
+			return value
+
+		return wrapped
+
+	return wrap
+
+def invalidates(*names):
+	"""
+	A decorator for setters (or other methods) which change the device values behind cached getters.
+
+	The named getters of the same (sub)device are forgotten once the method has been called.
+	"""
+
+	def wrap(f):
+		@wraps(f)
+		def wrapped(self, *args, **kwargs):
+			try:
+				return f(self, *args, **kwargs)
+			finally:
+				if self.cache is not None:
+					self.cache.invalidate(self, *names)
 
 		return wrapped
 
@@ -135,6 +270,16 @@ class BlockData(object):
 	Utility methods for conversion between binary and 488.2 block data.
 	"""
 
+	@staticmethod
+	def header(length):
+		"""
+		The definite-length 488.2 block header for a payload of the given number of bytes.
+		"""
+
+		length_length = len(str(length))
+
+		return '#{0}{1}'.format(length_length, length)
+
 	@staticmethod
 	def to_block_data(data):
 		"""
@@ -145,64 +290,148 @@ class BlockData(object):
 		Note: Does not produce indefinitely-formatted block data.
 		"""
 
-		log.debug('Converting to block data: {0!r}'.format(data))
+		log.debug('Converting {0} bytes to block data.'.format(len(data)))
 
-		length = len(data)
-		length_length = len(str(length))
+		return BlockData.header(len(data)) + data
+
+	@staticmethod
+	def to_block_data_parts(data):
+		"""
+		Like to_block_data, but without copying the payload.
+
+		Accepts a byte string or any buffer (eg. a NumPy array), and returns the header and a byte-addressed
+		memoryview of the payload, to be sent one after the other.
+		"""
+
+		view = memoryview(data)
+		if view.itemsize != 1 or view.ndim != 1:
+			view = memoryview(numpy.ascontiguousarray(data).view(numpy.uint8).reshape(-1))
+
+		log.debug('Converting {0} bytes to block data parts.'.format(len(view)))
 
-		return '#{0}{1}{2}'.format(length_length, length, data)
+		return BlockData.header(len(view)), view
 
 	@staticmethod
-	def from_block_data(block_data):
+	def payload_bounds(block_data):
 		"""
-		Extracts binary data from 488.2 block data.
+		Find where the payload lies in 488.2 block data.
 
 		As per section 7.7.6 of IEEE Std 488.2-1992.
+
+		Returns the start and end indices of the payload.
+		"""
+
+		data_start, data_end = BlockData._payload_bounds(block_data, 0)
+
+		if block_data[data_end:] not in ['', '\n']:
+			log.warning('Extra data ignored: {0!r}'.format(block_data[data_end:]))
+
+		return data_start, data_end
+
+	@staticmethod
+	def payloads_bounds(block_data, separator=';'):
+		"""
+		Like payload_bounds, but for several blocks joined by a separator, as in the response to a query
+		with several sources.
+
+		Returns a list of the start and end indices of each payload.
 		"""
 
-		log.debug('Converting from block data: {0!r}'.format(block_data))
+		result = []
+
+		pos = 0
+		while True:
+			data_start, data_end = BlockData._payload_bounds(block_data, pos)
+			result.append((data_start, data_end))
+
+			if block_data[data_end:data_end + 1] != separator:
+				break
+
+			pos = data_end + 1
+
+		if block_data[data_end:] not in ['', '\n']:
+			log.warning('Extra data ignored: {0!r}'.format(block_data[data_end:]))
+
+		return result
+
+	@staticmethod
+	def _payload_bounds(block_data, pos):
+		"""
+		Find where the payload lies in the block starting at pos, ignoring anything after it.
+		"""
 
 		# Must have at least "#0\n" or "#XX".
-		if len(block_data) < 3:
+		if len(block_data) - pos < 3:
 			raise BlockDataError('Not enough data.')
 
-		if block_data[0] != '#':
-			raise BlockDataError('Leading character is "{0}", not "#".'.format(block_data[0]))
+		if block_data[pos] != '#':
+			raise BlockDataError('Leading character is "{0}", not "#".'.format(block_data[pos]))
 
-		if block_data[1] == '0':
+		if block_data[pos + 1] == '0':
 			log.debug('Indefinite format.')
 
 			if block_data[-1] != '\n':
 				raise BlockDataError('Final character is "{0}", not NL.'.format(block_data[-1]))
 
-			return block_data[2:-1]
+			return pos + 2, len(block_data) - 1
 		else:
 			log.debug('Definite format.')
 
 			try:
-				length_length = int(block_data[1])
+				length_length = int(block_data[pos + 1])
 			except ValueError:
-				raise BlockDataError('Length length incorrectly specified: {0}'.format(block_data[1]))
+				raise BlockDataError('Length length incorrectly specified: {0}'.format(block_data[pos + 1]))
 
-			data_start = 2 + length_length
+			data_start = pos + 2 + length_length
 
 			if data_start > len(block_data):
 				raise BlockDataError('Not enough data.')
 
 			try:
-				length = int(block_data[2:data_start])
+				length = int(block_data[pos + 2:data_start])
 			except ValueError:
-				raise BlockDataError('Length incorrectly specified: {0}'.format(block_data[2:data_start]))
+				raise BlockDataError('Length incorrectly specified: {0}'.format(block_data[pos + 2:data_start]))
 
 			data_end = data_start + length
 
 			if data_end > len(block_data):
 				raise BlockDataError('Not enough data.')
-			elif data_end < len(block_data):
-				if block_data[data_end:] != '\n':
-					log.warning('Extra data ignored: {0!r}'.format(block_data[data_end:]))
 
-			return block_data[data_start:data_end]
+			return data_start, data_end
+
+	@staticmethod
+	def from_block_data(block_data):
+		"""
+		Extracts binary data from 488.2 block data.
+
+		As per section 7.7.6 of IEEE Std 488.2-1992.
+		"""
+
+		log.debug('Converting from {0} bytes of block data.'.format(len(block_data)))
+
+		data_start, data_end = BlockData.payload_bounds(block_data)
+
+		return block_data[data_start:data_end]
+
+	@staticmethod
+	def from_block_data_array(block_data, dtype):
+		"""
+		Like from_block_data, but decodes the payload as a read-only NumPy array of the given type.
+
+		The array shares memory with block_data, so the payload is never copied.
+		"""
+
+		log.debug('Converting from {0} bytes of block data to {1}.'.format(len(block_data), dtype))
+
+		data_start, data_end = BlockData.payload_bounds(block_data)
+		dtype = numpy.dtype(dtype)
+
+		if (data_end - data_start) % dtype.itemsize:
+			raise BlockDataError('Payload of {0} bytes is not a whole number of {1}.'.format(
+					data_end - data_start, dtype))
+
+		return numpy.frombuffer(block_data, dtype=dtype, count=(data_end - data_start) // dtype.itemsize,
+				offset=data_start)
 
 
 class BinaryEncoder(object):
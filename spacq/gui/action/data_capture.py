@@ -500,6 +500,8 @@ class DataCapturePanel(wx.Panel):
 		
 		# Check that all the condition arguments are compatible with one another.
 		
+		condition_resources_by_name = dict(flatten(condition_resources))
+		
 		for cvar in flatten(condition_variables):
 			
 			# Get a condition.
@@ -513,10 +515,10 @@ class DataCapturePanel(wx.Panel):
 				# If working with resources, use their values as the values, and make the resource available
 				
 				if cond.type1 == 'resource name':
-					resource1 = [resource for (name, resource) in flatten(condition_resources) if name == cond.arg1][0]
+					resource1 = condition_resources_by_name[cond.arg1]
 					value1 = resource1.value
 				if cond.type2 == 'resource name':
-					resource2 = [resource for (name, resource) in flatten(condition_resources) if name == cond.arg2][0]
+					resource2 = condition_resources_by_name[cond.arg2]
 					value2 = resource2.value
 				
 				# Check if the other argument is in the allowed values
@@ -89,6 +89,27 @@ class DeviceConfigPanel(wx.Panel):
 		self.request_address_input = IpAddrCtrl(self)
 		requests_sizer.Add(self.request_address_input, flag=wx.CENTER)
 
+		### Raw socket.
+		socket_static_box = wx.StaticBox(self)
+		socket_box = wx.StaticBoxSizer(socket_static_box, wx.VERTICAL)
+		address_sizer.Add(socket_box, proportion=1)
+
+		self.address_mode_socket = wx.RadioButton(self, label='Raw socket')
+		socket_box.Add(self.address_mode_socket)
+
+		socket_sizer = wx.FlexGridSizer(rows=2, cols=2, hgap=5)
+		socket_box.Add(socket_sizer, flag=wx.EXPAND)
+
+		socket_sizer.Add(wx.StaticText(self, label='IP address:'),
+				flag=wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT)
+		self.socket_address_input = IpAddrCtrl(self)
+		socket_sizer.Add(self.socket_address_input, flag=wx.CENTER)
+
+		socket_sizer.Add(wx.StaticText(self, label='Port:'),
+				flag=wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT)
+		self.socket_port_input = wx.SpinCtrl(self, min=1, max=65535, initial=5025)
+		socket_sizer.Add(self.socket_port_input, flag=wx.CENTER)
+
 		### GPIB.
 		self.gpib_static_box = wx.StaticBox(self)
 		gpib_box = wx.StaticBoxSizer(self.gpib_static_box, wx.VERTICAL)
@@ -172,6 +193,8 @@ class DeviceConfigPanel(wx.Panel):
 			return DeviceConfig.address_modes.gpib
 		elif self.address_mode_usb.Value:
 			return DeviceConfig.address_modes.usb
+		elif self.address_mode_socket.Value:
+			return DeviceConfig.address_modes.socket
 
 	def GetValue(self):
 		dev_cfg = DeviceConfig(name=self.name)
@@ -192,6 +215,14 @@ class DeviceConfigPanel(wx.Panel):
 		## Requests
 		dev_cfg.request_address = self.request_address_input.GetAddress()
 
+		## Raw socket.
+		possible_address = self.socket_address_input.GetAddress()
+		if self.socket_address_input.IsValid() and len(possible_address) > 6:
+			dev_cfg.socket_address = possible_address
+		else:
+			dev_cfg.socket_address = None
+		dev_cfg.socket_port = self.socket_port_input.Value
+
 		## GPIB.
 		dev_cfg.gpib_board = self.gpib_board_input.Value
 		dev_cfg.gpib_pad = self.gpib_pad_input.Value
@@ -227,6 +258,8 @@ class DeviceConfigPanel(wx.Panel):
 			self.address_mode_gpib.Value = True
 		elif dev_cfg.address_mode == DeviceConfig.address_modes.usb:
 			self.address_mode_usb.Value = True
+		elif dev_cfg.address_mode == DeviceConfig.address_modes.socket:
+			self.address_mode_socket.Value = True
 
 		## Ethernet.
 		if dev_cfg.ip_address:
@@ -240,6 +273,11 @@ class DeviceConfigPanel(wx.Panel):
 		if dev_cfg.request_address:
 			self.request_address_input.SetValue(dev_cfg.request_address)
 
+		## Raw socket.
+		if dev_cfg.socket_address:
+			self.socket_address_input.SetValue(dev_cfg.socket_address)
+		self.socket_port_input.Value = dev_cfg.socket_port
+
 		## GPIB.
 		self.gpib_board_input.Value = dev_cfg.gpib_board
 		self.gpib_pad_input.Value = dev_cfg.gpib_pad
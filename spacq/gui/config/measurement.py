@@ -112,7 +112,8 @@ class MeasurementConfigPanel(wx.Panel):
 		def transform(x):
 			# Close over self, so that updating scaling settings automatically takes effect.
 			return self.scaling_settings.transform(x)
-		wrapped_resource = resource.wrapped(self.scaling_wrap_token, transform)
+		# Scaling and offsetting keep the type and dimensions of the value.
+		wrapped_resource = resource.wrapped(self.scaling_wrap_token, transform, preserves_dimensions=True)
 
 		with self.global_store.lock:
 			del self.global_store.resources[name]
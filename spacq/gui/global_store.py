@@ -3,6 +3,7 @@ from threading import RLock
 from pubsub import pub
 import wx
 
+from spacq.interface.resources import ResourceRegistry
 from spacq.tool.box import PubDict
 
 """
@@ -24,4 +25,11 @@ class GlobalStore(object):
 		self.resources = PubDict(self.lock, send, 'resource')
 		self.variables = PubDict(self.lock, send, 'variable')
 
+		# Labelled resources by label and by path, following the devices and resources.
+		self.resource_registry = ResourceRegistry()
+		pub.subscribe(self.resource_registry.msg_device, 'device.added')
+		pub.subscribe(self.resource_registry.msg_device, 'device.removed')
+		pub.subscribe(self.resource_registry.msg_resource, 'resource.added')
+		pub.subscribe(self.resource_registry.msg_resource, 'resource.removed')
+
 		self.pulse_program = None
@@ -1,8 +1,21 @@
+import logging
+log = logging.getLogger(__name__)
+
+from hashlib import sha1
+import inspect
+import os
+import pickle
 from pyparsing import (alphanums, alphas, delimitedList, nums, CaselessLiteral, Combine,
 		Forward, Keyword, LineEnd, Literal, OneOrMore, Optional, ParseBaseException, ParseException,
 		ParserElement, QuotedString, SkipTo, StringEnd, Suppress, Word, ZeroOrMore)
+import stat
+import sys
+from threading import Lock
 
+from ... import VERSION
+from .. import units
 from ..units import Quantity
+from . import tree
 from .tool.box import find_location, format_error
 from .tree import (Acquire, Assignment, Attribute, Block, Declaration, Delay, Dictionary,
 		DictionaryItem, Loop, ParallelPulses, Pulse, PulseSequence, Variable)
@@ -38,12 +51,9 @@ def read_quantity(s, loc, toks):
 		raise ParseException(s, loc, e)
 
 
-def Parser(raw=False):
+def build_grammar():
 	"""
-	Create a pulse program parser.
-
-	If raw is True, returns the pyparsing parser object.
-	Otherwise, returns a function which takes a string and returns an AST.
+	Build the pyparsing grammar for pulse programs.
 	"""
 
 	old_whitespace = ParserElement.DEFAULT_WHITE_CHARS
@@ -149,17 +159,155 @@ def Parser(raw=False):
 		comment = Literal('#') + SkipTo(LineEnd())
 		parser.ignore(comment)
 
-		if raw:
-			return parser
-		else:
-			def parseString(s):
-				s = s.expandtabs()
-
-				try:
-					return parser.parseString(s)[0]
-				except ParseBaseException as e:
-					raise PulseSyntaxError([format_error(e.msg, *find_location(s, e.loc))])
-
-			return parseString
+		return parser
 	finally:
 		ParserElement.setDefaultWhitespaceChars(old_whitespace)
+
+
+# The grammar is only built once, the first time it is needed.
+grammar = None
+grammar_lock = Lock()
+
+
+def Parser(raw=False, cache=None):
+	"""
+	Get the pulse program parser.
+
+	If raw is True, returns the pyparsing parser object.
+	Otherwise, returns a function which takes a string and returns an AST, using the ASTCache if one is given.
+	"""
+
+	global grammar
+
+	with grammar_lock:
+		if grammar is None:
+			grammar = build_grammar()
+
+	if raw:
+		return grammar
+
+	def parseString(s):
+		s = s.expandtabs()
+
+		if cache is not None:
+			result = cache.get(s)
+
+			if result is not None:
+				return result
+
+		try:
+			result = grammar.parseString(s)[0]
+		except ParseBaseException as e:
+			raise PulseSyntaxError([format_error(e.msg, *find_location(s, e.loc))])
+
+		if cache is not None:
+			cache.put(s, result)
+
+		return result
+
+	return parseString
+
+
+def code_version(*modules):
+	"""
+	Identify the source code of some modules, falling back on the package version where it is not available.
+	"""
+
+	result = sha1()
+
+	for module in modules:
+		try:
+			result.update(inspect.getsource(module))
+		except (IOError, TypeError):
+			result.update(VERSION)
+
+	return result.hexdigest()
+
+
+class ASTCache(object):
+	"""
+	Parsed pulse programs stored on disk, by hash of their source.
+
+	Loading a pickle can run arbitrary code, so only files in a directory which nobody else can write to are used.
+	"""
+
+	# Trees from any other version of the grammar, the AST nodes, or the values in them are not used.
+	version = code_version(sys.modules[__name__], tree, units)
+
+	def __init__(self, directory=None):
+		if directory is None:
+			directory = os.path.join(os.path.expanduser('~'), '.cache', 'spacq', 'pulse_ast')
+
+		self.directory = directory
+
+	@staticmethod
+	def trusted(path):
+		"""
+		Whether a file or directory belongs to the current user, and nobody else can write to it.
+		"""
+
+		info = os.stat(path)
+
+		if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+			return False
+
+		return not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+	def path(self, s):
+		if isinstance(s, unicode):
+			s = s.encode('utf-8')
+
+		key = sha1('{0}\0{1}'.format(self.version, s)).hexdigest()
+
+		return os.path.join(self.directory, key)
+
+	def get(self, s):
+		"""
+		The AST for a program, or None if it has not been stored.
+		"""
+
+		path = self.path(s)
+
+		try:
+			if not (self.trusted(self.directory) and self.trusted(path)):
+				log.warning('Not using pulse program AST which others could have written: {0}'.format(path))
+
+				return None
+
+			with open(path, 'rb') as f:
+				return pickle.load(f)
+		except Exception:
+			# Missing, unreadable, or from an incompatible version of the code.
+			return None
+
+	def put(self, s, ast):
+		"""
+		Store the AST for a program, if possible.
+		"""
+
+		path = self.path(s)
+		temp_path = '{0}.{1}'.format(path, os.getpid())
+
+		try:
+			if not os.path.isdir(self.directory):
+				os.makedirs(self.directory, 0700)
+
+			if not self.trusted(self.directory):
+				log.warning('Not caching pulse program AST in directory which others can write to: {0}'.format(
+						self.directory))
+
+				return
+
+			# Only ever a new file, readable only by the current user.
+			fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0600)
+			with os.fdopen(fd, 'wb') as f:
+				pickle.dump(ast, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+			# Readers only ever see complete files.
+			os.rename(temp_path, path)
+		except (IOError, OSError, pickle.PicklingError) as e:
+			log.warning('Could not cache pulse program AST: {0}'.format(e))
+
+
+# Shared by all pulse programs.
+ast_cache = ASTCache()
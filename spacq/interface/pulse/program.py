@@ -1,8 +1,9 @@
-from copy import copy, deepcopy
+from copy import copy
 from os.path import basename, dirname
 
 from ..units import Quantity
-from .parser import Parser, PulseError, PulseSyntaxError
+from .parser import ast_cache, Parser, PulseError, PulseSyntaxError
+from .sequence import compile_sequence
 from .tree import Environment
 
 """
@@ -24,7 +25,7 @@ class Program(object):
 		"""
 
 		env = Environment()
-		ast = Parser()(s)
+		ast = Parser(cache=ast_cache)(s)
 
 		return Program(env, ast)
 
@@ -113,13 +114,51 @@ class Program(object):
 		self._env.dry_run = dry_run
 		self._env.missing_shapes = set()
 		self._env.errors = []
-		self._env.traverse_tree(self._ast)
+
+		if dry_run:
+			self._env.traverse_tree(self._ast)
+		else:
+			# Only the parts affected by changed values are generated again.
+			self._env.regenerate_waveforms(self._ast)
 
 		if self._env.errors:
 			raise PulseError(self._env.format_errors())
 
 		return self._env.waveforms
 
+	def generate_sequence(self, min_length=1, max_repeat=None):
+		"""
+		Generate the waveforms as a list of sequence Elements, storing loops and long delays only once.
+		"""
+
+		self._env.stage = self._env.stages.waveforms
+		self._env.dry_run = False
+		self._env.missing_shapes = set()
+		self._env.errors = []
+
+		self._env.sequencing = True
+		try:
+			self._env.traverse_tree(self._ast)
+		finally:
+			self._env.sequencing = False
+
+		if self._env.errors:
+			raise PulseError(self._env.format_errors())
+
+		return compile_sequence(self._env.generators, min_length, max_repeat)
+
+	def clone(self):
+		"""
+		Produce a copy object, which can be given its own values and generate its own waveforms.
+
+		The parsed and prepared program is shared, so any number of copies may exist at a time.
+		"""
+
+		result = copy(self)
+		result._env = self._env.clone()
+
+		return result
+
 	@property
 	def with_resources(self):
 		"""
@@ -128,10 +167,7 @@ class Program(object):
 		Note: Because the Resource objects must be shared between copies, there may only ever exist one copy at a time.
 		"""
 
-		result = copy(self)
-
-		# We plan to modify the values in the Environment.
-		result._env = deepcopy(self._env)
+		result = self.clone()
 
 		for parameter, label in self.resource_labels.items():
 			def setter(x, parameter=parameter):
@@ -0,0 +1,140 @@
+from collections import namedtuple
+from numpy import concatenate, tile
+
+from ..waveform import Marker, Waveform
+
+"""
+Compilation of generated waveforms into sequences for an AWG sequencer.
+"""
+
+
+# The waveforms (by output) for an element of a sequence, and how many times it is played.
+Element = namedtuple('Element', 'waveforms, repeat')
+
+
+def repeated(pieces, count):
+	"""
+	The waveform pieces played count times over.
+	"""
+
+	return dict((output, (tile(data, count), dict((num, tile(values, count)) for num, values in markers.items())))
+			for output, (data, markers) in pieces.items())
+
+
+def joined(pieces1, pieces2):
+	"""
+	The waveform pieces played one after the other.
+	"""
+
+	result = {}
+
+	for output, (data1, markers1) in pieces1.items():
+		data2, markers2 = pieces2[output]
+
+		result[output] = (concatenate((data1, data2)),
+				dict((num, concatenate((values, markers2[num]))) for num, values in markers1.items()))
+
+	return result
+
+
+def compile_sequence(generators, min_length=1, max_repeat=None):
+	"""
+	Turn the SequenceGenerators for all the outputs into a list of Elements.
+
+	Every element is at least min_length points long, unless the entire sequence is shorter than that, and is
+	played at most max_repeat times.
+	"""
+
+	outputs = sorted(generators)
+
+	if not outputs:
+		return []
+
+	# Every output must end at the same point, including any trailing markers.
+	end = max(generator.end for generator in generators.values())
+	for generator in generators.values():
+		generator.extend(0.0, end - generator.length)
+
+	sequences = dict((output, generators[output].sequence) for output in outputs)
+
+	structure = [(period, count) for _, period, count in sequences[outputs[0]]]
+	for output in outputs[1:]:
+		if [(period, count) for _, period, count in sequences[output]] != structure:
+			raise ValueError('Output "{0}" does not line up with output "{1}"'.format(output, outputs[0]))
+
+	marker_nums = dict((output, sorted(generators[output]._markers)) for output in outputs)
+	markers = dict((output, dict((num, generators[output]._get_marker(num, end)) for num in marker_nums[output]))
+			for output in outputs)
+
+	# Elements as [period, count, pieces], where the pieces map outputs to data and marker values for one period.
+	elements = []
+	position = 0
+
+	for i, (period, count) in enumerate(structure):
+		pieces = {}
+
+		for output in outputs:
+			start = sequences[output][i][0]
+			data = generators[output].stored_data[start:start + period]
+
+			pieces[output] = (data, dict((num, marker.window(position, period).expand())
+					for num, marker in markers[output].items()))
+
+		elements.append([period, count, pieces])
+		position += period * count
+
+	# Unroll short repeated periods until they are long enough.
+	unrolled = []
+
+	for period, count, pieces in elements:
+		if count > 1 and period < min_length:
+			factor = -(-min_length // period)
+
+			if count >= factor:
+				unrolled.append([period * factor, count // factor, repeated(pieces, factor)])
+				count %= factor
+
+			if count > 0:
+				unrolled.append([period * count, 1, repeated(pieces, count)])
+		else:
+			unrolled.append([period, count, pieces])
+
+	# Join consecutive stretches which are only played once.
+	joined_elements = []
+
+	for element in unrolled:
+		if joined_elements and joined_elements[-1][1] == 1 and element[1] == 1:
+			previous = joined_elements[-1]
+			joined_elements[-1] = [previous[0] + element[0], 1, joined(previous[2], element[2])]
+		else:
+			joined_elements.append(element)
+
+	# Lengthen any remaining short stretches with a period from a neighbour, which must be repeated.
+	i = 0
+	while i < len(joined_elements):
+		period, count, pieces = joined_elements[i]
+
+		if count == 1 and period < min_length:
+			if i + 1 < len(joined_elements):
+				following = joined_elements[i + 1]
+				joined_elements[i] = [period + following[0], 1, joined(pieces, following[2])]
+				following[1] -= 1
+			elif i > 0:
+				preceding = joined_elements[i - 1]
+				joined_elements[i] = [preceding[0] + period, 1, joined(preceding[2], pieces)]
+				preceding[1] -= 1
+
+		i += 1
+
+	result = []
+
+	for period, count, pieces in joined_elements:
+		waveforms = dict((output, Waveform(data, dict((num, Marker.from_values(values))
+				for num, values in marker_values.items()))) for output, (data, marker_values) in pieces.items())
+
+		while count > 0:
+			repeat = count if max_repeat is None else min(count, max_repeat)
+			result.append(Element(waveforms, repeat))
+			count -= repeat
+
+	return result
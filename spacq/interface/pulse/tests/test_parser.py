@@ -1,5 +1,9 @@
 from nose.tools import eq_
+import os
 from os import path
+import shutil
+import stat
+from tempfile import mkdtemp
 from unittest import main, TestCase
 
 from ...units import Quantity
@@ -297,5 +301,79 @@ class ParserTest(TestCase):
 				assert False, 'Expected ParseException'
 
 
+	def testSingleton(self):
+		"""
+		The grammar is only built once.
+		"""
+
+		assert parser.Parser(raw=True) is parser.Parser(raw=True)
+
+
+class ASTCacheTest(TestCase):
+	def setUp(self):
+		self.dir = mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testCache(self):
+		"""
+		Reuse parsed programs.
+		"""
+
+		cache = parser.ASTCache(path.join(self.dir, 'ast'))
+
+		with open(path.join(resource_dir, '01.pulse')) as f:
+			prog = f.read()
+
+		eq_(cache.get(prog), None)
+
+		ast = parser.Parser(cache=cache)(prog)
+		cached = cache.get(prog.expandtabs())
+		eq_(cached, ast)
+		assert cached is not ast
+
+		eq_(parser.Parser(cache=cache)(prog), ast)
+
+		# Different code.
+		cache.version = parser.code_version(parser)
+		eq_(cache.get(prog.expandtabs()), None)
+		del cache.version
+
+		# Damaged.
+		with open(cache.path(prog.expandtabs()), 'w') as f:
+			f.write('garbage')
+
+		eq_(cache.get(prog.expandtabs()), None)
+		eq_(parser.Parser(cache=cache)(prog), ast)
+
+		eq_(len(os.listdir(cache.directory)), 1)
+
+	def testPermissions(self):
+		"""
+		Files which others could have written are not loaded.
+		"""
+
+		cache = parser.ASTCache(path.join(self.dir, 'ast'))
+		prog = 'int x = 1'
+
+		ast = parser.Parser(cache=cache)(prog)
+		eq_(stat.S_IMODE(os.stat(cache.directory).st_mode), 0700)
+		eq_(stat.S_IMODE(os.stat(cache.path(prog)).st_mode), 0600)
+		eq_(cache.get(prog), ast)
+
+		os.chmod(cache.path(prog), 0666)
+		eq_(cache.get(prog), None)
+
+		os.chmod(cache.path(prog), 0600)
+		os.chmod(cache.directory, 0777)
+		eq_(cache.get(prog), None)
+
+		# Nor is anything stored there.
+		os.remove(cache.path(prog))
+		parser.Parser(cache=cache)(prog)
+		eq_(os.listdir(cache.directory), [])
+
+
 if __name__ == '__main__':
 	main()
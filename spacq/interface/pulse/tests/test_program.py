@@ -1,12 +1,16 @@
-from os import path
+from os import chdir, getcwd, path
 from nose.tools import assert_raises, eq_
+from numpy import concatenate, tile
 from numpy.testing import assert_array_almost_equal, assert_array_equal
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import main, TestCase
 
 from ...units import Quantity
+from ...waveform import Generator
 from ..parser import PulseSyntaxError
 
-from .. import program
+from .. import program, tree
 
 
 resource_dir = path.join(path.dirname(__file__), 'resources')
@@ -117,6 +121,158 @@ error: File "this-shape-doesn't-exist" (due to "wobble") not found at column 17
 		end = manipulator + [0.0] * 15
 		assert_array_almost_equal(f2.data, [0.0] * 10 + wobble + loop * 2 + [0.0] * 20 + end * 2, 2)
 
+	def testRegenerateWaveforms(self):
+		"""
+		Only generate again what has changed.
+		"""
+
+		def prepare(values=[]):
+			p = program.Program.from_file(path.join(resource_dir, '01.pulse'))
+
+			for name, value in self.missing + values:
+				p.set_value(name, value)
+
+			p.set_value(('wobble', 'shape'), 'non-square')
+			p.frequency = Quantity(1, 'GHz')
+
+			return p
+
+		p = prepare()
+		p.generate_waveforms()
+		rendered = p._env.segments_rendered
+
+		# Nothing changed.
+		p.generate_waveforms()
+		eq_(p._env.segments_rendered, rendered)
+
+		# Only rescaled.
+		p.set_value(('first_square', 'amplitude'), Quantity(0.25, 'V'))
+		p.generate_waveforms()
+		eq_(p._env.segments_rendered, rendered)
+
+		# Repeatedly, without any drift.
+		for amplitude in [0.3, -0.7, 0.123456, 0.9]:
+			p.set_value(('first_square', 'amplitude'), Quantity(amplitude, 'V'))
+			p.generate_waveforms()
+		p.set_value(('first_square', 'amplitude'), Quantity(0.25, 'V'))
+		rescaled = p.generate_waveforms()
+		eq_(p._env.segments_rendered, rendered)
+
+		fresh = prepare([(('first_square', 'amplitude'), Quantity(0.25, 'V'))]).generate_waveforms()
+		for output in ['f1', 'f2']:
+			assert_array_equal(rescaled[output].data, fresh[output].data)
+
+		# Used by two commands.
+		p.set_value(('wobble', 'length'), Quantity(4, 'ns'))
+		waveforms = p.generate_waveforms()
+		eq_(p._env.segments_rendered, rendered + 2)
+
+		expected = prepare([(('first_square', 'amplitude'), Quantity(0.25, 'V')),
+				(('wobble', 'length'), Quantity(4, 'ns'))]).generate_waveforms()
+
+		for output in ['f1', 'f2']:
+			assert_array_almost_equal(waveforms[output].data, expected[output].data)
+			eq_(waveforms[output].markers, expected[output].markers)
+
+	def testRegenerateShapedWaveforms(self):
+		"""
+		Changing the amplitude of a shaped pulse gives the same waveforms as generating them from scratch.
+		"""
+
+		def prepare(amplitude):
+			p = program.Program.from_file(path.join(resource_dir, '01.pulse'))
+
+			for name, value in self.missing:
+				p.set_value(name, value)
+
+			p.set_value(('wobble', 'shape'), 'non-square')
+			p.set_value(('wobble', 'amplitude'), amplitude)
+			p.frequency = Quantity(1, 'GHz')
+
+			return p
+
+		p = prepare(Quantity(-1, 'mV'))
+		p.generate_waveforms()
+
+		for amplitude in [Quantity(-0.3, 'V'), Quantity(0.7123, 'V')]:
+			p.set_value(('wobble', 'amplitude'), amplitude)
+			waveforms = p.generate_waveforms()
+			fresh = prepare(amplitude).generate_waveforms()
+
+			for output in ['f1', 'f2']:
+				assert_array_equal(waveforms[output].data, fresh[output].data)
+
+	def testShapeAppears(self):
+		"""
+		A shape file which appears where one was not found is noticed.
+		"""
+
+		prog = """
+			pulse bump = {shape: 'shape', amplitude: 1 V, length: 4 ns}
+			output f1
+
+			bump:f1
+		"""
+
+		old_cwd = getcwd()
+		process_dir, program_dir = mkdtemp(), mkdtemp()
+
+		try:
+			chdir(process_dir)
+
+			with open('shape', 'w') as f:
+				f.write('0.5, 0.5\n')
+
+			p = program.Program.from_string(prog)
+			p._env.cwd = program_dir
+			p.frequency = Quantity(1, 'GHz')
+
+			assert_array_almost_equal(p.generate_waveforms()['f1'].data, [0.5] * 4)
+			rendered = p._env.segments_rendered
+
+			p.generate_waveforms()
+			eq_(p._env.segments_rendered, rendered)
+
+			# Takes precedence over the first one.
+			with open(path.join(program_dir, 'shape'), 'w') as f:
+				f.write('1.0, 1.0\n')
+
+			assert_array_almost_equal(p.generate_waveforms()['f1'].data, [1.0] * 4)
+			eq_(p._env.segments_rendered, rendered + 1)
+		finally:
+			chdir(old_cwd)
+			rmtree(process_dir)
+			rmtree(program_dir)
+
+	def testClone(self):
+		"""
+		Copies have their own values and waveforms.
+		"""
+
+		p = program.Program.from_file(path.join(resource_dir, '01.pulse'))
+
+		for name, value in self.missing:
+			p.set_value(name, value)
+
+		p.set_value(('wobble', 'shape'), 'non-square')
+		p.frequency = Quantity(1, 'GHz')
+
+		f1 = p.generate_waveforms()['f1'].data.copy()
+		rendered = p._env.segments_rendered
+
+		copies = [p.clone() for _ in xrange(3)]
+		for i, copy in enumerate(copies):
+			copy.set_value(('first_square', 'amplitude'), Quantity(i, 'V'))
+
+		for i, copy in enumerate(copies):
+			assert copy._ast is p._ast
+			eq_(copy.generate_waveforms()['f1'].data[10], i)
+
+		# The original is untouched.
+		eq_(p.values[('first_square', 'amplitude')], Quantity(0.5, 'V'))
+		assert_array_equal(p.generate_waveforms()['f1'].data, f1)
+		eq_(p._env.segments_rendered, rendered)
+
 	def testWaveformsDryRun(self):
 		"""
 		Run through waveform generation, but don't actually generate anything.
@@ -147,6 +303,114 @@ error: File "this-shape-doesn't-exist" (due to "wobble") not found at column 17
 		eq_(list(waveforms['f2'].data), [])
 		eq_(waveforms['f2'].markers, {})
 
+	def testTiledLoop(self):
+		"""
+		Loops are copied once their iterations settle, without changing the result.
+		"""
+
+		prog = """
+			int bumps = 5
+			delay spacing = 3 ns
+			pulse bump = {shape: 'square', amplitude: 0.5 V, length: 2 ns}
+			output f1, f2
+
+			times bumps {
+				times 4 {
+					bump:f1
+					spacing
+				}
+				bump:f2
+			}
+		"""
+
+		def generate(min_tiled):
+			p = program.Program.from_string(prog)
+			p.frequency = Quantity(1, 'GHz')
+
+			old_min_tiled = tree.Loop.min_tiled
+			tree.Loop.min_tiled = min_tiled
+			try:
+				return p.generate_waveforms(), p._env.generators
+			finally:
+				tree.Loop.min_tiled = old_min_tiled
+
+		tiled, generators = generate(3)
+		unrolled, _ = generate(1e9)
+
+		for output in ['f1', 'f2']:
+			eq_(len(tiled[output].data), 5 * 27)
+			assert_array_equal(tiled[output].data, unrolled[output].data)
+
+			# The inner loop is only repeated within the first outer iteration.
+			eq_(generators[output].sequence, [(0, 6, 1), (6, 6, 3), (24, 3, 1), (27, 27, 4)])
+
+	def testGenerateSequence(self):
+		"""
+		Generate a sequence, which plays out to the same waveforms.
+		"""
+
+		prog = """
+			delay spacing = 3 ns, wait = 50 us
+			pulse bump = {shape: 'square', amplitude: 0.5 V, length: 2 ns}
+			output f1, f2
+
+			bump:f1
+			acquire
+			times 10000 {
+				bump:f1 bump:f2
+				spacing
+			}
+			wait
+			bump:f2
+		"""
+
+		p = program.Program.from_string(prog)
+		p.set_value(('_acq_marker', 'marker_num'), 1)
+		p.set_value(('_acq_marker', 'output'), 'f1')
+		p.frequency = Quantity(1, 'GHz')
+
+		waveforms = p.generate_waveforms()
+		sequence = p.generate_sequence(min_length=250, max_repeat=100)
+
+		for element in sequence:
+			assert len(element.waveforms['f1'].data) >= 250
+			assert element.repeat <= 100
+
+		# Much less is stored than is played.
+		stored = sum(len(element.waveforms['f1'].data) for element in sequence)
+		assert stored < len(waveforms['f1'].data) / 10
+
+		for output in ['f1', 'f2']:
+			played = concatenate([tile(element.waveforms[output].data, element.repeat) for element in sequence])
+			assert_array_equal(played, waveforms[output].data)
+
+		played = concatenate([tile(element.waveforms['f1'].markers[1], element.repeat) for element in sequence])
+		eq_(list(played), list(waveforms['f1'].markers[1]))
+
+	def testGrowingWaveform(self):
+		"""
+		Generate a waveform much longer than the initial buffer.
+		"""
+
+		p = program.Program.from_string("""
+			delay spacing = 100 ns
+			pulse bump = {shape: 'square', amplitude: 0.5 V, length: 99 ns}
+			output f1
+
+			times 100 {
+				bump:f1
+				spacing
+			}
+		""")
+
+		p.frequency = Quantity(1, 'GHz')
+
+		f1 = p.generate_waveforms()['f1'].data
+		eq_(f1.dtype, 'float32')
+		eq_(len(f1), 100 * 200)
+		assert len(f1) > 4 * Generator.initial_capacity
+		assert_array_equal(f1, ([0.5] * 99 + [0.0] * 101) * 100)
+
 
 if __name__ == '__main__':
 	main()
@@ -1,4 +1,8 @@
+from collections import OrderedDict
 import csv
+from numpy import array, interp, linspace, load
+import os
+from threading import Lock
 
 from spacq.tool.box import flatten
 
@@ -63,3 +67,114 @@ def load_values(f):
 
 	# Ignore blank lines.
 	return [float(x) for x in flatten(reader) if not x.isspace()]
+
+
+class ShapeCache(object):
+	"""
+	Shapes loaded from files, and their resamplings, kept for as long as the files are unchanged.
+	"""
+
+	# Binary (.npy) shapes larger than this are memory-mapped rather than read.
+	mmap_threshold = 1 << 24 # B
+
+	# The number of resamplings to keep.
+	max_resamplings = 256
+
+	def __init__(self):
+		self.lock = Lock()
+
+		# Resolved paths and modification times (keys), and their shapes.
+		self.shapes = {}
+		# Keys and numbers of points, and the shapes resampled to them; least recently used first.
+		self.resamplings = OrderedDict()
+
+	def key(self, path):
+		"""
+		Identify the current version of a shape file, or None if it does not exist.
+		"""
+
+		path = os.path.realpath(path)
+
+		try:
+			return (path, os.path.getmtime(path))
+		except OSError:
+			return None
+
+	def load(self, path):
+		"""
+		Load the shape from a file, as a read-only array.
+
+		Returns the shape and its key. Like opening and using load_values, raises IOError or ValueError.
+		"""
+
+		key = self.key(path)
+		if key is None:
+			raise IOError('No such file: {0}'.format(path))
+
+		with self.lock:
+			try:
+				return self.shapes[key], key
+			except KeyError:
+				pass
+
+		resolved_path = key[0]
+
+		if resolved_path.endswith('.npy'):
+			large = os.path.getsize(resolved_path) > self.mmap_threshold
+			data = load(resolved_path, mmap_mode=('r' if large else None))
+		else:
+			with open(resolved_path) as f:
+				data = array(load_values(f))
+
+		data.flags.writeable = False
+
+		with self.lock:
+			# Forget any older versions.
+			for old_key in [k for k in self.shapes if k[0] == resolved_path]:
+				del self.shapes[old_key]
+			for old_key in [k for k in self.resamplings if k[0] == key[0]]:
+				del self.resamplings[old_key]
+
+			self.shapes[key] = data
+
+		return data, key
+
+	def resample(self, key, data, points):
+		"""
+		Interpolate a shape loaded with the given key onto a number of points.
+		"""
+
+		resampling_key = key + (points,)
+
+		with self.lock:
+			try:
+				result = self.resamplings.pop(resampling_key)
+			except KeyError:
+				pass
+			else:
+				self.resamplings[resampling_key] = result
+
+				return result
+
+		if len(data) == 0:
+			return data
+
+		result = interp(linspace(0, 1, points), linspace(0, 1, len(data)), data)
+		result.flags.writeable = False
+
+		with self.lock:
+			self.resamplings[resampling_key] = result
+
+			while len(self.resamplings) > self.max_resamplings:
+				self.resamplings.popitem(last=False)
+
+		return result
+
+	def clear(self):
+		with self.lock:
+			self.shapes.clear()
+			self.resamplings.clear()
+
+
+# Shared by all pulse programs.
+shape_cache = ShapeCache()
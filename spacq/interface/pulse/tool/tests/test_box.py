@@ -1,5 +1,9 @@
 from nose.tools import assert_raises, eq_
+from numpy import arange, save
+import os
+import shutil
 from StringIO import StringIO
+from tempfile import mkdtemp
 from unittest import main, TestCase
 
 from .. import box
@@ -94,5 +98,85 @@ class LoadValuesTest(TestCase):
 		eq_(result, [1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
 
 
+class ShapeCacheTest(TestCase):
+	def setUp(self):
+		self.dir = mkdtemp()
+		self.cache = box.ShapeCache()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testLoad(self):
+		"""
+		Load a text shape, reusing it until the file changes.
+		"""
+
+		path = os.path.join(self.dir, 'shape')
+		with open(path, 'w') as f:
+			f.write('0.0,1.0,0.5')
+
+		data, key = self.cache.load(path)
+		eq_(list(data), [0.0, 1.0, 0.5])
+		assert not data.flags.writeable
+
+		data2, key2 = self.cache.load(path)
+		assert data2 is data
+		eq_(key2, key)
+
+		with open(path, 'w') as f:
+			f.write('1.0,2.0')
+		os.utime(path, (0, 0))
+
+		data3, key3 = self.cache.load(path)
+		eq_(list(data3), [1.0, 2.0])
+		assert key3 != key
+		eq_(self.cache.key(path), key3)
+
+		assert_raises(IOError, self.cache.load, os.path.join(self.dir, 'missing'))
+
+		with open(path, 'w') as f:
+			f.write('1.0,x')
+		os.utime(path, (1, 1))
+
+		assert_raises(ValueError, self.cache.load, path)
+
+	def testLoadBinary(self):
+		"""
+		Load a NumPy shape, with and without memory mapping.
+		"""
+
+		path = os.path.join(self.dir, 'shape.npy')
+		save(path, arange(100, dtype=float))
+
+		data, _ = self.cache.load(path)
+		eq_(list(data), range(100))
+
+		self.cache.clear()
+		self.cache.mmap_threshold = 0
+
+		data, _ = self.cache.load(path)
+		eq_(list(data), range(100))
+		assert not data.flags.writeable
+
+	def testResample(self):
+		"""
+		Resample a shape, reusing the result.
+		"""
+
+		path = os.path.join(self.dir, 'shape')
+		with open(path, 'w') as f:
+			f.write('0.0,1.0')
+
+		data, key = self.cache.load(path)
+
+		result = self.cache.resample(key, data, 5)
+		eq_(list(result), [0.0, 0.25, 0.5, 0.75, 1.0])
+		assert self.cache.resample(key, data, 5) is result
+
+		self.cache.max_resamplings = 1
+		self.cache.resample(key, data, 3)
+		assert self.cache.resample(key, data, 5) is not result
+
+
 if __name__ == '__main__':
 	main()
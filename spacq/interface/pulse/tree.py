@@ -1,13 +1,16 @@
 import logging
 log = logging.getLogger(__name__)
 
+from copy import copy
+from numpy import where
 from os import path
+from pyparsing import ParseResults
 
 from spacq.tool.box import Enum
 
 from ..units import IncompatibleDimensions, Quantity
-from ..waveform import Generator
-from .tool.box import find_location, format_error, load_values
+from ..waveform import Generator, SequenceGenerator
+from .tool.box import find_location, format_error, shape_cache
 
 """
 Abstract syntax tree bits for pulse programs.
@@ -31,6 +34,96 @@ def draw_thing(thing, depth):
 	return ' ' * depth + result
 
 
+def same_value(a, b):
+	"""
+	Whether two values are exactly the same, unlike the approximate comparison of quantities.
+	"""
+
+	if isinstance(a, Quantity) and isinstance(b, Quantity):
+		return a.value == b.value and a.dimension_signature == b.dimension_signature
+	else:
+		return type(a) == type(b) and a == b
+
+
+class Segment(object):
+	"""
+	The part of each waveform generated by a top-level command, along with everything it depended on.
+	"""
+
+	def __init__(self, initial_values, values_read, amplitudes_read, shaped_outputs, shapes_read, generators):
+		# The last value of each output before the command.
+		self.initial_values = initial_values
+		# The values used, and the amplitudes used by each output.
+		self.values_read = values_read
+		self.amplitudes_read = amplitudes_read
+		# The outputs with any pulses which are not square.
+		self.shaped_outputs = shaped_outputs
+		# The versions of the shape files used.
+		self.shapes_read = shapes_read
+
+		self.data = {}
+		self.markers = {}
+		self.repeats = {}
+		self.final_values = {}
+
+		for output, generator in generators.items():
+			self.data[output] = generator._wave[:generator.stored].copy()
+			self.markers[output] = dict((num, sorted(data.items())) for num, data in generator._markers.items())
+			self.repeats[output] = list(generator.repeats)
+			self.final_values[output] = generator.last_value
+
+		# Rescaling always starts from the original render.
+		self.rendered_data = dict(self.data)
+		self.rendered_values = dict(values_read)
+
+	def reusable(self, values, initial_values):
+		"""
+		Whether the segment still holds given the current values, rescaling it if only amplitudes have changed.
+		"""
+
+		if initial_values != self.initial_values:
+			return False
+
+		if any(shape_cache.key(p) != key for p, key in self.shapes_read.items()):
+			return False
+
+		changed = set(key for key, value in self.values_read.items() if not same_value(values.get(key), value))
+
+		if not changed:
+			return True
+		elif any(key[-1] != 'amplitude' for key in changed):
+			return False
+
+		# Each output must be made up of square pulses of a single amplitude. Shaped pulses are rounded when
+		# rendered, so rescaling them would not match a fresh render.
+		amplitudes = {}
+		for output, keys in self.amplitudes_read.items():
+			if not keys & changed:
+				continue
+
+			if len(keys) != 1 or output in self.shaped_outputs or self.initial_values[output] != 0:
+				return False
+
+			key, = keys
+			if self.rendered_values[key].value == 0:
+				return False
+
+			amplitudes[output] = values[key].value
+
+		for output, amplitude in amplitudes.items():
+			# Every point is either zero or the amplitude.
+			rendered = self.rendered_data[output]
+			data = where(rendered != 0, amplitude, 0.0).astype(rendered.dtype)
+
+			self.data[output] = data
+			self.final_values[output] = data[-1] if len(data) else self.initial_values[output]
+
+		for key in changed:
+			self.values_read[key] = values[key]
+
+		return True
+
+
 class Environment(object):
 	"""
 	An AST-traversal environment.
@@ -70,6 +163,9 @@ class Environment(object):
 		# Whether to actually generate waveforms.
 		self.dry_run = False
 
+		# Whether to generate waveforms for a sequencer, storing repeated parts only once.
+		self.sequencing = False
+
 		# Waveform generators for the output channels.
 		# Keys are output names.
 		self.generators = {}
@@ -86,6 +182,42 @@ class Environment(object):
 		# Default frequency.
 		self.frequency = Quantity(1, 'Hz')
 
+		# Segments from the last generation, by position of the top-level command, and their frequency.
+		self.segments = {}
+		self.segments_frequency = None
+		self.segments_rendered = 0
+
+		# What has been read while generating a segment.
+		self.values_read = None
+		self.amplitudes_read = None
+		self.shaped_outputs = None
+		self.shapes_read = None
+
+	def clone(self):
+		"""
+		A copy which shares everything determined while preparing the program, but has its own values and
+		generates its own waveforms.
+
+		Values are never modified in place, only replaced, so the copy can share them all with the original.
+		"""
+
+		result = copy(self)
+
+		result.stack = []
+		result.values = dict(self.values)
+		result.errors = []
+
+		result.generators = dict.fromkeys(self.generators)
+		result.waveforms = dict.fromkeys(self.waveforms)
+		result.missing_shapes = set()
+
+		# Segments are rescaled in place, so they cannot be shared.
+		result.segments = {}
+		result.segments_frequency = None
+		result.segments_rendered = 0
+
+		return result
+
 	@property
 	def missing_values(self):
 		existing_values = set(self.values.keys())
@@ -111,8 +243,10 @@ class Environment(object):
 				raise ValueError('Cannot generate waveforms while values are missing: {0}'.format(values))
 
 			# Set up output waveform generators.
+			generator_class = SequenceGenerator if self.sequencing else Generator
+
 			for output in self.waveforms:
-				self.generators[output] = Generator(frequency=self.frequency, dry_run=self.dry_run)
+				self.generators[output] = generator_class(frequency=self.frequency, dry_run=self.dry_run)
 
 	def post_stage(self):
 		"""
@@ -136,7 +270,7 @@ class Environment(object):
 						self.all_values.add((name, attr))
 				elif type != 'output':
 					self.all_values.add((name,))
-		elif self.stage == self.stages.waveforms:
+		elif self.stage == self.stages.waveforms and not self.sequencing:
 			# Finalize waveform creation.
 			for output in self.generators:
 				self.waveforms[output] = self.generators[output].waveform
@@ -191,6 +325,18 @@ class Environment(object):
 		else:
 			self.values[target] = value
 
+	def value(self, key):
+		"""
+		Get a value while generating waveforms, noting that it was used.
+		"""
+
+		result = self.values[key]
+
+		if self.values_read is not None:
+			self.values_read[key] = result
+
+		return result
+
 	def traverse_tree(self, root):
 		"""
 		Modify the Environment, given a pulse program AST.
@@ -200,6 +346,94 @@ class Environment(object):
 		root.visit(self)
 		self.post_stage()
 
+	def regenerate_waveforms(self, root):
+		"""
+		Equivalent to traverse_tree for the waveforms stage, but only generate again the parts of the waveforms
+		produced by top-level commands whose values have changed since the last time.
+		"""
+
+		self.pre_stage()
+
+		outputs = list(self.generators)
+
+		if self.segments_frequency is None or not same_value(self.frequency, self.segments_frequency):
+			self.segments = {}
+			self.segments_frequency = self.frequency
+
+		initial_values = dict((output, 0.0) for output in outputs)
+		segments = []
+
+		for i, item in enumerate(root.items):
+			segment = self.segments.get(i)
+
+			if segment is None or not segment.reusable(self.values, initial_values):
+				segment = self.generate_segment(root, item, outputs, initial_values)
+
+				if segment is None:
+					# Nothing to salvage.
+					self.segments.pop(i, None)
+					continue
+
+				self.segments[i] = segment
+
+			segments.append(segment)
+			initial_values = segment.final_values
+
+		# Splice the segments together.
+		for output in outputs:
+			generator = Generator(frequency=self.frequency)
+			generator.check_length(sum(len(segment.data[output]) for segment in segments))
+
+			for segment in segments:
+				offset = generator.length
+
+				for num, data in segment.markers[output].items():
+					for pos, value in data:
+						generator._markers.setdefault(num, {})[offset + pos] = value
+
+				for start, period, count in segment.repeats[output]:
+					generator.repeats.append((offset + start, period, count))
+
+				generator.append(segment.data[output])
+
+			self.generators[output] = generator
+
+		self.post_stage()
+
+	def generate_segment(self, root, item, outputs, initial_values):
+		"""
+		Generate the waveforms for a single top-level command.
+
+		Returns None if there were any errors.
+		"""
+
+		num_errors = len(self.errors)
+
+		self.generators = {}
+		for output in outputs:
+			self.generators[output] = Generator(frequency=self.frequency)
+			self.generators[output].initial_value = initial_values[output]
+
+		values_read = self.values_read = {}
+		amplitudes_read = self.amplitudes_read = dict((output, set()) for output in outputs)
+		shaped_outputs = self.shaped_outputs = set()
+		shapes_read = self.shapes_read = {}
+
+		try:
+			self.stack.append(root)
+			item.visit(self)
+			self.stack.pop()
+		finally:
+			self.values_read = self.amplitudes_read = self.shaped_outputs = self.shapes_read = None
+
+		self.segments_rendered += 1
+
+		if len(self.errors) > num_errors:
+			return None
+
+		return Segment(dict(initial_values), values_read, amplitudes_read, shaped_outputs, shapes_read,
+				self.generators)
+
 	def format_errors(self):
 		result = []
 
@@ -241,7 +475,13 @@ class ASTNode(object):
 			self.items = list(tok)
 		else:
 			for name in self.names:
-				setattr(self, name, tok[name])
+				value = tok[name]
+
+				# Plain lists can be pickled.
+				if isinstance(value, ParseResults):
+					value = list(value)
+
+				setattr(self, name, value)
 
 	def __eq__(self, other):
 		return repr(self) == repr(other)
@@ -270,8 +510,8 @@ class Acquire(ASTNode):
 			else:
 				env.acquisition = True
 		elif env.stage == env.stages.waveforms:
-			acq_marker = env.values[('_acq_marker', 'marker_num')]
-			acq_output = env.values[('_acq_marker', 'output')]
+			acq_marker = env.value(('_acq_marker', 'marker_num'))
+			acq_output = env.value(('_acq_marker', 'output'))
 
 			env.generators[acq_output].marker(acq_marker, True)
 
@@ -417,13 +657,12 @@ class Delay(ASTNode):
 					env.add_error('Delay must be a time value', self.location)
 		if env.stage == env.stages.waveforms:
 			if isinstance(self.length, basestring):
-				length = env.values[(self.length,)]
+				length = env.value((self.length,))
 			else:
 				length = self.length
 
 			for waveform in env.generators.values():
-				waveform.set_next(0.0)
-				waveform.delay(length)
+				waveform.idle(length)
 
 
 class Dictionary(ASTNode):
@@ -469,20 +708,60 @@ class Loop(ASTNode):
 
 		if env.stage == env.stages.waveforms:
 			if isinstance(self.times, basestring):
-				times = env.values[(self.times,)]
+				times = env.value((self.times,))
 			else:
 				times = self.times
 
-			for _ in xrange(times):
-				env.stack.append(self)
-				self.block.visit(env)
-				env.stack.pop()
+			env.stack.append(self)
+			self.unroll(env, times)
+			env.stack.pop()
 		else:
 			env.stack.append(self)
 			self.block.visit(env)
 			env.stack.pop()
 
 
+	# Loops with fewer iterations are always visited in full.
+	min_tiled = 3
+
+	def unroll(self, env, times):
+		"""
+		Generate the waveforms for all the iterations.
+
+		Once an iteration leaves every output as it found it, all the following iterations are identical to it, so
+		they are copied rather than generated. Since acquisition can only happen at the top level, there are no
+		markers to copy.
+		"""
+
+		def state():
+			base = min(generator.length for generator in env.generators.values())
+
+			return dict((output, (generator.last_value, generator.length - base))
+					for output, generator in env.generators.items())
+
+		if times < self.min_tiled:
+			for _ in xrange(times):
+				self.block.visit(env)
+
+			return
+
+		# The first iteration may start from anywhere.
+		self.block.visit(env)
+
+		before = state()
+		starts = dict((output, generator.length) for output, generator in env.generators.items())
+		self.block.visit(env)
+
+		if state() != before:
+			for _ in xrange(times - 2):
+				self.block.visit(env)
+
+			return
+
+		for output, generator in env.generators.items():
+			generator.repeat(starts[output], times - 2)
+
+
 class ParallelPulses(ASTNode):
 	is_list = True
 
@@ -496,11 +775,10 @@ class ParallelPulses(ASTNode):
 		env.stack.pop()
 
 		if env.stage == env.stages.waveforms:
-			max_length = max(len(waveform._wave) for waveform in env.generators.values())
+			max_length = max(waveform.length for waveform in env.generators.values())
 
 			for waveform in env.generators.values():
-				if len(waveform._wave) < max_length:
-					waveform.append([0.0] * (max_length - len(waveform._wave)))
+				waveform.extend(0.0, max_length - waveform.length)
 
 
 class Pulse(ASTNode):
@@ -545,7 +823,8 @@ class PulseSequence(ASTNode):
 					if type not in ['delay', 'pulse']:
 						env.add_error('Invalid command "{0}"'.format(item), self.location)
 		elif env.stage == env.stages.waveforms:
-			target = env.generators[env.stack[-1].target]
+			target_name = env.stack[-1].target
+			target = env.generators[target_name]
 
 			for item in self.items:
 				if isinstance(item, basestring):
@@ -553,16 +832,22 @@ class PulseSequence(ASTNode):
 
 					if type == 'delay':
 						target.set_next(0.0)
-						target.delay(env.values[(item,)])
+						target.delay(env.value((item,)))
 					elif type == 'pulse':
-						amplitude = float(env.values[(item, 'amplitude')].value)
-						length = env.values[(item, 'length')]
-						shape = env.values[(item, 'shape')]
+						amplitude = float(env.value((item, 'amplitude')).value)
+						length = env.value((item, 'length'))
+						shape = env.value((item, 'shape'))
+
+						if env.amplitudes_read is not None:
+							env.amplitudes_read[target_name].add((item, 'amplitude'))
 
 						if shape not in env.missing_shapes:
 							if shape == 'square':
 								target.square(amplitude, length)
 							else:
+								if env.shaped_outputs is not None:
+									env.shaped_outputs.add(target_name)
+
 								# Figure out all the locations where the file can be.
 								paths = [shape]
 								if env.cwd is not None:
@@ -571,19 +856,26 @@ class PulseSequence(ASTNode):
 								data = None
 								for p in paths:
 									try:
-										with open(p) as f:
-											data = load_values(f)
+										data, key = shape_cache.load(p)
 									except IOError:
+										# Noticed if the file appears later.
+										if env.shapes_read is not None:
+											env.shapes_read[p] = None
+
 										continue
 									except ValueError:
 										raise ValueError('Not a shape file: {0}'.format(p))
 
+									if env.shapes_read is not None:
+										env.shapes_read[p] = key
+
 								if data is None:
 									env.add_error('File "{0}" (due to "{1}") not found'.format(shape, item),
 											self.location)
 									env.missing_shapes.add(shape)
 								else:
-									target.pulse(data, amplitude, length)
+									resampled = shape_cache.resample(key, data, target._parse_time(length))
+									target.resampled_pulse(resampled, amplitude)
 				else:
 					target.set_next(0.0)
 					target.delay(item.length)
@@ -1,12 +1,13 @@
 import logging
 log = logging.getLogger(__name__)
 
+from collections import defaultdict, namedtuple
 from copy import copy
 from numpy import linspace
-from threading import Thread
+from threading import RLock, Thread
 import time
 
-from .units import IncompatibleDimensions, Quantity
+from .units import IncompatibleDimensions, Quantity, QuantityArray
 
 from spacq.tool.box import Without
 
@@ -31,6 +32,10 @@ class NotWritable(Exception):
 	pass
 
 
+# A filter on the values of a resource. If it preserves dimensions, its results need not be verified again.
+Wrapper = namedtuple('Wrapper', 'name, getter_filter, setter_filter, preserves_dimensions')
+
+
 class Resource(object):
 	"""
 	A generic resource which can potentially be read from or written to.
@@ -115,54 +120,99 @@ class Resource(object):
 	def value(self):
 		"""
 		The value of the resource.
+
+		Accessors are compiled on every access, so that any changes to the resource are seen.
+		"""
+
+		return self._compile_getter(self.verify_dimensions)()
+
+	@value.setter
+	def value(self, v):
+		self._compile_setter(self.verify_dimensions)(v)
+
+	def compile(self):
+		"""
+		Specialize accessors for the current getter, setter, wrappers and units.
+
+		Returns a function which reads the value and one which writes it, which behave like the value property.
+		Changes made to the resource afterwards are not seen by the accessors, so it should be compiled again.
 		"""
 
+		verify = self.verify_dimensions
+
+		return self._compile_getter(verify), self._compile_setter(verify)
+
+	def _compile_getter(self, verify):
 		if self.getter is None:
-			raise NotReadable('Resource not readable.')
+			def get():
+				raise NotReadable('Resource not readable.')
+
+			return get
 
 		if callable(self.getter):
-			result = self.getter()
+			get_raw = self.getter
 		elif self.obj is not None:
-			result = getattr(self.obj, self.getter)
+			obj, name = self.obj, self.getter
+
+			def get_raw():
+				return getattr(obj, name)
 		else:
-			raise NotReadable('Cannot read from resource.')
+			def get_raw():
+				raise NotReadable('Cannot read from resource.')
 
-		self.verify_dimensions(result)
+		# Filters and whether their results must be verified.
+		filters = [(w.getter_filter, not w.preserves_dimensions) for w in self.wrappers if w.getter_filter is not None]
 
-		# Apply the wrappers.
-		for _, getter_filter, _ in self.wrappers:
-			if getter_filter is None:
-				continue
+		def get():
+			result = get_raw()
+			verify(result)
 
-			result = getter_filter(result)
-			self.verify_dimensions(result)
+			for getter_filter, check in filters:
+				result = getter_filter(result)
 
-		return result
+				if check:
+					verify(result)
 
-	@value.setter
-	def value(self, v):
-		if self.setter is None:
-			raise NotWritable('Resource not writable.')
-
-		self.verify_dimensions(v)
+			return result
 
-		# Apply the wrappers.
-		for _, _, setter_filter in self.wrappers:
-			if setter_filter is None:
-				continue
+		return get
 
-			v = setter_filter(v)
-			self.verify_dimensions(v)
+	def _compile_setter(self, verify):
+		if self.setter is None:
+			def set(v):
+				raise NotWritable('Resource not writable.')
 
-		if self.allowed_values is not None and v not in self.allowed_values:
-			raise ValueError('Given disallowed value: {0}. Allowed values are: {1}'.format(v,self.allowed_values))
+			return set
 
 		if callable(self.setter):
-			self.setter(v)
+			set_raw = self.setter
 		elif self.obj is not None:
-			setattr(self.obj, self.setter, v)
+			obj, name = self.obj, self.setter
+
+			def set_raw(v):
+				setattr(obj, name, v)
 		else:
-			raise NotWritable('Cannot write to resource.')
+			def set_raw(v):
+				raise NotWritable('Cannot write to resource.')
+
+		filters = [(w.setter_filter, not w.preserves_dimensions) for w in self.wrappers if w.setter_filter is not None]
+		allowed_values = self.allowed_values
+
+		def set(v):
+			verify(v)
+
+			for setter_filter, check in filters:
+				v = setter_filter(v)
+
+				if check:
+					verify(v)
+
+			if allowed_values is not None and v not in allowed_values:
+				raise ValueError('Given disallowed value: {0}. Allowed values are: {1}'.format(v, allowed_values))
+
+			set_raw(v)
+
+		return set
 
 	def convert(self, value):
 		"""
@@ -192,8 +242,8 @@ class Resource(object):
 		Return the last index of the given wrapper.
 		"""
 
-		for i, (n, _, _) in reversed(list(enumerate(self.wrappers))):
-			if n == name:
+		for i, wrapper in reversed(list(enumerate(self.wrappers))):
+			if wrapper.name == name:
 				return i
 
 		raise ValueError('Wrapper not found: {0}'.format(name))
@@ -210,18 +260,19 @@ class Resource(object):
 		else:
 			return True
 
-	def wrapped(self, name, getter_filter=None, setter_filter=None):
+	def wrapped(self, name, getter_filter=None, setter_filter=None, preserves_dimensions=False):
 		"""
 		Produce a Resource which is a wrapper around this Resource.
 
 		name: The name of the wrapper to add.
 		getter_filter: Function of one argument through which to pass any obtained values.
 		setter_filter: Function of one argument through which to pass values when setting.
+		preserves_dimensions: Whether the filters always return values with the same type and dimensions as they are given.
 		"""
 
 		result = copy(self)
 
-		result.wrappers = self.wrappers + [(name, getter_filter, setter_filter)]
+		result.wrappers = self.wrappers + [Wrapper(name, getter_filter, setter_filter, preserves_dimensions)]
 
 		return result
 
@@ -254,10 +305,11 @@ class Resource(object):
 
 		# Make list of Quantites to loop over
 		quantites_values = linspace(value_from.original_value, value_to.original_value, steps)
-		quantites_list = [Quantity(value, units=value_from.original_units) for value in quantites_values]
+		quantites_list = QuantityArray(quantites_values, value_from.original_units)
+		_, set_value = self.compile()
 		for value in quantites_list:
 			try:
-				self.value = value
+				set_value(value)
 			except Exception as e:
 				if exception_callback is not None:
 					exception_callback(e)
@@ -266,6 +318,153 @@ class Resource(object):
 			time.sleep(delay)
 
 
+class ResourceRegistry(object):
+	"""
+	An index of labelled resources by label and by path, for constant-time lookup.
+
+	A path is a tuple of the device name, any subdevice names, and the resource name.
+	"""
+
+	def __init__(self):
+		self.lock = RLock()
+
+		# Device configurations by name, and the resource labels they had when indexed.
+		self.devices = {}
+		self.device_labels = {}
+
+		# Labels to resources.
+		self.resources = {}
+		# Paths to labels and labels to paths.
+		self.labels = {}
+		self.paths = {}
+		# Path prefixes to all the paths under them.
+		self.prefixes = defaultdict(set)
+
+	def add(self, label, resource):
+		with self.lock:
+			self.resources[label] = resource
+
+	def remove(self, label):
+		with self.lock:
+			self.resources.pop(label, None)
+
+	def add_device(self, name, resource_labels):
+		"""
+		Index the paths of the labelled resources of a device, given as resource paths within the device and labels.
+		"""
+
+		with self.lock:
+			self.device_labels[name] = dict(resource_labels)
+
+			for path, label in resource_labels.items():
+				path = (name,) + tuple(path)
+
+				self.labels[path] = label
+				self.paths[label] = path
+
+				for i in xrange(1, len(path)):
+					self.prefixes[path[:i]].add(path)
+
+	def remove_device(self, name):
+		with self.lock:
+			self.device_labels.pop(name, None)
+
+			for path in self.prefixes.pop((name,), ()):
+				label = self.labels.pop(path)
+				if self.paths.get(label) == path:
+					del self.paths[label]
+
+				for i in xrange(2, len(path)):
+					prefix = path[:i]
+					self.prefixes[prefix].discard(path)
+
+					if not self.prefixes[prefix]:
+						del self.prefixes[prefix]
+
+	def reindex(self):
+		"""
+		Index again the devices whose resource labels have been edited since they were added.
+		"""
+
+		with self.lock:
+			for name, config in self.devices.items():
+				if config.resource_labels != self.device_labels.get(name):
+					self.remove_device(name)
+					self.add_device(name, config.resource_labels)
+
+	def msg_resource(self, name, value=None):
+		"""
+		Follow the "resource.added" and "resource.removed" messages of a PubDict.
+
+		Labels are only ever edited along with the resources they name, so the devices are checked for edited
+		labels as well.
+		"""
+
+		with self.lock:
+			if value is not None:
+				self.add(name, value)
+			else:
+				self.remove(name)
+
+			self.reindex()
+
+	def msg_device(self, name, value=None):
+		"""
+		Follow the "device.added" and "device.removed" messages of a PubDict of DeviceConfig objects.
+		"""
+
+		with self.lock:
+			self.remove_device(name)
+			self.devices.pop(name, None)
+
+			if value is not None:
+				self.devices[name] = value
+				self.add_device(name, value.resource_labels)
+
+	def __getitem__(self, label):
+		return self.resources[label]
+
+	def __contains__(self, label):
+		return label in self.resources
+
+	def __len__(self):
+		return len(self.resources)
+
+	def find(self, path):
+		"""
+		The resource at a path.
+
+		Raises KeyError if there is no labelled resource there.
+		"""
+
+		with self.lock:
+			return self.resources[self.labels[tuple(path)]]
+
+	def path(self, label):
+		"""
+		The path of the resource with a label, or None if it does not belong to a device.
+		"""
+
+		return self.paths.get(label)
+
+	def under(self, prefix):
+		"""
+		All the resources below a path prefix, by path.
+		"""
+
+		with self.lock:
+			result = {}
+
+			for path in self.prefixes.get(tuple(prefix), ()):
+				try:
+					result[path] = self.resources[self.labels[path]]
+				except KeyError:
+					# Not added yet, or already removed.
+					pass
+
+			return result
+
+
 class AcquisitionThread(Thread):
 	"""
 	Once every delay, call the callback with a fresh value from the resource.
@@ -1,4 +1,4 @@
-from nose.tools import eq_
+from nose.tools import assert_raises, eq_
 from numpy import linspace
 from threading import Lock
 import time
@@ -365,6 +365,112 @@ class ResourceTest(TestCase):
 		else:
 			assert False, 'Expected TypeError'
 
+	def testCompile(self):
+		"""
+		Compiled accessors behave like the value.
+		"""
+
+		value = []
+		checked = []
+
+		res1 = resources.Resource(getter=lambda: value[-1], setter=lambda x: value.append(x),
+				allowed_values=[1, 3, 6])
+
+		def verify_dimensions(v, *args, **kwargs):
+			checked.append(v)
+
+			return resources.Resource.verify_dimensions(res1, v, *args, **kwargs)
+		res1.verify_dimensions = verify_dimensions
+
+		res2 = res1.wrapped('w1', getter_filter=lambda x: 2 * x, setter_filter=lambda x: 3 * x,
+				preserves_dimensions=True)
+		get, set = res2.compile()
+
+		set(1)
+		eq_(value, [3])
+		eq_(get(), 6)
+
+		# Only checked before the wrapper.
+		eq_(checked, [1, 3])
+
+		assert_raises(ValueError, set, 3)
+		assert_raises(TypeError, set, Quantity(1, 'V'))
+
+		# Otherwise checked after the wrapper as well.
+		res3 = res1.wrapped('w2', setter_filter=lambda x: Quantity(x, 'V'))
+		assert_raises(TypeError, res3.compile()[1], 1)
+
+		# The value property behaves the same.
+		del value[:], checked[:]
+		res2.value = 1
+		eq_(res2.value, 6)
+		eq_(checked, [1, 3])
+		assert_raises(TypeError, setattr, res3, 'value', 1)
+
+		# Not readable or writable.
+		res4 = resources.Resource()
+		get, set = res4.compile()
+		assert_raises(resources.NotReadable, get)
+		assert_raises(resources.NotWritable, set, Quantity(1, 'V'))
+
+
+class ResourceRegistryTest(TestCase):
+	class DeviceConfig(object):
+		def __init__(self, resource_labels):
+			self.resource_labels = resource_labels
+
+	def testLookup(self):
+		"""
+		Find resources by label, path and prefix.
+		"""
+
+		registry = resources.ResourceRegistry()
+		res1, res2, res3 = [resources.Resource() for _ in xrange(3)]
+
+		registry.msg_device('dev1', self.DeviceConfig({('port1', 'voltage'): 'v1', ('port2', 'voltage'): 'v2'}))
+		registry.msg_device('dev2', self.DeviceConfig({('current',): 'i'}))
+		registry.msg_resource('v1', res1)
+		registry.msg_resource('v2', res2)
+		registry.msg_resource('i', res3)
+		registry.msg_resource('other', res3)
+
+		eq_(len(registry), 4)
+		assert registry['v2'] is res2
+		assert registry.find(('dev1', 'port1', 'voltage')) is res1
+		assert registry.find(['dev2', 'current']) is res3
+		eq_(registry.path('v2'), ('dev1', 'port2', 'voltage'))
+		eq_(registry.path('other'), None)
+
+		eq_(registry.under(('dev1',)), {('dev1', 'port1', 'voltage'): res1, ('dev1', 'port2', 'voltage'): res2})
+		eq_(registry.under(('dev1', 'port2')), {('dev1', 'port2', 'voltage'): res2})
+		eq_(registry.under(('dev3',)), {})
+
+		# Removal.
+		registry.msg_resource('v1')
+		assert 'v1' not in registry
+		assert_raises(KeyError, registry.find, ('dev1', 'port1', 'voltage'))
+		eq_(registry.under(('dev1',)), {('dev1', 'port2', 'voltage'): res2})
+
+		registry.msg_device('dev1')
+		assert_raises(KeyError, registry.find, ('dev1', 'port2', 'voltage'))
+		eq_(registry.path('v2'), None)
+		eq_(registry.under(('dev1', 'port2')), {})
+		assert registry['v2'] is res2
+
+		# Relabelled.
+		registry.msg_device('dev2', self.DeviceConfig({('current',): 'i2'}))
+		assert_raises(KeyError, registry.find, ('dev2', 'current'))
+		registry.msg_resource('i2', res1)
+		assert registry.find(('dev2', 'current')) is res1
+
+		# Relabelled in place, along with the resources.
+		registry.devices['dev2'].resource_labels = {('current',): 'i3'}
+		registry.msg_resource('i2')
+		registry.msg_resource('i3', res2)
+		eq_(registry.path('i3'), ('dev2', 'current'))
+		eq_(registry.path('i2'), None)
+		assert registry.find(('dev2', 'current')) is res2
+
 
 class AcquisitionThreadTest(TestCase):
 	def testWithoutResource(self):
@@ -1,5 +1,8 @@
 from copy import deepcopy
 from nose.tools import assert_raises, eq_
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+import pickle
+import quantities as pq
 from unittest import main, TestCase
 
 from .. import units
@@ -246,6 +249,139 @@ class QuantityTest(TestCase):
 
 		eq_(deepcopy(q), units.Quantity('100 ns.V2'))
 
+	def testPickle(self):
+		"""
+		Quantities survive being pickled.
+		"""
+
+		q = units.Quantity('-1.5 kg.ms-1')
+		q2 = pickle.loads(pickle.dumps(q, pickle.HIGHEST_PROTOCOL))
+
+		eq_(q2, q)
+		eq_(str(q2), '-1.5 kg.ms-1')
+		eq_(q2.dimension_signature, q.dimension_signature)
+
+	def testChainedArithmetic(self):
+		"""
+		Arithmetic on quantities should agree with arithmetic on pq quantities.
+		"""
+
+		a, b = pq.Quantity(1.0, 'V'), pq.Quantity(2.0, 'mV')
+		pq_c = (a + b) * 2.0 - a
+
+		a, b = units.Quantity(1.0, 'V'), units.Quantity(2.0, 'mV')
+		c = (a + b) * 2.0 - a
+
+		eq_(c, units.Quantity(1.004, 'V'))
+		eq_(c.value, float(pq_c.simplified.magnitude))
+		assert c > a
+		assert not c < a
+
+
+class QuantityArrayTest(TestCase):
+	def testCreate(self):
+		"""
+		Create arrays from values and from quantities.
+		"""
+
+		qa = units.QuantityArray([-1, 0, 2.5], 'mV')
+		eq_(len(qa), 3)
+		assert_array_almost_equal(qa.values, [-1e-3, 0, 2.5e-3])
+		assert_array_almost_equal(qa.original_values, [-1, 0, 2.5])
+		eq_(list(qa), [units.Quantity(x, 'mV') for x in [-1, 0, 2.5]])
+		eq_(str(qa[2]), '2.5 mV')
+		eq_(str(qa[1:]), '[0, 2.5] mV')
+		eq_(repr(qa), "QuantityArray([-1.0, 0.0, 2.5], 'mV')")
+
+		qa = units.QuantityArray.from_quantities([units.Quantity(x) for x in ['1 kg.m', '2 g.km', '3 mg.Mm']])
+		eq_(qa.original_units, 'kg.m')
+		assert_array_almost_equal(qa.original_values, [1, 2, 3])
+
+		assert_raises(units.IncompatibleDimensions, units.QuantityArray.from_quantities,
+				[units.Quantity(1, 's'), units.Quantity(1, 'm')])
+		assert_raises(ValueError, units.QuantityArray.from_quantities, [])
+
+	def testConversion(self):
+		"""
+		Convert to other units with the same dimensions.
+		"""
+
+		qa = units.QuantityArray([1, 20, 300], 'ms').to('us')
+		eq_(qa.original_units, 'us')
+		assert_array_almost_equal(qa.original_values, [1e3, 2e4, 3e5])
+		assert qa.assert_dimensions('s')
+
+		assert_raises(units.IncompatibleDimensions, qa.to, 'Hz')
+
+	def testComparison(self):
+		"""
+		Compare element-wise against quantities and arrays.
+		"""
+
+		qa = units.QuantityArray([1, 2, 3], 'V')
+
+		assert_array_equal(qa == units.Quantity(2000, 'mV'), [False, True, False])
+		assert_array_equal(qa != units.Quantity(2000, 'mV'), [True, False, True])
+		assert_array_equal(qa < units.Quantity(2, 'V'), [True, False, False])
+		assert_array_equal(qa >= units.QuantityArray([3, 2, 1], 'V'), [False, True, True])
+
+		assert_raises(units.IncompatibleDimensions, qa.__lt__, units.Quantity(1, 's'))
+		assert_raises(TypeError, qa.__lt__, 1)
+
+	def testArithmetic(self):
+		"""
+		Arithmetic on all the values at once.
+		"""
+
+		qa = units.QuantityArray([1, 2, 3], 'V')
+
+		eq_(str(qa + units.Quantity(1, 'mV')), '[1.001, 2.001, 3.001] V')
+		eq_(str(qa - qa * 2), '[-1, -2, -3] V')
+		eq_(str(3 * qa / 2), '[1.5, 3, 4.5] V')
+		eq_(str(qa * [1, 0, -1]), '[1, 0, -3] V')
+
+		assert_raises(units.IncompatibleDimensions, qa.__add__, units.Quantity(1, 's'))
+
+
+class UnitRegistryTest(TestCase):
+	def testLookup(self):
+		"""
+		Units are parsed once and remembered.
+		"""
+
+		registry = units.UnitRegistry()
+		registry.max_entries = 2
+
+		info = registry.lookup('kg.m.ms-1')
+		eq_(info.units, 'g*m*s**-1.0')
+		eq_(info.multiplier, 0)
+		eq_(info.scale, 1e-3)
+		eq_(info.dimensions, frozenset([('kg', 1), ('m', 1), ('s', -1)]))
+
+		assert registry.lookup('kg.m.ms-1') is info
+		eq_(registry.lookup('N.s').dimensions, info.dimensions)
+		eq_(registry.lookup('V').dimensions, frozenset([('kg', 1), ('m', 2), ('s', -3), ('A', -1)]))
+
+		# Least recently used is forgotten first.
+		eq_(list(registry.entries), ['N.s', 'V'])
+
+		assert_raises(ValueError, registry.lookup, 'something')
+
+	def testCreateFromStrings(self):
+		"""
+		Quantities created through the registry match those from parsing the units every time.
+		"""
+
+		for string in ['{0} mV'.format(x) for x in xrange(20)]:
+			value, symbols = units.Quantity.from_string(string)
+			new_units, multiplier = units.Quantity.parse_units(symbols)
+			parsed = pq.Quantity(value * 10 ** multiplier, new_units).simplified
+
+			q = units.Quantity(string)
+			q.assert_dimensions('V')
+			eq_(q.value, float(parsed.magnitude))
+			eq_(q.original_value, value)
+
 
 if __name__ == '__main__':
 	main()
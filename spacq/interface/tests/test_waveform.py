@@ -55,6 +55,28 @@ class GeneratorTest(TestCase):
 		eq_(wave, [0.0])
 		eq_(markers, {1: [True], 2: [False]})
 
+	def testRepeat(self):
+		"""
+		Repeat part of a waveform.
+		"""
+
+		wg = waveform.Generator(frequency=Quantity(1, 'Hz'))
+
+		wg.delay(Quantity(2, 's'))
+		wg.square(1.0, Quantity(2, 's'))
+		wg.repeat(1, 3)
+		wg.set_next(0.5)
+		wg.marker(1, True)
+
+		assert_array_almost_equal(wg.waveform.data, [0.0] + [1.0, 1.0, 0.0] * 4 + [0.5, 0.0])
+		eq_(wg.sequence, [(0, 1, 1), (1, 3, 4), (13, 2, 1)])
+
+		# Nothing to repeat.
+		wg.repeat(wg.length, 5)
+		eq_(wg.length, 14)
+
+		assert_raises(ValueError, wg.repeat, 0, 1e7)
+
 	def testTooLong(self, dry_run=False):
 		"""
 		Try to create a waveform that is far too long.
@@ -75,5 +97,89 @@ class GeneratorTest(TestCase):
 		self.testTooLong(dry_run=True)
 
 
+
+class SequenceGeneratorTest(TestCase):
+	def testEntries(self):
+		"""
+		Store repeated parts only once.
+		"""
+
+		wg = waveform.SequenceGenerator(frequency=Quantity(1, 'Hz'))
+		wg.idle_period = 4
+		flat = waveform.Generator(frequency=Quantity(1, 'Hz'))
+
+		for g in [wg, flat]:
+			g.square(1.0, Quantity(2, 's'))
+			g.idle(Quantity(10, 's'))
+			start = g.length
+			g.square(0.5, Quantity(3, 's'))
+			g.repeat(start, 2)
+			g.marker(1, True)
+			g.idle(Quantity(3, 's'))
+
+		eq_(wg.sequence, [(0, 3, 1), (3, 4, 2), (7, 2, 1), (9, 4, 3), (13, 3, 1)])
+		eq_(wg.stored, 16)
+		eq_(wg.length, flat.length)
+
+		assert_array_almost_equal(wg.waveform.data, flat.waveform.data)
+		eq_(wg.waveform.markers, flat.waveform.markers)
+
+		# Only what is stored counts.
+		wg.idle(Quantity(1e8, 's'))
+		eq_(wg.length, flat.length + 1e8)
+
+
+class MarkerTest(TestCase):
+	def testTransitions(self):
+		"""
+		Convert to and from transitions.
+		"""
+
+		values = [False] * 3 + [True] * 6 + [False] * 5
+
+		marker = waveform.Marker.from_values(values)
+		eq_(list(marker.positions), [0, 3, 9])
+		eq_(list(marker.values), [False, True, False])
+		eq_(len(marker), 14)
+
+		eq_(list(marker.expand()), values)
+		eq_(marker, values)
+		eq_(list(marker.bit_plane(1 << 14)), [0] * 3 + [1 << 14] * 6 + [0] * 5)
+		eq_(marker.bit_plane(1 << 14).dtype, 'uint16')
+
+		eq_(waveform.Marker.from_values([]), [])
+		eq_(waveform.Marker([0], [True], 3), [True] * 3)
+
+	def testIndexing(self):
+		"""
+		Index individual points and slices.
+		"""
+
+		values = [False] * 3 + [True] * 6 + [False] * 5
+		marker = waveform.Marker.from_values(values)
+
+		eq_([marker[i] for i in range(len(values))], values)
+		eq_([marker[i] for i in range(-len(values), 0)], values)
+		eq_(list(marker[2:10:3]), values[2:10:3])
+
+		assert_raises(IndexError, marker.__getitem__, len(values))
+		assert_raises(IndexError, marker.__getitem__, -len(values) - 1)
+
+	def testComparison(self):
+		"""
+		Compare with sequences and with anything else.
+		"""
+
+		marker = waveform.Marker.from_values([True, False])
+
+		assert marker == (True, False)
+		assert marker != [True, True]
+		assert marker == waveform.Marker([0, 1], [True, False], 2)
+
+		assert marker != None
+		assert not marker == None
+		assert marker != 5
+
+
 if __name__ == '__main__':
 	main()
@@ -1,10 +1,14 @@
 import logging
 log = logging.getLogger(__name__)
 
-from copy import deepcopy
+from collections import namedtuple, OrderedDict
 from math import log10
-from numpy import allclose
-import quantities as pq
+from numpy import abs as np_abs, asarray, ndarray
+from threading import Lock
+
+from spacq.tool.box import LazyModule
+
+pq = LazyModule('quantities')
 
 """
 Tools for working with quantities and units.
@@ -55,11 +59,86 @@ class SIValues(object):
 	units.update(['Hz', 'J', 'N', 'T', 'V', 'G'])
 
 
+# Everything needed to create a Quantity in some units without parsing them again:
+#   units: The units in pq-acceptable notation, without prefixes.
+#   multiplier: The power of 10 of the prefixes.
+#   scale: The factor which normalizes the units to SI base units.
+#   dimensionality: The normalized pq dimensionality.
+#   dimensions: A hashable signature of the normalized units and their exponents.
+UnitInfo = namedtuple('UnitInfo', 'units, multiplier, scale, dimensionality, dimensions')
+
+
+class UnitRegistry(object):
+	"""
+	Parsed unit symbol strings, so that they need not be parsed every time a Quantity is created.
+	"""
+
+	# The number of unit strings to keep.
+	max_entries = 1024
+
+	def __init__(self):
+		self.lock = Lock()
+
+		# Unit strings and their UnitInfo; least recently used first.
+		self.entries = OrderedDict()
+		# The units the entries were parsed with.
+		self.known_units = frozenset(SIValues.units)
+
+	def lookup(self, string):
+		"""
+		Find the UnitInfo for a unit symbol string.
+
+		Like Quantity.parse_units, raises ValueError for invalid strings.
+		"""
+
+		with self.lock:
+			if self.known_units != SIValues.units:
+				# The available units changed, so everything must be parsed again.
+				self.entries.clear()
+				self.known_units = frozenset(SIValues.units)
+
+			try:
+				result = self.entries.pop(string)
+			except KeyError:
+				pass
+			else:
+				self.entries[string] = result
+
+				return result
+
+		log.debug('Registering units: {0}'.format(string))
+
+		units, multiplier = Quantity.parse_units(string)
+
+		# Normalize to SI base units.
+		simplified = pq.Quantity(1.0, units).simplified
+		dimensionality = simplified.dimensionality
+		dimensions = frozenset((unit.symbol, exponent) for unit, exponent in dimensionality.items())
+
+		result = UnitInfo(units, multiplier, float(simplified.magnitude), dimensionality, dimensions)
+
+		with self.lock:
+			self.entries[string] = result
+
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+
+		return result
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+
 class Quantity(object):
 	"""
 	A quantity with a value and dimensions.
+
+	The value is kept as a float in SI base units, so arithmetic does not involve the quantities package.
 	"""
 
+	__slots__ = ('_value', '_info', 'original_units', 'original_multiplier')
+
 	@staticmethod
 	def parse_units(string):
 		"""
@@ -141,24 +220,31 @@ class Quantity(object):
 		# Always work with single floats.
 		value = float(value)
 
-		log.debug('Creating Quantity: {0}, {1}'.format(value, units))
-
-		# Remove unit prefixes.
-		new_units, multiplier = self.parse_units(units)
-		new_value = value * (10 ** multiplier)
-
-		# Normalize to SI base units.
-		original_quantity = pq.Quantity(new_value, new_units)
-		self._q = original_quantity.simplified
+		# Remove unit prefixes and normalize to SI base units.
+		info = unit_registry.lookup(units)
+		self._value = value * (10 ** info.multiplier) * info.scale
+		self._info = info
 
 		# Information to restore original representation.
 		self.original_units = units
-		self.original_multiplier = multiplier
+		self.original_multiplier = info.multiplier
+
+		# Include the normalization factor.
+		if info.scale != 1:
+			self.original_multiplier += log10(info.scale)
+
+	def _copy(self, value=None):
+		"""
+		A new instance in the same units, without parsing them again.
+		"""
 
-		# Find the normalization factor.
-		q, orig = self._q.magnitude, original_quantity.magnitude
-		if q != orig:
-			self.original_multiplier += log10(abs(q)) - log10(abs(orig))
+		result = Quantity.__new__(Quantity)
+		result._value = self._value if value is None else value
+		result._info = self._info
+		result.original_units = self.original_units
+		result.original_multiplier = self.original_multiplier
+
+		return result
 
 	@property
 	def dimensions(self):
@@ -166,7 +252,15 @@ class Quantity(object):
 		The set of simplified units and their exponents.
 		"""
 
-		return set(self._q.dimensionality.items())
+		return set(self._info.dimensionality.items())
+
+	@property
+	def dimension_signature(self):
+		"""
+		The simplified unit symbols and their exponents, in hashable form.
+		"""
+
+		return self._info.dimensions
 	
 	@property
 	def dimensions_string(self):
@@ -174,7 +268,7 @@ class Quantity(object):
 		Returns the simplified units and their exponents in string form.
 		"""
 		
-		return self._q.dimensionality
+		return self._info.dimensionality.copy()
 
 	@property
 	def value(self):
@@ -182,9 +276,7 @@ class Quantity(object):
 		The magnitude of the quantity, normalized to the base units.
 		"""
 
-		result = self._q.magnitude
-
-		return result.tolist()
+		return self._value
 
 	@property
 	def original_value(self):
@@ -192,7 +284,7 @@ class Quantity(object):
 		The magnitude of the quantity that matches the units.
 		"""
 
-		return self._q.magnitude / (10 ** self.original_multiplier)
+		return self._value / (10 ** self.original_multiplier)
 
 	def assert_dimensions(self, other, exception=True):
 		"""
@@ -203,32 +295,49 @@ class Quantity(object):
 
 		if isinstance(other, basestring):
 			# Given a units string.
-			other = Quantity(1, other).dimensions
-		elif isinstance(other, Quantity):
-			# Given a Quantity.
-			other = other.dimensions
+			matched = self._info.dimensions == unit_registry.lookup(other).dimensions
+		elif isinstance(other, (Quantity, QuantityArray)):
+			# Given a Quantity or QuantityArray.
+			matched = self._info.dimensions == other.dimension_signature
+		else:
+			# Given a set of dimensions.
+			matched = self.dimensions == other
 
-		if self.dimensions == other:
+		if matched:
 			return True
 		elif exception:
-			raise IncompatibleDimensions(self.dimensions, other)
+			if isinstance(other, basestring):
+				other = unit_registry.lookup(other).dimensionality.items()
+			elif isinstance(other, (Quantity, QuantityArray)):
+				other = other.dimensions
+
+			raise IncompatibleDimensions(self.dimensions, set(other))
 		else:
 			return False
 
+	def _assert_compatible(self, other):
+		"""
+		Ensure that the dimensions of another quantity match.
+		"""
+
+		if not isinstance(other, Quantity):
+			try:
+				other = other.dimensions
+			except AttributeError:
+				raise TypeError('Expected dimensions for "{0!r}"'.format(other))
+
+		self.assert_dimensions(other)
+
 	# FIXME: Python 2.7 provides functools.total_ordering()
 	def __eq__(self, other):
-		try:
-			self.assert_dimensions(other.dimensions)
-		except AttributeError:
-			raise TypeError('Expected dimensions for "{0!r}"'.format(other))
+		self._assert_compatible(other)
 
-		return allclose(self.value, other.value)
+		# The same tolerances as numpy.allclose.
+		a, b = self.value, other.value
+		return a == b or abs(a - b) <= 1e-8 + 1e-5 * abs(b)
 
 	def __lt__(self, other):
-		try:
-			self.assert_dimensions(other.dimensions)
-		except AttributeError:
-			raise TypeError('Expected dimensions for "{0!r}"'.format(other))
+		self._assert_compatible(other)
 
 		return self.value < other.value
 
@@ -246,7 +355,7 @@ class Quantity(object):
 
 	def __abs__(self):
 		if self.value < 0:
-			return Quantity(abs(self.original_value), self.original_units)
+			return self._copy(-self._value)
 		else:
 			return self
 
@@ -255,40 +364,25 @@ class Quantity(object):
 		Addition with matching dimensions.
 		"""
 
-		try:
-			self.assert_dimensions(other.dimensions)
-		except AttributeError:
-			raise TypeError('Expected dimensions for "{0!r}"'.format(other))
-
-		result = deepcopy(self)
-		result._q += other._q
+		self._assert_compatible(other)
 
-		return result
+		return self._copy(self._value + other.value)
 
 	def __sub__(self, other):
 		"""
 		Subtraction with matching dimensions.
 		"""
 
-		try:
-			self.assert_dimensions(other.dimensions)
-		except AttributeError:
-			raise TypeError('Expected dimensions for "{0!r}"'.format(other))
-
-		result = deepcopy(self)
-		result._q -= other._q
+		self._assert_compatible(other)
 
-		return result
+		return self._copy(self._value - other.value)
 
 	def __mul__(self, other):
 		"""
 		Multiplication by reals.
 		"""
 
-		result = deepcopy(self)
-		result._q *= other
-
-		return result
+		return self._copy(self._value * other)
 
 	def __rmul__(self, other):
 		return self * other
@@ -298,10 +392,7 @@ class Quantity(object):
 		Division by reals.
 		"""
 
-		result = deepcopy(self)
-		result._q /= other
-
-		return result
+		return self._copy(self._value / other)
 
 	def __repr__(self):
 		return '{0}(\'{1}\')'.format(self.__class__.__name__, str(self))
@@ -314,7 +405,196 @@ class Quantity(object):
 
 	def __deepcopy__(self, memo):
 		"""
-		Rather than copying anything, simply create a new instance.
+		Nothing is mutable, so simply create a new instance.
+		"""
+
+		return self._copy()
+
+	def __getstate__(self):
+		# The units are looked up again rather than storing the pq dimensionality.
+		return (self._value, self.original_units, self.original_multiplier)
+
+	def __setstate__(self, state):
+		self._value, self.original_units, self.original_multiplier = state
+		self._info = unit_registry.lookup(self.original_units)
+
+
+class QuantityArray(object):
+	"""
+	Many quantities with the same units, as a single array.
+	"""
+
+	@classmethod
+	def from_quantities(cls, quantities, units=None):
+		"""
+		Gather quantities into an array, in the given units or else those of the first quantity.
+		"""
+
+		if units is None:
+			if not quantities:
+				raise ValueError('Units required for no quantities.')
+
+			units = quantities[0].original_units
+
+		result = cls([], units)
+
+		for q in quantities:
+			result._unit.assert_dimensions(q)
+
+		result._values = asarray([q.value for q in quantities], dtype=float)
+
+		return result
+
+	def __init__(self, values, units):
+		"""
+		The values are given in the units, as for Quantity(value, units).
 		"""
 
-		return Quantity(str(self))
+		# A quantity of 1 in the units, which provides the units and dimensions.
+		self._unit = Quantity(1, units)
+
+		info = self._unit._info
+		self._values = asarray(values, dtype=float) * (10 ** info.multiplier) * info.scale
+
+	def _with_values(self, values):
+		"""
+		A new instance in the same units, with values normalized to the base units.
+		"""
+
+		result = QuantityArray.__new__(QuantityArray)
+		result._unit = self._unit
+		result._values = values
+
+		return result
+
+	@property
+	def original_units(self):
+		return self._unit.original_units
+
+	@property
+	def dimensions(self):
+		return self._unit.dimensions
+
+	@property
+	def dimension_signature(self):
+		return self._unit.dimension_signature
+
+	@property
+	def values(self):
+		"""
+		The magnitudes of the quantities, normalized to the base units.
+		"""
+
+		return self._values
+
+	@property
+	def original_values(self):
+		"""
+		The magnitudes of the quantities that match the units.
+		"""
+
+		return self._values / (10 ** self._unit.original_multiplier)
+
+	def assert_dimensions(self, other, exception=True):
+		"""
+		As for Quantity.assert_dimensions.
+		"""
+
+		return self._unit.assert_dimensions(other, exception)
+
+	def to(self, units):
+		"""
+		The same quantities in other units with the same dimensions.
+		"""
+
+		result = QuantityArray([], units)
+		result.assert_dimensions(self)
+		result._values = self._values.copy()
+
+		return result
+
+	def _other_values(self, other):
+		"""
+		The normalized values of a quantity or array of quantities with matching dimensions.
+		"""
+
+		if isinstance(other, QuantityArray):
+			self.assert_dimensions(other)
+
+			return other._values
+		elif isinstance(other, Quantity):
+			self.assert_dimensions(other)
+
+			return other.value
+		else:
+			raise TypeError('Expected dimensions for "{0!r}"'.format(other))
+
+	def __len__(self):
+		return len(self._values)
+
+	def __iter__(self):
+		for value in self._values:
+			yield self._unit._copy(float(value))
+
+	def __getitem__(self, item):
+		result = self._values[item]
+
+		if isinstance(result, ndarray):
+			return self._with_values(result)
+		else:
+			return self._unit._copy(float(result))
+
+	def __eq__(self, other):
+		"""
+		Element-wise approximate equality, with the same tolerances as Quantity.
+		"""
+
+		a, b = self._values, self._other_values(other)
+		return np_abs(a - b) <= 1e-8 + 1e-5 * np_abs(b)
+
+	def __ne__(self, other):
+		return ~(self == other)
+
+	def __lt__(self, other):
+		return self._values < self._other_values(other)
+
+	def __le__(self, other):
+		return self._values <= self._other_values(other)
+
+	def __gt__(self, other):
+		return self._values > self._other_values(other)
+
+	def __ge__(self, other):
+		return self._values >= self._other_values(other)
+
+	def __add__(self, other):
+		return self._with_values(self._values + self._other_values(other))
+
+	def __sub__(self, other):
+		return self._with_values(self._values - self._other_values(other))
+
+	def __mul__(self, other):
+		"""
+		Multiplication by reals or arrays of reals.
+		"""
+
+		return self._with_values(self._values * other)
+
+	def __rmul__(self, other):
+		return self * other
+
+	def __div__(self, other):
+		"""
+		Division by reals or arrays of reals.
+		"""
+
+		return self._with_values(self._values / other)
+
+	def __repr__(self):
+		return '{0}({1!r}, {2!r})'.format(self.__class__.__name__, self.original_values.tolist(), self.original_units)
+
+	def __str__(self):
+		return '[{0}] {1}'.format(', '.join('{0:.10g}'.format(x) for x in self.original_values), self.original_units)
+
+
+unit_registry = UnitRegistry()
@@ -1,8 +1,9 @@
 import logging
 log = logging.getLogger(__name__)
 
-from collections import namedtuple
-from numpy import append, array, interp, linspace
+from collections import namedtuple, Sequence
+from numpy import (append, around, asarray, concatenate, diff, empty, flatnonzero, float32, interp, linspace, repeat,
+		searchsorted, tile, uint16, zeros)
 
 """
 A waveform generator.
@@ -12,6 +13,110 @@ A waveform generator.
 Waveform = namedtuple('Waveform', 'data, markers')
 
 
+class Marker(object):
+	"""
+	Marker data, stored as the positions at which the value changes rather than as one value per point.
+
+	Behaves like a sequence of booleans.
+	"""
+
+	def __init__(self, positions, values, length):
+		# The marker takes on each value from the corresponding position onwards; the first position is 0.
+		self.positions = asarray(positions, dtype=int)
+		self.values = asarray(values, dtype=bool)
+		self.length = length
+
+	@classmethod
+	def from_values(cls, values):
+		"""
+		Create a marker from a sequence of booleans.
+		"""
+
+		values = asarray(values, dtype=bool)
+
+		if len(values) == 0:
+			return cls([], [], 0)
+
+		positions = concatenate(([0], flatnonzero(values[1:] != values[:-1]) + 1))
+
+		return cls(positions, values[positions], len(values))
+
+	@property
+	def run_lengths(self):
+		"""
+		The number of points for which each value lasts.
+		"""
+
+		return diff(append(self.positions, self.length))
+
+	def expand(self):
+		"""
+		One boolean per point.
+		"""
+
+		return repeat(self.values, self.run_lengths)
+
+	def window(self, start, length):
+		"""
+		The part of the marker covering length points from start.
+		"""
+
+		first = searchsorted(self.positions, start, side='right') - 1
+		stop = searchsorted(self.positions, start + length, side='left')
+
+		positions = concatenate(([start], self.positions[first + 1:stop])) - start
+
+		return Marker(positions, self.values[first:stop], length)
+
+	def bit_plane(self, bit):
+		"""
+		One 16-bit integer per point, with the given bit set wherever the marker is on.
+		"""
+
+		return repeat((self.values * bit).astype(uint16), self.run_lengths)
+
+	def __array__(self, dtype=None):
+		if dtype is None:
+			return self.expand()
+		else:
+			return self.expand().astype(dtype)
+
+	def __len__(self):
+		return self.length
+
+	def __iter__(self):
+		return iter(self.expand().tolist())
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return self.expand()[index]
+
+		if index < 0:
+			index += self.length
+
+		if not 0 <= index < self.length:
+			raise IndexError('Marker index out of range: {0}'.format(index))
+
+		return self.values[searchsorted(self.positions, index, side='right') - 1]
+
+	def __eq__(self, other):
+		if not isinstance(other, (Marker, Sequence)):
+			return NotImplemented
+
+		return list(self) == list(other)
+
+	def __ne__(self, other):
+		result = self.__eq__(other)
+
+		if result is NotImplemented:
+			return result
+
+		return not result
+
+	def __repr__(self):
+		return 'Marker({0!r}, {1!r}, {2!r})'.format(self.positions.tolist(), self.values.tolist(), self.length)
+
+
 class Generator(object):
 	"""
 	A generator for arbitrary waveforms.
@@ -20,7 +125,12 @@ class Generator(object):
 	# Generation should fail if the number of points exceeds this value.
 	max_length = 10000000 # 1e7 (0.01 s @ 1 GHz)
 
+	# The buffer starts with room for this many points, and doubles in size whenever it runs out.
+	initial_capacity = 4096
+
 	length = 0
+	# The number of points actually stored, which is the same as the length unless some are stored only once.
+	stored = 0
 
 	def __init__(self, frequency, dry_run=False):
 		# The sampling frequency.
@@ -29,28 +139,51 @@ class Generator(object):
 		# If True, do not generate a waveform. Useful for verifying the generating code.
 		self.dry_run = dry_run
 
+		# The value taken to precede the waveform.
+		self.initial_value = 0.0
+
 		# The resulting wave, with each data point on the interval [-1.0, 1.0].
-		self._wave = array([])
+		# Only the first self.stored points are in use; the rest is room to grow.
+		self._wave = empty(0, dtype=float32)
 
 		# The resulting marker channels, with each channel being a sparse list represented as a dictionary.
 		self._markers = {}
 
+		# Spans of the waveform made up of repetitions, as (start, period, count).
+		self.repeats = []
+
+	@property
+	def _last_marker_point(self):
+		try:
+			return max(pos for data in self._markers.values() for pos in data.keys())
+		except ValueError:
+			return -1
+
+	@property
+	def end(self):
+		"""
+		The length of the resulting waveform, which is extended to cover any markers.
+		"""
+
+		return max(self.length, self._last_marker_point + 1)
+
 	@property
 	def waveform(self):
 		"""
 		The waveform and marker data for the generated waveform.
 		"""
 
-		try:
-			last_marker_point = max(pos for data in self._markers.values() for pos in data.keys())
-		except ValueError:
-			last_marker_point = -1
+		# Nothing is stored in a dry run.
+		return self._with_markers(self._wave[:self.stored])
+
+	def _with_markers(self, resulting_wave):
+		"""
+		Combine the complete wave with the markers.
+		"""
 
-		extra_points = last_marker_point + 1 - len(self._wave)
+		extra_points = self._last_marker_point + 1 - len(resulting_wave)
 		if extra_points > 0:
-			resulting_wave = append(self._wave, [0.0] * extra_points)
-		else:
-			resulting_wave = self._wave
+			resulting_wave = append(resulting_wave, zeros(extra_points, dtype=float32))
 
 		marker_data = dict((num, self._get_marker(num, len(resulting_wave))) for num in self._markers)
 
@@ -62,36 +195,122 @@ class Generator(object):
 		if resulting_length > self.max_length:
 			raise ValueError('Waveform is too long; stopping at {0:n} points'.format(resulting_length))
 
+	def _reserve(self, additional):
+		"""
+		Make room for some additional points.
+
+		Growing geometrically keeps the total cost of copying linear in the length of the waveform.
+		"""
+
+		needed = self.stored + additional
+
+		if needed > len(self._wave):
+			capacity = max(needed, min(max(2 * len(self._wave), self.initial_capacity), self.max_length))
+
+			wave = empty(capacity, dtype=float32)
+			wave[:self.stored] = self._wave[:self.stored]
+			self._wave = wave
+
 	def append(self, values):
+		if not self.dry_run:
+			self._reserve(len(values))
+			self._wave[self.stored:self.stored + len(values)] = values
+
+		self.stored += len(values)
 		self.length += len(values)
 
+	def extend(self, value, count):
+		"""
+		Append the same value several times.
+		"""
+
+		if count <= 0:
+			return
+
 		if not self.dry_run:
-			self._wave = append(self._wave, values)
+			self._reserve(count)
+			self._wave[self.stored:self.stored + count] = value
 
-	def _get_marker(self, num, length):
+		self.stored += count
+		self.length += count
+
+	def repeat(self, start, count):
 		"""
-		Get the marker values for all data points in the waveform.
+		Append count more copies of everything from start onwards.
+
+		Markers are not copied.
+		"""
+
+		period = self.length - start
+
+		if count <= 0 or period <= 0:
+			return
+
+		self.check_length(period * count)
+
+		if not self.dry_run:
+			self._reserve(period * count)
+			self._wave[self.stored:self.stored + period * count] = tile(self._wave[start:self.stored], count)
+
+		self.stored += period * count
+		self.length += period * count
+		self.repeats.append((start, period, count + 1))
+
+	@property
+	def sequence(self):
+		"""
+		The waveform as a list of (start, length, repeat count) entries, each of which covers either a single
+		stretch of the waveform, or a repeated period which only has to be stored once.
 		"""
 
 		result = []
+		position = 0
 
-		def last_value():
-			try:
-				return result[-1]
-			except IndexError:
-				return False
+		for start, period, count in sorted(self.repeats, key=lambda x: (x[0], -x[1] * x[2])):
+			# Nested within an earlier span.
+			if start < position:
+				continue
 
-		for idx, value in sorted(self._markers[num].items()):
-			if idx >= len(result):
-				result.extend([last_value()] * (idx - len(result) + 1))
+			if start > position:
+				result.append((position, start - position, 1))
 
-			result[idx] = value
+			result.append((start, period, count))
+			position = start + period * count
 
-		if len(result) < length:
-			result.extend([last_value()] * (length - len(result)))
+		end = self.end
+		if end > position:
+			result.append((position, end - position, 1))
 
 		return result
 
+	@property
+	def last_value(self):
+		"""
+		The most recent point in the waveform, or the initial value if there is none.
+		"""
+
+		if self.dry_run:
+			return 0.0
+		elif self.stored == 0:
+			return self.initial_value
+
+		return self._wave[self.stored - 1]
+
+	def _get_marker(self, num, length):
+		"""
+		Get the marker values for all data points in the waveform.
+		"""
+
+		transitions = sorted(self._markers[num].items())
+
+		# Markers are off until first set.
+		if not transitions or transitions[0][0] > 0:
+			transitions.insert(0, (0, False))
+
+		positions, values = zip(*transitions)
+
+		return Marker(positions, values, length)
+
 	def _parse_time(self, value):
 		"""
 		Convert a time value to a number of samples based on the frequency.
@@ -148,23 +367,22 @@ class Generator(object):
 		delay_length = self._parse_time(value) - less_points
 
 		self.check_length(delay_length)
+		self.extend(self.last_value, delay_length)
 
-		try:
-			last_value = self._wave[-1]
-		except IndexError:
-			last_value = 0.0
+	def idle(self, value):
+		"""
+		Return to zero for the length of the delay.
+		"""
 
-		self.append([last_value] * delay_length)
+		self.set_next(0.0)
+		self.delay(value)
 
 	def square(self, amplitude, length):
 		"""
 		Generate a square pulse.
 		"""
 
-		try:
-			return_to = self._wave[-1]
-		except IndexError:
-			return_to = 0.0
+		return_to = self.last_value
 
 		self.set_next(amplitude)
 		self.delay(length, less_points=1)
@@ -180,6 +398,16 @@ class Generator(object):
 		self.check_length(len(data))
 		self.append(data)
 
+	def resampled_pulse(self, values, amplitude):
+		"""
+		Like pulse, for values which have already been interpolated to the right duration.
+		"""
+
+		data = around(amplitude * asarray(values), 5)
+
+		self.check_length(len(data))
+		self.append(data)
+
 	def marker(self, num, value):
 		"""
 		Set the value of a marker starting from the current position.
@@ -191,4 +419,133 @@ class Generator(object):
 		if num not in self._markers:
 			self._markers[num] = {}
 
-		self._markers[num][len(self._wave)] = value
+		self._markers[num][self.length] = value
+
+
+class SequenceGenerator(Generator):
+	"""
+	A generator which stores repeated parts of the waveform only once, for playing back with a sequencer.
+
+	The waveform is made up of entries, each of which is some stored points played a number of times.
+	"""
+
+	# Idle delays of at least twice this many points are stored as this many points, repeated.
+	idle_period = 1000
+
+	def __init__(self, *args, **kwargs):
+		Generator.__init__(self, *args, **kwargs)
+
+		# Completed entries, as (stored start, period, count).
+		self.entries = []
+
+		# Where the points after the last entry start.
+		self._open_stored = 0
+		self._open_position = 0
+
+	@property
+	def waveform(self):
+		"""
+		The waveform and marker data, with every entry played out in full.
+		"""
+
+		parts = [tile(self._wave[start:start + period], count) for start, period, count in self.sequence]
+
+		if parts and not self.dry_run:
+			resulting_wave = concatenate(parts)
+		else:
+			resulting_wave = empty(0, dtype=float32)
+
+		return self._with_markers(resulting_wave)
+
+	@property
+	def stored_data(self):
+		return self._wave[:self.stored]
+
+	@property
+	def sequence(self):
+		"""
+		The waveform as a list of (start, length, repeat count) entries, with each start pointing into the stored
+		data.
+		"""
+
+		result = list(self.entries)
+
+		if self.stored > self._open_stored:
+			result.append((self._open_stored, self.stored - self._open_stored, 1))
+
+		return result
+
+	def check_length(self, additional):
+		resulting_length = self.stored + additional
+
+		if resulting_length > self.max_length:
+			raise ValueError('Waveform is too long; stopping at {0:n} stored points'.format(resulting_length))
+
+	def _close(self, position):
+		"""
+		Complete an entry with the points stored since the last one, up to a position.
+		"""
+
+		period = position - self._open_position
+
+		if period > 0:
+			self.entries.append((self._open_stored, period, 1))
+
+			self._open_stored += period
+			self._open_position += period
+
+	def repeat(self, start, count):
+		"""
+		Play everything from start onwards count more times, without storing it again.
+		"""
+
+		period = self.length - start
+
+		if count <= 0 or period <= 0:
+			return
+
+		self._close(start)
+		self._close(self.length)
+
+		first = len(self.entries)
+		covered = 0
+		while covered < period:
+			first -= 1
+			covered += self.entries[first][1] * self.entries[first][2]
+
+		body = self.entries[first:]
+
+		if len(body) == 1:
+			entry_start, entry_period, entry_count = body[0]
+			self.entries[first] = (entry_start, entry_period, entry_count * (count + 1))
+		else:
+			self.entries.extend(body * count)
+
+		self.length += period * count
+		self._open_position = self.length
+
+	def idle(self, value):
+		"""
+		Return to zero for the length of the delay, storing a long delay as a short one, repeated.
+		"""
+
+		points = self._parse_time(value)
+
+		if points < 2 * self.idle_period:
+			return Generator.idle(self, value)
+
+		count, remainder = divmod(points, self.idle_period)
+
+		self.check_length(self.idle_period + remainder)
+
+		self._close(self.length)
+		self.extend(0.0, self.idle_period)
+		self._close(self.length)
+
+		entry_start, entry_period, _ = self.entries[-1]
+		self.entries[-1] = (entry_start, entry_period, count)
+
+		self.length += self.idle_period * (count - 1)
+		self._open_position = self.length
+
+		self.extend(0.0, remainder)
@@ -1,11 +1,15 @@
 import logging
 log = logging.getLogger(__name__)
 
+from collections import OrderedDict
+from copy import copy
 from functools import partial, wraps
 from itertools import izip, repeat
+from multiprocessing import Pool
 from threading import Condition, Thread
 from time import sleep, time
 
+from spacq.interface.pulse.tree import same_value
 from spacq.tool.box import flatten
 
 
@@ -51,6 +55,131 @@ class PulseConfiguration(object):
 		self.oscilloscope = oscilloscope
 
 
+def generate_waveforms(program):
+	"""
+	Generate the waveforms for a program snapshot in a worker process.
+	"""
+
+	return program.generate_waveforms()
+
+
+class WaveformPrefetch(object):
+	"""
+	Generates the waveforms for upcoming sweep points in a pool of worker processes.
+	"""
+
+	def __init__(self, program, parameters, points, depth, memory_budget, processes=None):
+		"""
+		program: The program used by the sweep.
+		parameters: (position, index, parameter, resource) for each program value set by the sweep, where the
+			sweep value at that position and index is written to the resource.
+		points: An iterator over the sweep values for each point, starting with the next one.
+		depth: How many points to generate ahead.
+		memory_budget: The number of bytes which the pending waveforms may take up.
+		"""
+
+		self.program = program
+		self.parameters = parameters
+		self.points = enumerate(points)
+		self.depth = depth
+		self.memory_budget = memory_budget
+
+		self.pool = Pool(processes)
+
+		# Point numbers, and the program values and AsyncResult for each.
+		self.pending = OrderedDict()
+		# The size in bytes of the waveforms for a single point, once known.
+		self.point_size = None
+
+		self.hits = 0
+		self.misses = 0
+
+		self.fill()
+
+	def snapshot(self, values):
+		"""
+		A copy of the program with the values for a point.
+		"""
+
+		result = self.program.clone()
+		result.resources, result.resource_labels = {}, {}
+
+		for pos, i, parameter, resource in self.parameters:
+			# Convert the value exactly as the sweep will.
+			resource = copy(resource)
+			resource.setter = partial(result.set_value, parameter)
+			resource.value = values[pos][i]
+
+		return result
+
+	def fill(self):
+		"""
+		Start generating waveforms until either the depth or the memory budget is reached.
+		"""
+
+		while len(self.pending) < self.depth:
+			if self.point_size is None:
+				# Wait for one to finish to find out how big they are.
+				if self.pending:
+					break
+			elif (len(self.pending) + 1) * self.point_size > self.memory_budget:
+				break
+
+			try:
+				item, values = self.points.next()
+			except StopIteration:
+				break
+
+			snapshot = self.snapshot(values)
+			program_values = dict((parameter, snapshot.values[parameter]) for _, _, parameter, _ in self.parameters)
+
+			self.pending[item] = (program_values, self.pool.apply_async(generate_waveforms, (snapshot,)))
+
+	def get(self, item):
+		"""
+		The waveforms for a point, or None if they were not generated ahead of time for the current values.
+		"""
+
+		# Anything earlier has been skipped.
+		for earlier in [x for x in self.pending if x < item]:
+			del self.pending[earlier]
+
+		try:
+			program_values, result = self.pending.pop(item)
+		except KeyError:
+			self.misses += 1
+			return None
+
+		try:
+			if any(not same_value(self.program.values.get(parameter), value)
+					for parameter, value in program_values.items()):
+				log.debug('Values changed for prefetched point {0}'.format(item))
+				self.misses += 1
+				return None
+
+			try:
+				waveforms = result.get()
+			except Exception as e:
+				# Generating again will raise the error where it can be handled.
+				log.debug('Failed to prefetch point {0}: {1}'.format(item, e))
+				self.misses += 1
+				return None
+
+			self.hits += 1
+
+			size = sum(waveform.data.nbytes for waveform in waveforms.values())
+			if self.point_size is None or size > self.point_size:
+				self.point_size = size
+
+			return waveforms
+		finally:
+			self.fill()
+
+	def close(self):
+		self.pool.terminate()
+		self.pool.join()
+
+
 class SweepController(object):
 	"""
 	A simple controller for a sweep of several variables.
@@ -79,11 +208,21 @@ class SweepController(object):
 
 		# The callbacks should be set before calling run(), if necessary.
 		self.data_callback, self.close_callback, self.write_callback, self.read_callback = [None] * 4
+		# If set, the oscilloscope frames of each pulse are fetched in the background and passed to this.
+		self.frames_callback = None
+		self.frame_prefetch = None
+		# If set, the waveforms for this many upcoming points are generated in the background.
+		self.waveform_prefetch_depth = 0
+		self.waveform_prefetch_memory = 256 * 1024 ** 2 # B
+		self.waveform_prefetch = None
 		self.general_exception_handler = None
 		self.resource_exception_handler = None
 
 		self.devices_configured = False
 
+		# Compiled accessors for resources, by resource.
+		self.accessors = {}
+
 		self.current_f = None
 
 		self.item = -1
@@ -155,6 +294,55 @@ class SweepController(object):
 
 		return izip(*(iter(var) for var in self.variables[pos]))
 
+	def iterate_points(self):
+		"""
+		Iterate over the values for every point of a single sweep, in the order used by next.
+		"""
+
+		iterators = [self.create_iterator(pos) for pos in xrange(len(self.variables))]
+
+		try:
+			values = [it.next() for it in iterators]
+		except StopIteration:
+			return
+
+		while True:
+			yield values[:]
+
+			pos = len(self.variables) - 1
+			while pos >= 0:
+				try:
+					values[pos] = iterators[pos].next()
+					break
+				except StopIteration:
+					iterators[pos] = self.create_iterator(pos)
+					values[pos] = iterators[pos].next()
+
+					pos -= 1
+
+			if pos < 0:
+				return
+
+	def start_waveform_prefetch(self):
+		"""
+		Start generating the waveforms for the points of the sweep in the background.
+		"""
+
+		if self.waveform_prefetch is not None:
+			self.waveform_prefetch.close()
+
+		program = self.pulse_config.program
+
+		parameters = []
+		for pos, group in enumerate(self.resources):
+			for i, (_, resource) in enumerate(group):
+				for parameter, program_resource in program.resources.items():
+					if resource is not None and resource is program_resource:
+						parameters.append((pos, i, parameter, resource))
+
+		self.waveform_prefetch = WaveformPrefetch(program, parameters, self.iterate_points(),
+				self.waveform_prefetch_depth, self.waveform_prefetch_memory)
+
 	def ramp(self, resources, values_from, values_to, steps):
 		"""
 		Slowly sweep the resources.
@@ -178,13 +366,25 @@ class SweepController(object):
 		for thr in thrs:
 			thr.join()
 
+	def resource_accessors(self, resource):
+		"""
+		The compiled getter and setter for a resource.
+		"""
+
+		try:
+			return self.accessors[resource]
+		except KeyError:
+			result = self.accessors[resource] = resource.compile()
+
+			return result
+
 	def write_resource(self, name, resource, value):
 		"""
 		Write a value to a resource and handle exceptions.
 		"""
 
 		try:
-			resource.value = value
+			self.resource_accessors(resource)[1](value)
 		except Exception as e:
 			if self.resource_exception_handler is not None:
 				self.resource_exception_handler(name, e, write=True)
@@ -196,13 +396,29 @@ class SweepController(object):
 		"""
 
 		try:
-			value = resource.value
+			value = self.resource_accessors(resource)[0]()
 		except Exception as e:
 			if self.resource_exception_handler is not None:
 				self.resource_exception_handler(name, e, write=False)
 			return
 
 		save_callback(value)
+
+	def collect_frames(self):
+		"""
+		Wait for any frames still being fetched, and handle any exception.
+		"""
+
+		prefetch, self.frame_prefetch = self.frame_prefetch, None
+
+		if prefetch is None:
+			return
+
+		try:
+			prefetch.get()
+		except Exception as e:
+			if self.resource_exception_handler is not None:
+				self.resource_exception_handler(prefetch.device.name, e, write=False)
 		
 
 	def run(self, next_f=None):
@@ -259,6 +475,9 @@ class SweepController(object):
 		self.last_values = None
 
 		self.item = -1
+
+		# The resources may have changed since the last run.
+		self.accessors = {}
 		
 		self.compute_order_periods()
 		
@@ -275,6 +494,9 @@ class SweepController(object):
 
 			self.devices_configured = True
 
+		if self.pulse_config is not None and self.waveform_prefetch_depth > 0:
+			self.start_waveform_prefetch()
+
 		return self.next
 
 	@update_current_f
@@ -409,7 +631,12 @@ class SweepController(object):
 		"""
 
 		if self.pulse_config.channels:
-			waveforms = self.pulse_config.program.generate_waveforms()
+			waveforms = None
+			if self.waveform_prefetch is not None:
+				waveforms = self.waveform_prefetch.get(self.item)
+
+			if waveforms is None:
+				waveforms = self.pulse_config.program.generate_waveforms()
 			times = self.pulse_config.program.times_average
 
 			# AWG
@@ -423,7 +650,8 @@ class SweepController(object):
 				channel = awg.channels[number]
 
 				waveform, markers = waveforms[output]
-				channel.set_waveform(waveform, markers, name=output)
+				# Unchanged waveforms are not uploaded again.
+				channel.load_waveform(waveform, markers, name=output)
 
 				channels.append(channel)
 
@@ -434,6 +662,10 @@ class SweepController(object):
 
 			# Oscilloscope
 			osc = self.pulse_config.oscilloscope
+
+			# The frames from the previous pulse must be in before the oscilloscope is used again.
+			self.collect_frames()
+
 			osc.acquiring = False
 
 			if times > 1:
@@ -475,6 +707,10 @@ class SweepController(object):
 			if acqs != times:
 				raise ValueError('Incorrect number of acquisitions made: {0}'.format(acqs))
 
+			if self.frames_callback is not None:
+				# The next stages can go ahead while the frames are transferred.
+				self.frame_prefetch = osc.prefetch_frames(callback=self.frames_callback)
+
 		return self.read
 
 	@update_current_f
@@ -607,6 +843,12 @@ class SweepController(object):
 		assert not self.done
 		self.done = True
 
+		# Don't leave the last frames behind.
+		self.collect_frames()
+
+		if self.waveform_prefetch is not None:
+			self.waveform_prefetch.close()
+
 		if self.close_callback is not None:
 			self.close_callback()
 
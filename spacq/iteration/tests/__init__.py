@@ -0,0 +1,6 @@
+from spacq.tests.tool.box import TemporaryASTCache
+
+
+fixtures = TemporaryASTCache()
+setup_package = fixtures.setup
+teardown_package = fixtures.teardown
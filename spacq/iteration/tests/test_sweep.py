@@ -285,7 +285,7 @@ class SweepControllerTest(TestCase):
 
 		eq_(exceptions, [('Meas res', e)] * 4)
 
-	def testPulseProgram(self):
+	def testPulseProgram(self, prefetch_depth=0, prepare=None):
 		"""
 		Iterate with a pulse program.
 		"""
@@ -333,10 +333,56 @@ class SweepControllerTest(TestCase):
 		vars, num_items = sort_output_variables([var1, var2])
 		ress = [(('Res 1', res), ('Res 2', p.resources[('i',)]))]
 		ctrl = sweep.SweepController(ress, vars, num_items, [], [],[],[],pulse_config)
+		ctrl.waveform_prefetch_depth = prefetch_depth
+
+		if prepare is not None:
+			prepare(ctrl, osc_cfg.device)
 
 		ctrl.run()
 
 		eq_(res_buf, [1.0, 2.0, 3.0, 4.0])
+
+		if prefetch_depth > 0:
+			eq_((ctrl.waveform_prefetch.hits, ctrl.waveform_prefetch.misses), (4, 0))
+
+	def testPulseProgramPrefetch(self):
+		"""
+		testPulseProgram, but generating the waveforms ahead of time.
+		"""
+
+		self.testPulseProgram(prefetch_depth=2)
+
+	def testPulseProgramFrames(self):
+		"""
+		testPulseProgram, but fetching the frames in the background, some of them unsuccessfully.
+		"""
+
+		frames = []
+		exceptions = []
+		e = ValueError()
+
+		def prepare(ctrl, osc):
+			calls = []
+
+			def acquire_frames(channels=None):
+				calls.append(channels)
+
+				if len(calls) % 2 == 0:
+					raise e
+
+				return len(calls), None
+			osc.acquire_frames = acquire_frames
+
+			ctrl.frames_callback = lambda times, values: frames.append(times)
+
+			def resource_exception_handler(name, e, write):
+				exceptions.append((name, e, write))
+			ctrl.resource_exception_handler = resource_exception_handler
+
+		self.testPulseProgram(prepare=prepare)
+
+		eq_(frames, [1, 3])
+		eq_(exceptions, [('MockDPO7104', e, False)] * 2)
 		
 	def testConditionsSweep(self):
 		"""
@@ -2,7 +2,7 @@ from itertools import groupby, islice
 import numpy
 import operator
 
-from spacq.interface.units import Quantity
+from spacq.interface.units import Quantity, QuantityArray
 
 
 def sort_output_variables(variables):
@@ -253,6 +253,10 @@ class OutputVariable(Variable):
 			return iter(self.config)
 
 	def __iter__(self):
+		if self.type == 'quantity' and self.units is not None:
+			# Wrap all the values at once.
+			return iter(QuantityArray(list(self.raw_iter), self.units))
+
 		return (self.with_type(x) for x in self.raw_iter)
 
 	def __len__(self):
@@ -0,0 +1,39 @@
+import logging
+log = logging.getLogger(__name__)
+
+from nose.tools import eq_
+import subprocess
+import sys
+from unittest import main, TestCase
+
+
+class ImportTest(TestCase):
+	# Modules which are slow to import, and should only be imported once they are used.
+	heavy_modules = ['scipy', 'quantities', 'pyvisa', 'requests', 'Gpib', 'telnetlib', 'spacq.devices.agilent']
+
+	script = """
+import sys
+from time import time
+
+start_time = time()
+import spacq.devices.abstract_device, spacq.devices.config, spacq.interface.resources, spacq.tool.box
+print time() - start_time
+
+print ' '.join(name for name in {0!r} if name in sys.modules)
+"""
+
+	def testImportTime(self):
+		"""
+		Benchmark importing the basic modules, without anything heavy.
+		"""
+
+		output = subprocess.check_output([sys.executable, '-c', self.script.format(self.heavy_modules)])
+		import_time, imported = output.split('\n')[:2]
+
+		log.info('Imported in {0:.3f} s.'.format(float(import_time)))
+
+		eq_(imported, '')
+
+
+if __name__ == '__main__':
+	main()
@@ -3,10 +3,14 @@ log = logging.getLogger(__name__)
 
 from nose.plugins.skip import SkipTest
 import re
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 
 from testconfig import config as tc
 
+from spacq.interface.pulse.parser import ast_cache
+
 
 class AssertHandler(logging.handlers.BufferingHandler):
 	"""
@@ -78,3 +82,20 @@ class DeviceServerTestCase(TestCase):
 				log.info('Could not connect to device at "{0}": {1}'.format(device['address'], e))
 
 		raise SkipTest('Could not connect to device.')
+
+
+class TemporaryASTCache(object):
+	"""
+	Package fixtures which keep the pulse program ASTs parsed by tests out of the user's cache.
+	"""
+
+	def __init__(self):
+		self.old_directory = None
+
+	def setup(self):
+		self.old_directory = ast_cache.directory
+		ast_cache.directory = mkdtemp()
+
+	def teardown(self):
+		rmtree(ast_cache.directory, ignore_errors=True)
+		ast_cache.directory = self.old_directory
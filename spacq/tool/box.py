@@ -1,8 +1,8 @@
 from functools import wraps
+from importlib import import_module
 from itertools import chain
 from numpy import linspace, meshgrid, sort, unique, where, nan, zeros, ones, arange, fliplr
 from numpy import min as npmin
-from scipy.interpolate import griddata, interp1d
 
 """
 Generic tools.
@@ -74,7 +74,7 @@ def triples_to_mesh(x, y, z, max_mesh=[-1,-1], has_mask=False):
 
 	target_x, target_y = meshgrid(x_space, y_space)
 
-	target_z = griddata((x, y), z, (target_x, target_y), method='cubic')
+	target_z = interpolate.griddata((x, y), z, (target_x, target_y), method='cubic')
 
 	if (has_mask):	
 		mask =	get_mask (x, y, x_space, y_space)
@@ -112,7 +112,7 @@ def triples_to_mesh_y(x, y, z, max_mesh=[-1,-1]):
 
 	for i, xi in enumerate(x_space):
 		yrange = arange(i*xperiod, (i+1)*xperiod-1).tolist()
-		fy = interp1d (y[yrange], z[yrange], kind='cubic', bounds_error=False)
+		fy = interpolate.interp1d (y[yrange], z[yrange], kind='cubic', bounds_error=False)
 		tempy = fy(y_space)
 		target_z[i] = tempy
 
@@ -143,6 +143,31 @@ class Enum(set):
 			return set.__getattribute__(self, name)
 
 
+class LazyModule(object):
+	"""
+	A module which is only imported once one of its attributes is needed.
+
+	For modules which are slow to import and only needed by some features. If the module cannot be imported,
+	ImportError is raised at that point.
+	"""
+
+	def __init__(self, name):
+		self._name = name
+		self._module = None
+
+	def __getattr__(self, name):
+		if self._module is None:
+			self._module = import_module(self._name)
+
+		return getattr(self._module, name)
+
+	def __repr__(self):
+		return '{0}({1!r})'.format(self.__class__.__name__, self._name)
+
+
+interpolate = LazyModule('scipy.interpolate')
+
+
 class PubDict(dict):
 	"""
 	A locking, publishing dictionary.